@@ -19,13 +19,19 @@ class ActionWriter(object):
     """Object that relays delayed actions from the database to the microbots."""
     log = logging.getLogger(__name__)
     DISCONNECT_EVERY_X_RETRIES = 5 # How many retries should be attempted before the connection is cycled
+    ACTION_DEADLINE = 60 # seconds; BLE-level retries of a single action stop after this time
+    PROFILE_LEAD_TIME = 5 # seconds; links are switched to the low-latency profile this long before their actions are due
+    PENDING = "pending" # Action result: the action is in progress, poll it again in a second
 
     def __init__(self, service):
         self.service = service
+        self._pairing = {} # uuid -> pairing session in progress
 
 
     def step(self, session):
         """Write pending actions from the database."""
+        self._prepareMicrobots(session)
+        self._dropStalePairingSessions(session)
         completedActions = []
         chainsToRemove = []
         commandedThisTurn = set()
@@ -33,10 +39,14 @@ class ActionWriter(object):
         delayedBy = lambda secs: datetime.datetime.utcnow() \
             + datetime.timedelta(seconds=max(secs, 1))
 
-        for action in session.query(db.Action).filter(
+        pending = session.query(db.Action).filter(
                 db.Action.prev_action == None,
                 db.Action.scheduled_at <= datetime.datetime.utcnow()
-        ).order_by(db.Action.id):
+        ).order_by(db.Action.id).all()
+        # Microbots with good links first (stable sort keeps the order of actions of each microbot)
+        pending.sort(key=lambda action: self._getLinkScore(action.microbot.uuid), reverse=True)
+
+        for action in pending:
             uuid = action.microbot.uuid
             if uuid in commandedThisTurn:
                 # This microbot already received a command this turn. Delay any
@@ -47,7 +57,9 @@ class ActionWriter(object):
             commandedThisTurn.add(uuid)
             cmd = action.action
             argsPkg = action.action_args
-            self.log.info("Executing {}".format([cmd, argsPkg]))
+            polling = self._isPairingInProgress(uuid, cmd)
+            if not polling:
+                self.log.info("Executing {}".format([cmd, argsPkg]))
             if argsPkg:
                 assert len(argsPkg) == 2, argsPkg
                 (args, kwargs) = argsPkg
@@ -55,7 +67,8 @@ class ActionWriter(object):
                 args = ()
                 kwargs = {}
 
-            action.microbot.last_error = None
+            if not polling:
+                action.microbot.last_error = None
             try:
                 actionResult = self._callAction(uuid, cmd, args, kwargs)
             except:
@@ -64,7 +77,12 @@ class ActionWriter(object):
                 self.log.error(tb)
                 action.microbot.last_error = tb
                 actionResult = 60 # Retry in 1 minute
-                
+
+            if actionResult is self.PENDING:
+                # Does not consume a retry
+                action.scheduled_at = delayedBy(1)
+                continue
+
             self.service.core.microbotActionLog.logOrderCompleted(
                 action.microbot, cmd, args, kwargs,
             )
@@ -110,6 +128,33 @@ class ActionWriter(object):
                 chainsToRemove.append(child)
             session.delete(action)
 
+    def _getLinkScore(self, uuid):
+        try:
+            mb = self.service.getMicrobot(uuid)
+        except KeyError:
+            return None
+        return mb.getLinkScore()
+
+    def _prepareMicrobots(self, session):
+        """Switches connections of the microbots with actions due soon to the low-latency profile."""
+        dueBy = datetime.datetime.utcnow() + datetime.timedelta(seconds=self.PROFILE_LEAD_TIME)
+        query = session.query(db.Microbot.uuid).join(db.Microbot.actions).filter(
+            db.Action.prev_action == None,
+            db.Action.scheduled_at <= dueBy,
+        ).distinct()
+        for (uuid, ) in query:
+            try:
+                mb = self.service.getMicrobot(uuid)
+            except KeyError:
+                continue
+            if mb.getLinkState() != "ready":
+                continue
+            try:
+                if mb.getConnectionProfile() != "interactive":
+                    mb.setConnectionProfile("interactive")
+            except Exception:
+                self.log.exception("Error switching {!r} to the interactive profile".format(uuid))
+
     def _callAction(self, uuid, cmd, args, kwargs):
         try:
             mb = self.service.getMicrobot(uuid)
@@ -119,30 +164,15 @@ class ActionWriter(object):
 
         cmd = MbActions(cmd)
 
-        if not mb.isConnected() and cmd != MbActions.pair:
-            return 60 # Retry in 1 minute if not connected
+        if cmd == MbActions.pair:
+            return self._stepPairing(uuid, mb)
 
-        if mb.isConnected() and cmd == MbActions.pair:
-            return True # Already paired
+        if not mb.isConnected():
+            return 60 # Retry in 1 minute if not connected
 
         try:
-            if cmd == MbActions.pair:
-                for colour in mb.pair():
-                    print colour
-            elif cmd == MbActions.blink:
-                mb.deviceBlink(30)
-            elif cmd == MbActions.extend:
-                mb.extend()
-            elif cmd == MbActions.retract:
-                mb.retract()
-            elif cmd == MbActions.calibrate:
-                assert len(args) == 1, (args, kwargs)
-                mb.setCalibration(args[0])
-            elif cmd == MbActions.change_button_mode:
-                assert len(args) == 1, (args, kwargs)
-                mb.setButtonMode(args[0])
-            else:
-                raise Exception([cmd, args, kwargs])
+            with self.service.scanPaused(), Lib.retry.deadline(self.ACTION_DEADLINE):
+                self._dispatchAction(mb, cmd, args, kwargs)
         except Lib.exceptions.RemoteException:
             if err.code == 0x0181:
                 # device in wrong state
@@ -154,6 +184,68 @@ class ActionWriter(object):
 
         return True  # Success
 
+    def _isPairingInProgress(self, uuid, cmd):
+        """Returns `True` if the action only polls a pairing session that is not over yet."""
+        session = self._pairing.get(uuid)
+        return cmd == MbActions.pair.value and session is not None and not session.done()
+
+    def _dropStalePairingSessions(self, session):
+        """Cancels the pairing sessions whose pair actions are gone (deleted, out of retries, microbot lost)."""
+        if not self._pairing:
+            return
+        wanted = set(uuid for (uuid, ) in session.query(db.Microbot.uuid).join(db.Microbot.actions).filter(
+            db.Action.action == MbActions.pair.value,
+        ))
+        for uuid in list(self._pairing):
+            try:
+                self.service.getMicrobot(uuid)
+            except KeyError:
+                wanted.discard(uuid)
+            if uuid not in wanted:
+                self.log.info("Pairing of {!r} is no longer requested".format(uuid))
+                self._pairing.pop(uuid).cancel()
+
+    def _stepPairing(self, uuid, mb):
+        """Starts or polls the pairing session of the microbot.
+
+        The session runs in the background, so pairing of a microbot does not hold up
+        the actions (and pairing sessions) of the other microbots.
+        """
+        session = self._pairing.get(uuid)
+        if session is None:
+            if mb.isConnected():
+                return True # Already paired
+            with self.service.scanPaused(), Lib.retry.deadline(self.ACTION_DEADLINE):
+                session = mb.startPairing(timeout=self.ACTION_DEADLINE)
+            self._pairing[uuid] = session
+
+        if not session.done():
+            self.log.debug("{!r} is showing {}".format(mb, session.getColour()))
+            return self.PENDING
+
+        del self._pairing[uuid]
+        session.result()
+        return True
+
+    def _dispatchAction(self, mb, cmd, args, kwargs):
+        if cmd == MbActions.blink:
+            mb.deviceBlink(30)
+        elif cmd == MbActions.extend:
+            mb.extend()
+        elif cmd == MbActions.retract:
+            mb.retract()
+        elif cmd == MbActions.press:
+            timings = mb.press(*args)
+            self.log.info("{!r} pressed: {}".format(mb, timings))
+        elif cmd == MbActions.calibrate:
+            assert len(args) == 1, (args, kwargs)
+            mb.setCalibration(args[0])
+        elif cmd == MbActions.change_button_mode:
+            assert len(args) == 1, (args, kwargs)
+            mb.setButtonMode(args[0])
+        else:
+            raise Exception([cmd, args, kwargs])
+
 class MicrobotReconnector(object):
     """This object reconnects disconnected microbots."""
 
@@ -169,11 +261,16 @@ class MicrobotReconnector(object):
         """Reconnect all previously disconnected microbots."""
         knownUids = set(["FAKE_UUID_PYPUSH"]) # suppresses sqlalchemy warning
         now = time.time()
+        pairedCount = missingCount = 0
 
-        for mb in self.service.getBleMicrobots():
+        # Microbots most likely to connect go first
+        for mb in Lib.microbot.rankByLinkQuality(self.service.getBleMicrobots()):
             uid = mb.getUID()
             knownUids.add(uid)
+            if mb.isPaired():
+                pairedCount += 1
             if (not mb.isConnected()) and mb.isPaired():
+                missingCount += 1
                 if self.minReconnectTime[uid] < now:
                     self.log.info("Connecting to {!r}".format(uid))
                     try:
@@ -194,6 +291,7 @@ class MicrobotReconnector(object):
             )
         ):
             uuid = dbMb.uuid
+            missingCount += 1
             if self.minReconnectTime[uuid] < now:
                 self.log.info("Reconnecting to hidden {!r}".format(uuid))
                 mb = self.service.getHiddenMicrobot(uuid)
@@ -204,6 +302,16 @@ class MicrobotReconnector(object):
                 finally:
                     self.minReconnectTime[uuid] = now + self.MB_FROM_DB_RECONNECT_DELAY
 
+        self.service.setScanDemand(self._getScanDemand(pairedCount, missingCount))
+
+    def _getScanDemand(self, pairedCount, missingCount):
+        """Scan eagerly while hunting for the missing microbots, rarely when all of them are connected."""
+        if missingCount:
+            return Lib.const.ScanDemand.high
+        elif pairedCount:
+            return Lib.const.ScanDemand.low
+        return Lib.const.ScanDemand.normal
+
 class BLEDaemon(object):
 
     log = logging.getLogger(__name__)
@@ -27,12 +27,27 @@ class PairDb(Lib.iLib.iPairingKeyStorage):
             else:
                 record = db.PairingKey(uuid=uid, pairKey=key)
                 s.add(record)
+        self.service.refreshScanWhitelist()
 
     def delete(self, uid):
         with self._session() as s:
             rec = self._queryByUid(s, uid).one_or_none()
             if rec:
                 s.delete(rec)
+        self.service.refreshScanWhitelist()
+
+    def getAllUids(self):
+        with self._session() as s:
+            return [uid for (uid, ) in s.query(db.PairingKey.uuid)]
+
+    def getFirmwareVersion(self, uid):
+        with self._session() as s:
+            rec = s.query(db.Microbot.firmware_version).filter_by(uuid=uid).one_or_none()
+        return rec[0] if rec else None
+
+    def setFirmwareVersion(self, uid, version):
+        with self._session() as s:
+            s.query(db.Microbot).filter_by(uuid=uid).update({"firmware_version": version})
 
     def _queryByUid(self, session, uid):
         return session.query(db.PairingKey).filter_by(uuid=uid)
@@ -117,6 +117,7 @@ class MicrobotBluetoothService(object):
                     self.log.error(tb)
                     rec.last_error = tb
 
+            mGet(mb.prefetchState) # one radio exchange for all of the getters below
             rec.retracted = mGet(mb.isRetracted)
             rec.battery = mGet(mb.getBatteryLevel)
             rec.calibration = mGet(mb.getCalibration)
@@ -127,6 +128,14 @@ class MicrobotBluetoothService(object):
 
             self._dbIds[mbUid] = rec.id
 
+    def getLinkQuality(self, uid):
+        """Returns dict of smoothed RSSI and advert rate of the microbot (values are `None` if unknown)."""
+        try:
+            mb = self.getMicrobot(uid)
+        except KeyError:
+            return {"rssi": None, "advert_rate": None}
+        return {"rssi": mb.getRssi(), "advert_rate": mb.getAdvertRate()}
+
     def getDbId(self, uid):
         try:
             rv = self._dbIds[uid]
@@ -150,6 +159,21 @@ class MicrobotBluetoothService(object):
     def getBleMicrobots(self):
         return tuple(self._microbots.itervalues())
 
+    def scanPaused(self):
+        """Context that suspends BLE scanning."""
+        return self._hub.scanPaused()
+
+    def setScanDemand(self, demand):
+        self._hub.setScanDemand(demand)
+
+    def getScanStats(self):
+        return self._hub.getScanStats()
+
+    def refreshScanWhitelist(self):
+        """Called when the set of the paired microbots changes."""
+        if self._hub is not None:
+            self._hub.refreshScanWhitelist()
+
     def syncToBt(self):
         """Sync db -> BLE state."""
         self._daemon.wakeup()
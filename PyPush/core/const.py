@@ -16,5 +16,6 @@ class MbActions(enum.Enum):
     blink = "blink"
     extend = "extend"
     retract = "retract"
+    press = "press"
     calibrate = "calibrate"
     change_button_mode = "change_button_mode"
@@ -1,9 +1,11 @@
 """Top-level API for the PyPush library."""
 
 from . import (
+    const,
     exceptions,
     iLib,
     async,
+    retry,
 )
 
 from . import (
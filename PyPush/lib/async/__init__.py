@@ -4,3 +4,5 @@ Generic callbacks, callback hubs and such.
 """
 
 from .subscribe import SubscribeHub, MultiHandle, SubscribeHubDict
+from .dispatcher import Dispatcher, getDispatcher
+from .future import Future, SerialExecutor
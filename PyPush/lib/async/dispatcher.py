@@ -0,0 +1,123 @@
+"""Notification dispatcher that delivers events on a fixed pool of worker threads."""
+
+import collections
+import logging
+import threading
+
+from .subscribe import iHandle
+
+
+class DispatchSource(iHandle):
+    """A single source of events (e.g. one notifying characteristic) registered with the dispatcher.
+
+    Pending events are kept in a bounded queue. When the queue is full, the oldest pending
+    event is superseded by the new one.
+    """
+
+    def __init__(self, dispatcher, callback, maxPending):
+        self._dispatcher = dispatcher
+        self.callback = callback
+        self.pending = collections.deque(maxlen=maxPending)
+        self.active = True
+        self.scheduled = False
+
+    def put(self, *args):
+        """Schedule `callback(*args)` call."""
+        self._dispatcher._put(self, args)
+
+    def cancel(self):
+        """Stop delivering events of this source. Pending events are dropped."""
+        self._dispatcher._cancel(self)
+
+    def __repr__(self):
+        return "<{} {!r}>".format(self.__class__.__name__, self.callback)
+
+
+class Dispatcher(object):
+    """Delivers events of many sources using `workers` threads.
+
+    Events of a single source are delivered in order and never concurrently.
+    """
+
+    log = logging.getLogger(__name__)
+
+    def __init__(self, workers=4, maxPending=4):
+        self.maxPending = maxPending
+        self._workerCount = workers
+        self._cond = threading.Condition(threading.Lock())
+        self._ready = collections.deque()  # sources with pending events
+        self._threads = []
+
+    def register(self, callback, maxPending=None):
+        """Returns new <DispatchSource> that delivers its events to `callback`."""
+        assert callable(callback), callback
+        if maxPending is None:
+            maxPending = self.maxPending
+        self._startWorkers()
+        return DispatchSource(self, callback, maxPending)
+
+    def getThreadCount(self):
+        return len(self._threads)
+
+    def _startWorkers(self):
+        with self._cond:
+            while len(self._threads) < self._workerCount:
+                thread = threading.Thread(
+                    name="{}.worker{}".format(__name__, len(self._threads)),
+                    target=self._workerTarget,
+                )
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def _put(self, source, args):
+        with self._cond:
+            if not source.active:
+                return
+            source.pending.append(args)
+            if not source.scheduled:
+                source.scheduled = True
+                self._ready.append(source)
+                self._cond.notify()
+
+    def _cancel(self, source):
+        with self._cond:
+            source.active = False
+            source.pending.clear()
+
+    def _workerTarget(self):
+        while True:
+            with self._cond:
+                while not self._ready:
+                    self._cond.wait()
+                source = self._ready.popleft()
+                if not source.pending:
+                    source.scheduled = False
+                    continue
+                args = source.pending.popleft()
+
+            try:
+                source.callback(*args)
+            except Exception:
+                self.log.exception("Dispatch target exception.")
+
+            with self._cond:
+                if source.pending:
+                    # Go to the back of the queue to be fair to the other sources.
+                    self._ready.append(source)
+                    self._cond.notify()
+                else:
+                    source.scheduled = False
+
+
+_defaultDispatcher = None
+_defaultMutex = threading.Lock()
+
+
+def getDispatcher():
+    """Returns process-wide <Dispatcher>."""
+    global _defaultDispatcher
+    with _defaultMutex:
+        if _defaultDispatcher is None:
+            _defaultDispatcher = Dispatcher()
+        return _defaultDispatcher
@@ -0,0 +1,184 @@
+"""Futures & per-object serial executors."""
+
+import collections
+import logging
+import sys
+import threading
+import time
+
+from .. import exceptions, retry
+
+
+class Future(object):
+    """Result of an asynchronous call.
+
+    Waiting for the result raises <exceptions.Timeout> on timeout
+    and <exceptions.Cancelled> if the call was cancelled.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    CANCELLED = "cancelled"
+    FINISHED = "finished"
+
+    log = logging.getLogger(__name__)
+
+    def __init__(self):
+        self._state = self.PENDING
+        self._result = None
+        self._excInfo = None
+        self._callbacks = []
+        self._cond = threading.Condition(threading.Lock())
+
+    def cancel(self):
+        """Cancels the call if it has not started yet. Returns `True` if the call is cancelled."""
+        with self._cond:
+            if self._state == self.PENDING:
+                self._state = self.CANCELLED
+                self._cond.notify_all()
+            elif self._state != self.CANCELLED:
+                return False
+        self._fireCallbacks()
+        return True
+
+    def cancelled(self):
+        return self._state == self.CANCELLED
+
+    def running(self):
+        return self._state == self.RUNNING
+
+    def done(self):
+        return self._state in (self.CANCELLED, self.FINISHED)
+
+    def result(self, timeout=None):
+        """Returns result of the call (re-raises exception of the call)."""
+        self._wait(timeout)
+        if self._excInfo:
+            (excType, excValue, excTb) = self._excInfo
+            raise excType, excValue, excTb
+        return self._result
+
+    def exception(self, timeout=None):
+        """Returns exception raised by the call (`None` if the call succeeded)."""
+        self._wait(timeout)
+        if self._excInfo:
+            return self._excInfo[1]
+        return None
+
+    def addDoneCallback(self, callback):
+        """Calls `callback(future)` when the future is done (immediately if it is done already)."""
+        with self._cond:
+            if not self.done():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def chain(self, other):
+        """Completes this future with the outcome of the future `other` (once `other` is done)."""
+        def _copy(other):
+            if other.cancelled():
+                self.cancel()
+            elif self._start():
+                self._finish(other._result, other._excInfo)
+        other.addDoneCallback(_copy)
+
+    def _wait(self, timeout):
+        endTime = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while not self.done():
+                if endTime is None:
+                    self._cond.wait()
+                else:
+                    waitTime = endTime - time.time()
+                    if waitTime <= 0:
+                        raise exceptions.Timeout("The call did not complete in {} seconds.".format(timeout))
+                    self._cond.wait(waitTime)
+            if self._state == self.CANCELLED:
+                raise exceptions.Cancelled("The call was cancelled.")
+
+    def _start(self):
+        """Returns `False` if the call has been cancelled."""
+        with self._cond:
+            if self._state != self.PENDING:
+                return False
+            self._state = self.RUNNING
+            return True
+
+    def _setResult(self, result):
+        self._finish(result, None)
+
+    def _setExcInfo(self, excInfo):
+        self._finish(None, excInfo)
+
+    def _finish(self, result, excInfo):
+        with self._cond:
+            self._result = result
+            self._excInfo = excInfo
+            self._state = self.FINISHED
+            self._cond.notify_all()
+        self._fireCallbacks()
+
+    def _fireCallbacks(self):
+        with self._cond:
+            callbacks = self._callbacks
+            self._callbacks = []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                self.log.exception("Future callback exception.")
+
+    def __repr__(self):
+        return "<{} {}>".format(self.__class__.__name__, self._state)
+
+
+class SerialExecutor(object):
+    """Executes the submitted calls one by one, in the submission order.
+
+    The worker thread is started on demand and exits when there is nothing to do.
+    The `retry.deadline` active at the submission time applies to the call
+    (the call is not started at all if the deadline passes while it is queued).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._queue = collections.deque()
+        self._cond = threading.Condition(threading.Lock())
+        self._running = False
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedules `fn(*args, **kwargs)` call. Returns <Future> of the call."""
+        future = Future()
+        deadline = retry.getDeadline()
+        with self._cond:
+            self._queue.append((future, deadline, fn, args, kwargs))
+            if not self._running:
+                self._running = True
+                thread = threading.Thread(name="{}.{}".format(__name__, self.name), target=self._workerTarget)
+                thread.daemon = True
+                thread.start()
+        return future
+
+    def getQueueLength(self):
+        return len(self._queue)
+
+    def _workerTarget(self):
+        while True:
+            with self._cond:
+                if not self._queue:
+                    self._running = False
+                    return
+                (future, deadline, fn, args, kwargs) = self._queue.popleft()
+
+            if not future._start():
+                continue # cancelled
+
+            try:
+                if deadline is not None and time.time() >= deadline:
+                    raise exceptions.Timeout("Deadline passed before the call started.")
+                with retry.withDeadline(deadline):
+                    rv = fn(*args, **kwargs)
+            except Exception:
+                future._setExcInfo(sys.exc_info())
+            else:
+                future._setResult(rv)
@@ -1,23 +1,38 @@
 """Top-level API object."""
+import threading
+import functools
+
 from bgapi.module import BlueGigaClient
 
-from .. import iApi
+from .. import iApi, exceptions, scanScheduler
+from ... import stats
 from . import (
     scanner,
     mbRegistry,
     connection,
     byteOrder,
     libLock,
+    gattCache,
 )
 
 
 class API(iApi.iApi):
     """BlueGiga API."""
 
+    # Number of concurrent connections the bundled BLED112 firmware is configured for.
+    DEFAULT_MAX_CONNECTIONS = 8
+
     def __init__(self, config):
         """Config must be a dictionary with "device" key (specifying tty of the bluegiga token)"""
         self._microbotDb = mbRegistry.MicrobotRegistry(maxAge=60 * 60)
         self._config = config
+        self._maxConnections = config.get("max_connections", self.DEFAULT_MAX_CONNECTIONS)
+        self._connections = []
+        self._connMutex = threading.RLock()
+        self._gattCache = gattCache.GattCache(config.get("gatt_cache"))
+        # Latency statistics of all connections (profile name -> <stats.LatencyStats>)
+        self._profileStats = dict((name, stats.LatencyStats()) for name in connection.PROFILES)
+        self._scanScheduler = scanScheduler.ScanScheduler(window=0.5)
         self._running = False
 
     def start(self):
@@ -28,29 +43,66 @@ class API(iApi.iApi):
             baud=config.get("baud", 115200),
             timeout=config.get("timeout", 0.1)
         )
+        _ble.ble_evt_attclient_read_multiple_response = functools.partial(
+            connection.onReadMultipleResponse, _ble)
         self._ble = libLock.LockableBle.RootLock(_ble)
         self._ble.reset_ble_state()
         # set maximum allowed txpower for BLED112 (https://www.silabs.com/Support%20Documents/RegisteredDocs/Bluetooth_Smart_Software-BLE-1.3-API-RM.pdf page 145)
         _ble._api.ble_cmd_hardware_set_txpower(15)
         self._scanner = scanner.Scanner(
-            self._ble, self._microbotDb.onScanEvent)
+            self._ble, self._microbotDb.onScanEvent, self._scanScheduler)
         self._running = True
 
     def onScan(self, callback):
         return self._microbotDb.onScanCallback(callback)
 
+    def onLost(self, callback):
+        return self._microbotDb.onLostCallback(callback)
+
+    def scanPaused(self):
+        return self._scanScheduler.paused()
+
+    def setScanDemand(self, demand):
+        self._scanScheduler.setDemand(demand)
+
+    def getScanStats(self):
+        return self._scanScheduler.getStats()
+
+    def setScanWhitelist(self, uids):
+        if uids is not None:
+            uids = [self._uidToBinary(uid) for uid in uids]
+        self._scanner.whitelist.set(uids)
+
     def createMicrobotFromUUID(self, uuid):
         assert self._running
-        bParts = [int(el, 16) for el in uuid.split(":")]
-        nUuid = byteOrder.hBytesToNStr(bParts)
-        return self._microbotDb.createMicrobotFromUUID(nUuid)
+        return self._microbotDb.createMicrobotFromUUID(self._uidToBinary(uuid))
+
+    def _uidToBinary(self, uid):
+        """Converts human-readable microbot UID to the binary address."""
+        bParts = [int(el, 16) for el in uid.split(":")]
+        return byteOrder.hBytesToNStr(bParts)
 
     def connect(self, microbot):
         """Connect to the microbot."""
-        conn = connection.BgConnection(microbot, self._ble)
-        conn._open() # pylint: disable=W0212
+        with self._connMutex:
+            self._connections = [el for el in self._connections if el.isActive()]
+            if len(self._connections) >= self._maxConnections:
+                raise exceptions.BleException(
+                    "All {} connections of the BLE dongle are in use.".format(self._maxConnections))
+            conn = connection.BgConnection(
+                microbot, self._ble, self._gattCache, self._profileStats)
+            conn._open() # pylint: disable=W0212
+            self._connections.append(conn)
         return conn
 
+    def getCommandGaps(self):
+        """Returns dict of microbot UID -> adaptive gap between two commands (in seconds)."""
+        return self._ble.getPacingGaps()
+
+    def getProfileStats(self):
+        """Returns dict of connection profile name -> latency summary of all connections."""
+        return dict((name, stat.getSummary()) for (name, stat) in self._profileStats.iteritems())
+
     _uuidCache = None
 
     def getUID(self):
@@ -3,26 +3,29 @@
 import logging
 import time
 import collections
-import threading
 import contextlib
 import functools
 import datetime
-import Queue
+import struct
+import threading
 
 from bgapi.module import (
     BLEConnection, GATTService, GATTCharacteristic,
     BlueGigaModuleException, RemoteError, Timeout,
+    READ_ATTRIBUTE,
 )
 
 
 from PyPush.lib import async as async
+from PyPush.lib import stats
 
+from ... import const
 from .. import (
     iApi,
     exceptions,
 )
 
-from . import byteOrder
+from . import byteOrder, gattCache, libLock
 
 FakeConnectionHandle = collections.namedtuple("FakeConnectionHandle",
     ["sender", "address_type"]
@@ -31,32 +34,86 @@ FakeConnectionHandle = collections.namedtuple("FakeConnectionHandle",
 BgCharacteristic = collections.namedtuple(
     "BgCharacteristic", ["uuid", "gatt", "human_uuid"])
 
+# ATT error reported by the device when an attribute handle does not exist.
+INVALID_HANDLE_ERR = 0x0401
+
+# Remote error reported by the device that is not ready to accept the command.
+WRONG_STATE_ERR = 0x0181
+
+# ATT Read Multiple response has to fit into the default ATT MTU (23 bytes) less the opcode.
+MAX_READ_MULTIPLE_SIZE = 22
+
+# Value sizes (bytes) of the fixed-length characteristics, by (service id, characteristic id).
+#   Only these characteristics are read with ATT Read Multiple.
+FIXED_SIZE_VALUES = {
+    (const.MicrobotServiceId, "2A19"): 1, # battery level
+    (const.MicrobotServiceId, "2A21"): 3, # firmware version
+    (const.PushServiceId, const.DeviceCalibration): 1,
+    (const.PushServiceId, "2A53"): 1, # button mode
+}
+
+# Connection parameters of a link.
+#   Intervals are in 1.25ms units, supervision timeout is in 10ms units.
+#   `minCallInterval` is the minimal delay between two procedures (seconds).
+#   The connection falls back to the default profile after `idleTimeout` seconds without activity.
+ConnectionProfile = collections.namedtuple("ConnectionProfile", [
+    "name", "intervalMin", "intervalMax", "latency", "timeout", "minCallInterval", "idleTimeout"])
+
+PROFILES = dict((profile.name, profile) for profile in (
+    # User is waiting for the response: 7.5..15ms interval.
+    ConnectionProfile("interactive", 6, 12, 0, 200, 0, 30),
+    # Keeps the link alive waking the radio as rarely as possible: 250..500ms interval.
+    ConnectionProfile("idle", 200, 400, 4, 600, 5, None),
+))
+DEFAULT_PROFILE = "idle"
+
 RetryLog = logging.getLogger("retry_call_if_fails")
-def retry_call_if_fails(connection, func, attempts, fail_delay=3,
-                        delayed_unlock=0.5, retry_on_remote_err=(), retry_on_timeout=False):
-    attempts_left = attempts
-    while True:
-        attempts_left -= 1
+def retry_call_if_fails(connection, func, attempts, delayed_unlock=None,
+                        retry_on_remote_err=(), retry_on_timeout=False,
+                        policy=libLock.RETRY_POLICY):
+    """Calls `func` on the `connection`, retrying on the errors listed.
 
-        try:
-            with connection.delayedUnlock(delayed_unlock):
+    The connection is paced by its adaptive command gap unless `delayed_unlock` is given.
+    Retries are spaced and limited by the `policy` and the retry budgets of the connection.
+    """
+    pacing = connection.getPacing()
+
+    def _attempt():
+        with connection.delayedUnlock(delayed_unlock):
+            try:
                 rv = func()
-        except RemoteError as err:
-            # Device is in the wrong state.
-            if err.code in retry_on_remote_err and attempts_left > 0:
-                pass
-            else:
+            except RemoteError as err:
+                if err.code == WRONG_STATE_ERR:
+                    pacing.onWrongState()
+                    RetryLog.info("Device not ready, command gap increased to {:.3f}s".format(
+                        pacing.gap))
                 raise
-        except Timeout:
-            if retry_on_timeout and attempts_left > 0:
-                pass
             else:
-                raise
-        else:
-            return rv
+                pacing.onSuccess()
+                return rv
 
-        # Exception happened
-        time.sleep(fail_delay)
+    def _shouldRetry(err):
+        if isinstance(err, RemoteError):
+            return err.code in retry_on_remote_err
+        elif isinstance(err, Timeout):
+            return retry_on_timeout
+        return False
+
+    return policy.call(_attempt, _shouldRetry, attempts, connection.getRetryBudgets())
+
+
+def onReadMultipleResponse(client, connection, handles):
+    """bgapi client event handler for the ATT Read Multiple response.
+
+    (The stock bgapi client ignores the event.)
+    `handles` is the concatenation of values of all attributes read.
+    """
+    try:
+        conn = client.connections[connection]
+    except KeyError:
+        return
+    conn.read_multiple_value = handles
+    conn.procedure_complete(READ_ATTRIBUTE)
 
 
 class _ConnNotify(async.SubscribeHub):
@@ -69,6 +126,7 @@ class _ConnNotify(async.SubscribeHub):
         super(_ConnNotify, self).__init__()
         self.characteristic = characteristic
         self.hub = hub
+        self.dispatch = hub.dispatcher.register(self.fireSubscribers)
 
     def onSubscribe(self, handle):
         super(_ConnNotify, self).onSubscribe(handle)
@@ -78,6 +136,10 @@ class _ConnNotify(async.SubscribeHub):
         super(_ConnNotify, self).onUnsubscribe(handle)
         self._manage()
 
+    def close(self):
+        """Stop delivering notifications."""
+        self.dispatch.cancel()
+
     def _manage(self):
         """Manage 'subscribed' status."""
         with self._mutex:
@@ -93,7 +155,7 @@ class _ConnNotify(async.SubscribeHub):
                         self.characteristic.gatt, indicate=False,
                         notify=True, timeout=15
                     ),
-                    attempts=5, retry_on_remote_err=(0x0181, ), retry_on_timeout=True
+                    attempts=5, retry_on_remote_err=(WRONG_STATE_ERR, ), retry_on_timeout=True
                 )
 
                 # Subscribed for notifications
@@ -105,38 +167,27 @@ class _ConnNotify(async.SubscribeHub):
         return conn._bleConn
 
     def _onBgapiNotify(self, data):
-        self.hub.bgapiQueue.put(
-            (self, data)
-        )
+        self.dispatch.put(data)
         self.hub.conn._updateLastCallTime()
 
 
 class _ConnNotifyHub(async.SubscribeHubDict):
 
-    def __init__(self, conn):
+    def __init__(self, conn, dispatcher):
         super(_ConnNotifyHub, self).__init__()
         self.conn = conn
-        self.bgapiQueue = Queue.Queue()
-        self.apiThread = threading.Thread(
-            name="{}.thread".format(__name__),
-            target=self._hubThreadTarget,
-            args=(self.bgapiQueue,) ,
-        )
-        self.apiThread.daemon = True
-        self.apiThread.start()
+        self.dispatcher = dispatcher
 
     def _makeSubscriberHub(self, (serviceId, characteristicId)):
         char = self.conn._findCharacteristic(serviceId, characteristicId)
         return _ConnNotify(self, char)
 
-    def _hubThreadTarget(self, bgapiQueue):
-        log = logging.getLogger("_ConnNotifyHub.thread")
-        while True:
-            (handler, data) = bgapiQueue.get()
-            try:
-                handler.fireSubscribers(data)
-            except Exception:
-                log.exception("Hub target exception.")
+    def close(self):
+        """Unregister all characteristic hubs from the dispatcher."""
+        with self.mutex:
+            for hub in self.subscriberHubs.itervalues():
+                hub.close()
+            self.subscriberHubs.clear()
 
 def ActiveApi(func):
     """Decorator that ensures that the connection is active before the payload function is executed.
@@ -149,16 +200,21 @@ def ActiveApi(func):
             raise exceptions.NotConnected("The connection is no longer active")
 
         self._updateLastCallTime()
+        start = time.time()
         try:
-            return func(self, *args, **kwargs)
+            rv = func(self, *args, **kwargs)
         except RemoteError as err:
             self._log.exception("Remote BLE exception")
+            if err.code == INVALID_HANDLE_ERR:
+                self._onInvalidHandle()
             raise exceptions.RemoteException(err.code, err.message)
         except Timeout as err:
             self._log.exception("Remote BLE timeout")
             raise exceptions.Timeout(str(err))
         else:
             self._updateLastCallTime()
+            self._profileStats[self._profile.name].add(self._lastCallTime - start)
+            return rv
 
     return _wrapper_
 
@@ -166,15 +222,31 @@ def ActiveApi(func):
 class BgConnection(iApi.iConnection):
 
     _log = logging.getLogger(__name__)
-    _mb = _ble = _bleConn = None
+    _mb = _ble = _bleConn = _gattCache = None
 
-    def __init__(self, mb, ble):
+    # Characteristic that identifies the attribute table layout of the device.
+    VERSION_CHARACTERISTIC = (const.MicrobotServiceId, "2A21")
+
+    def __init__(self, mb, ble, gattCache=None, profileStats=None):
         self._mb = mb
         self._ble = ble
+        self._gattCache = gattCache
+        # profile name -> <stats.LatencyStats> (can be shared by several connections)
+        if profileStats is None:
+            profileStats = dict((name, stats.LatencyStats()) for name in PROFILES)
+        self._profileStats = profileStats
+        self._profile = PROFILES[DEFAULT_PROFILE]
+        self._profileRequestTime = 0
+        self._profileMutex = threading.RLock()
+        self._idleTimer = None
         self._bleConn = None
         # service UUID -> [characteristic UUID]
         self._serviceToCharacteristics = {}
-        self._notifyHub = _ConnNotifyHub(self)
+        # human service id -> service
+        self._serviceIndex = {}
+        # (human service id, human characteristic id) -> <BgCharacteristic>
+        self._charIndex = {}
+        self._notifyHub = _ConnNotifyHub(self, async.getDispatcher())
         self._lastCallTime = 0
 
     def getMicrobot(self):
@@ -189,6 +261,9 @@ class BgConnection(iApi.iConnection):
                 self._ble.disconnect(self._bleConn.handle)
                 self._log.info("BgConnection {} closed.".format(self))
         self._bleConn = None
+        self._notifyHub.close()
+        self._clearIndex()
+        self._cancelIdleTimer()
 
     @ActiveApi
     def readAllCharacteristics(self):
@@ -226,7 +301,7 @@ class BgConnection(iApi.iConnection):
         return retry_call_if_fails(
             self._bleConn,
             lambda: self._bleConn.write_by_uuid(char.uuid, data, timeout=15),
-            attempts=5, retry_on_remote_err=(0x0181, ),
+            attempts=5, retry_on_remote_err=(WRONG_STATE_ERR, ),
             retry_on_timeout=True
         )
 
@@ -239,22 +314,114 @@ class BgConnection(iApi.iConnection):
         retry_call_if_fails(
             self._bleConn,
             lambda: self._bleConn.read_by_handle(char.gatt.handle + 1, timeout=timeout),
-            attempts=5, retry_on_remote_err=(0x0181, ),
+            attempts=5, retry_on_remote_err=(WRONG_STATE_ERR, ),
             retry_on_timeout=True
         )
         return char.gatt.value
 
+    @ActiveApi
+    def readMany(self, keys, timeout=15):
+        chars = []
+        for (serviceId, characteristicId) in keys:
+            char = self._findCharacteristic(serviceId, characteristicId)
+            if not char.gatt.is_readable():
+                raise exceptions.NotSupported("Read is not supported ({}, {}).".format(
+                    serviceId, characteristicId))
+            chars.append(char)
+
+        # ATT Read Multiple response carries no value boundaries, so it is usable only for
+        #   the characteristics whose values are known to be fixed-length.
+        sizes = [FIXED_SIZE_VALUES.get(key) for key in keys]
+        if len(chars) > 1 and None not in sizes and 0 < sum(sizes) <= MAX_READ_MULTIPLE_SIZE:
+            readFn = lambda: self._readMultiple(chars, sizes, timeout)
+        else:
+            readFn = lambda: self._readEach(chars, timeout)
+
+        return retry_call_if_fails(
+            self._bleConn, readFn,
+            attempts=5, retry_on_remote_err=(WRONG_STATE_ERR, ),
+            retry_on_timeout=True
+        )
+
+    def _readEach(self, chars, timeout):
+        """Reads `chars` back-to-back within a single connection transaction."""
+        for char in chars:
+            self._bleConn.read_by_handle(char.gatt.handle + 1, timeout=timeout)
+        return [char.gatt.value for char in chars]
+
+    def _readMultiple(self, chars, sizes, timeout):
+        """Reads `chars` with a single ATT Read Multiple request."""
+        conn = self._bleConn
+        # The response is stored by `onReadMultipleResponse` on the unwrapped connection
+        rawConn = conn.getWrapped()
+        handles = [char.gatt.handle + 1 for char in chars]
+        rawConn.read_multiple_value = None
+        with conn.procedure_call(READ_ATTRIBUTE, timeout):
+            rawConn._api.ble_cmd_attclient_read_multiple(
+                rawConn.handle, struct.pack("<" + "H" * len(handles), *handles))
+        data = rawConn.read_multiple_value
+
+        if data is None or len(data) != sum(sizes):
+            # Unexpected response, it can not be split.
+            return self._readEach(chars, timeout)
+
+        rv = []
+        offset = 0
+        for (char, size) in zip(chars, sizes):
+            char.gatt.value = data[offset:offset + size]
+            rv.append(char.gatt.value)
+            offset += size
+        return rv
+
     @contextlib.contextmanager
     def transaction(self):
-        with self._ble.transaction():
+        """Locks this connection (or the whole radio while the connection is being established)."""
+        bleConn = self._bleConn
+        if bleConn is None:
+            ctx = self._ble.transaction()
+        else:
+            ctx = bleConn.transaction()
+        with ctx:
             yield
 
     def getLastActiveTime(self):
         return datetime.datetime.fromtimestamp(self._lastCallTime)
 
+    def setProfile(self, name):
+        """Switches the connection to the connection profile `name` (one of `PROFILES`).
+
+        Requesting the current profile again postpones its idle timeout.
+        """
+        profile = PROFILES[name]
+        if not self.isActive():
+            raise exceptions.NotConnected("The connection is no longer active")
+        with self.transaction():
+            with self._profileMutex:
+                if profile != self._profile:
+                    self._applyProfile(self._bleConn, profile)
+                    self._log.info("BgConnection {} switched to the {!r} profile.".format(
+                        self, name))
+                self._profile = profile
+                self._profileRequestTime = time.time()
+                self._cancelIdleTimer()
+                if profile.idleTimeout is not None:
+                    self._startIdleTimer(profile.idleTimeout)
+
+    def getProfile(self):
+        return self._profile.name
+
+    def getProfileStats(self):
+        """Returns dict of profile name -> latency summary of the GATT procedures."""
+        return dict((name, stat.getSummary()) for (name, stat) in self._profileStats.iteritems())
+
+    def getCommandGap(self):
+        """Returns the current adaptive gap between two commands sent to the device (seconds)."""
+        return self._bleConn.getPacing().gap
+
     def _open(self):
         """Initiate the connection."""
         assert not self.isActive()
+        self._clearIndex()
         with self.transaction():
             conn = self._ble.connect(
                 FakeConnectionHandle(
@@ -263,24 +430,18 @@ class BgConnection(iApi.iConnection):
                 ),
                 timeout=120
             )
-            conn = self._ble.getChildLock(conn)
+            conn = self._ble.getChildLock(conn, pacingKey=self._mb.getUID())
             self._bleConn = self._initBleConnection(conn)
         self._log.info("BgConnection {} opened.".format(self))
 
     def _findCharacteristic(self, serviceUUID, charUUID):
-        srv_uuid = self._findService(serviceUUID).uuid
-        conn = self._bleConn
-        for char in self._getCharacteristics(conn, srv_uuid):
-            if char.human_uuid == charUUID:
-                return char
-        # else
-        raise KeyError([serviceUUID, charUUID])
+        try:
+            return self._charIndex[(serviceUUID, charUUID)]
+        except KeyError:
+            raise KeyError([serviceUUID, charUUID])
 
     def _findService(self, uuid):
-        for el in self._bleConn.get_services():
-            if self._humanServiceName(el) == uuid:
-                return el
-        raise KeyError(uuid)
+        return self._serviceIndex[uuid]
 
     def _humanServiceName(self, service):
         return byteOrder.nStrToHHex(service.uuid)
@@ -288,32 +449,142 @@ class BgConnection(iApi.iConnection):
     def _initBleConnection(self, conn):
         """This method initialises internal state of the BLE connection by populating its internal dictionaries."""
         with conn.transaction():
-            conn.set_min_connection_interval(5) # min 5s delay for the conn interval
-            conn.read_by_group_type(
-                    GATTService.PRIMARY_SERVICE_UUID, timeout=120)
-                    ## Read all service data at once
-            conn.find_all_information(timeout=120)
-
-            # Read characteristics
-            for serviceType in (
-                GATTCharacteristic.CHARACTERISTIC_UUID,
-                GATTCharacteristic.CLIENT_CHARACTERISTIC_CONFIG,
-            ):
-                conn.read_all_characteristics_by_type(serviceType, timeout=120)
-
-            # Assign characteristics to the srvices
-            services = conn.get_services()
-            characteristics = conn.get_characteristics()
-            for service in services:
-                service_chars = [ch for ch in characteristics
-                    if service.start_handle <= ch.handle <= service.end_handle]
-                self._serviceToCharacteristics[service.uuid] = [
-                    BgCharacteristic(ch.uuid, ch, byteOrder.nStrToHHex(ch.uuid))
-                    for ch in service_chars
-                ]
+            # Discovery runs with the parameters negotiated on connect (fast),
+            #   the link is slowed down afterwards.
+            if not self._restoreCachedAttributes(conn):
+                self._discoverAttributes(conn)
+                self._mapCharacteristics(conn)
+                self._cacheAttributes(conn)
+            self._profile = PROFILES[DEFAULT_PROFILE]
+            self._applyProfile(conn, self._profile)
 
         return conn
 
+    def _applyProfile(self, conn, profile):
+        """Requests connection parameter update for the `profile`."""
+        conn._api.ble_cmd_connection_update(
+            conn.handle, profile.intervalMin, profile.intervalMax, profile.latency, profile.timeout)
+        conn.set_min_connection_interval(profile.minCallInterval)
+
+    def _startIdleTimer(self, delay):
+        self._idleTimer = threading.Timer(delay, self._onIdleTimer)
+        self._idleTimer.daemon = True
+        self._idleTimer.start()
+
+    def _cancelIdleTimer(self):
+        with self._profileMutex:
+            if self._idleTimer is not None:
+                self._idleTimer.cancel()
+                self._idleTimer = None
+
+    def _onIdleTimer(self):
+        with self._profileMutex:
+            self._idleTimer = None
+            timeout = self._profile.idleTimeout
+            if timeout is None or not self.isActive():
+                return
+            idleFor = time.time() - max(self._lastCallTime, self._profileRequestTime)
+            if idleFor < timeout:
+                self._startIdleTimer(timeout - idleFor)
+                return
+        try:
+            self.setProfile(DEFAULT_PROFILE)
+        except Exception:
+            self._log.exception("Failed to switch {} to the idle profile".format(self))
+
+    def _discoverAttributes(self, conn):
+        """Performs full GATT discovery of the remote device."""
+        conn.read_by_group_type(
+                GATTService.PRIMARY_SERVICE_UUID, timeout=120)
+                ## Read all service data at once
+        conn.find_all_information(timeout=120)
+
+        # Read characteristics
+        for serviceType in (
+            GATTCharacteristic.CHARACTERISTIC_UUID,
+            GATTCharacteristic.CLIENT_CHARACTERISTIC_CONFIG,
+        ):
+            conn.read_all_characteristics_by_type(serviceType, timeout=120)
+
+    def _mapCharacteristics(self, conn):
+        """Assign characteristics to the srvices & build the lookup indices."""
+        self._clearIndex()
+        services = conn.get_services()
+        characteristics = conn.get_characteristics()
+        for service in services:
+            service_chars = [ch for ch in characteristics
+                if service.start_handle <= ch.handle <= service.end_handle]
+            self._serviceToCharacteristics[service.uuid] = chars = [
+                BgCharacteristic(ch.uuid, ch, byteOrder.nStrToHHex(ch.uuid))
+                for ch in service_chars
+            ]
+
+            humanName = self._humanServiceName(service)
+            self._serviceIndex[humanName] = service
+            for char in chars:
+                self._charIndex[(humanName, char.human_uuid)] = char
+
+    def _clearIndex(self):
+        """Forget all service/characteristic mappings of the previous connection."""
+        self._serviceToCharacteristics.clear()
+        self._serviceIndex.clear()
+        self._charIndex.clear()
+
+    def _restoreCachedAttributes(self, conn):
+        """Populates `conn` with the attribute table cached for this microbot.
+
+        Returns `True` on success, `False` if the cache is missing or the cached handles
+        no longer work for the device.
+        """
+        if self._gattCache is None:
+            return False
+
+        address = self._mb.getUID()
+        cached = self._gattCache.get(address)
+        if cached is None:
+            return False
+
+        (version, table) = cached
+        gattCache.restoreTable(conn, table)
+        self._mapCharacteristics(conn)
+        try:
+            actualVersion = self._readVersion(conn)
+        except (RemoteError, Timeout):
+            self._log.exception("Cached attribute table failed for {!r}".format(address))
+            actualVersion = None
+
+        if actualVersion != version:
+            self._gattCache.invalidate(address)
+            gattCache.clearTable(conn)
+            return False
+        return True
+
+    def _cacheAttributes(self, conn):
+        """Stores attribute table discovered on the `conn` in the cache."""
+        if self._gattCache is None:
+            return
+
+        try:
+            version = self._readVersion(conn)
+        except (RemoteError, Timeout):
+            self._log.exception("Failed to read attribute table version.")
+            version = None
+
+        if version is not None:
+            self._gattCache.set(self._mb.getUID(), version, gattCache.dumpTable(conn))
+
+    def _readVersion(self, conn):
+        """Reads value of the `VERSION_CHARACTERISTIC` from the `conn`.
+
+        Returns `None` if the device has no such characteristic.
+        """
+        try:
+            char = self._charIndex[self.VERSION_CHARACTERISTIC]
+        except KeyError:
+            return None
+        conn.read_by_handle(char.gatt.handle + 1, timeout=15)
+        return char.gatt.value
+
     def _getCharacteristics(self, connection, serviceUUID):
         """Load information about a particular service."""
         try:
@@ -330,10 +601,6 @@ class BgConnection(iApi.iConnection):
         connection.find_information(service=service, timeout=20)
         prevHandles = frozenset(el.handle for el in connection.get_characteristics())
 
-
-
-        
-
         self._serviceToCharacteristics[service.uuid] = rv = tuple(
             BgCharacteristic(ch.uuid, ch, byteOrder.nStrToHHex(ch.uuid))
             for ch in connection.get_characteristics()
@@ -341,6 +608,14 @@ class BgConnection(iApi.iConnection):
         )
         return rv
 
+    def _onInvalidHandle(self):
+        """Called when the device rejects one of the attribute handles this connection uses.
+
+        Forces full GATT discovery on the next connect.
+        """
+        if self._gattCache is not None:
+            self._gattCache.invalidate(self._mb.getUID())
+
     def _updateLastCallTime(self):
         """Updates last call time to current time."""
         self._lastCallTime = time.time()
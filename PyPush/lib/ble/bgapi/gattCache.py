@@ -0,0 +1,130 @@
+"""Persistent cache of the GATT attribute tables discovered on the remote devices.
+
+Full GATT discovery is the slowest part of the connection sequence. The attribute table
+of the device is stable for the given firmware, so it is recorded once and replayed into
+the new `BLEConnection` on every reconnect.
+
+This module MUST be thread-safe.
+"""
+
+import collections
+import json
+import logging
+import os
+import struct
+import threading
+
+
+def dumpTable(conn):
+    """Returns JSON-serialisable snapshot of the attribute table discovered on the `conn`."""
+    services = [
+        (srv.start_handle, srv.end_handle, srv.uuid.encode("hex"))
+        for srv in conn.get_services()
+    ]
+    uuids = [
+        (handle, uuid.encode("hex"))
+        for (handle, uuid) in sorted(conn.handle_uuid.items())
+    ]
+    values = []
+    for char in conn.get_characteristics():
+        declaration = struct.pack("<BH", char.properties, char.value_handle) + char.uuid
+        values.append((char.handle, declaration.encode("hex")))
+        for descriptor in char.descriptors.itervalues():
+            values.append((descriptor.handle, descriptor.value.encode("hex")))
+    values.sort()
+    return {
+        "services": services,
+        "uuids": uuids,
+        "values": values,
+    }
+
+
+def restoreTable(conn, table):
+    """Populates `conn` with the attribute table previously returned by `dumpTable`."""
+    clearTable(conn)
+    for (start, end, uuid) in table["services"]:
+        conn.update_service(start, end, uuid.decode("hex"))
+    for (handle, uuid) in table["uuids"]:
+        conn.update_uuid(handle, uuid.decode("hex"))
+    # Characteristic declarations have lower handles than their descriptors,
+    #   so the ordered replay attaches every descriptor to its characteristic.
+    for (handle, value) in table["values"]:
+        conn.update_handle(handle, value.decode("hex"))
+
+
+def clearTable(conn):
+    """Forgets any attribute information stored in the `conn`."""
+    for store in (conn.services, conn.characteristics, conn.handle_uuid, conn.uuid_handle):
+        store.clear()
+
+
+class GattCache(object):
+    """Address-keyed store of the discovered attribute tables.
+
+    Each entry is tagged with the raw firmware version value of the device it was discovered on.
+    The cache is written to `fname` on every change (if `fname` is provided).
+    """
+
+    log = logging.getLogger(__name__)
+
+    def __init__(self, fname=None):
+        self.fname = fname
+        self.mutex = threading.RLock()
+        self.counters = collections.Counter()
+        self._entries = self._load()
+
+    def get(self, address):
+        """Returns (version, table) tuple cached for the `address` or `None` if there is none."""
+        with self.mutex:
+            try:
+                entry = self._entries[address]
+            except KeyError:
+                self.counters["miss"] += 1
+                rv = None
+            else:
+                self.counters["hit"] += 1
+                rv = (entry["version"].decode("hex"), entry["table"])
+            self._logCounters(address, "hit" if rv else "miss")
+        return rv
+
+    def set(self, address, version, table):
+        """Stores the attribute `table` discovered for the `address` running firmware `version`."""
+        with self.mutex:
+            self._entries[address] = {
+                "version": version.encode("hex"),
+                "table": table,
+            }
+            self._save()
+
+    def invalidate(self, address):
+        """Drops the cache entry for the `address` (if any)."""
+        with self.mutex:
+            if self._entries.pop(address, None) is not None:
+                self.counters["invalidated"] += 1
+                self._logCounters(address, "invalidated")
+                self._save()
+
+    def _logCounters(self, address, event):
+        self.log.info("GATT cache {} for {} (hits: {}, misses: {}, invalidated: {})".format(
+            event, address,
+            self.counters["hit"], self.counters["miss"], self.counters["invalidated"]))
+
+    def _load(self):
+        if not (self.fname and os.path.exists(self.fname)):
+            return {}
+
+        try:
+            with open(self.fname, "rb") as fobj:
+                return json.load(fobj)
+        except ValueError:
+            self.log.exception("Corrupted GATT cache file {!r}, starting afresh.".format(self.fname))
+            return {}
+
+    def _save(self):
+        if not self.fname:
+            return
+
+        tmpName = self.fname + ".tmp"
+        with open(tmpName, "wb") as fobj:
+            json.dump(self._entries, fobj)
+        os.rename(tmpName, self.fname)
@@ -1,18 +1,184 @@
-"""Library lock."""
+"""Library lock.
+
+BLED112 can run GATT procedures on several connections at once, but scanning and
+connection establishment occupy the whole radio. The locks in this module reflect that:
+
+    * scan/connect procedures lock the radio exclusively;
+    * GATT procedures lock only the connection they are executed on (and share the radio
+        with procedures running on other connections).
+"""
 
 import threading
 import functools
 import time
 import contextlib
+import thread
+
+from ... import retry
+
+# Retry policy of the GATT procedures.
+RETRY_POLICY = retry.RetryPolicy(baseDelay=0.5, maxDelay=5, budgetCapacity=10, budgetRate=0.2)
+
+
+class SharedExclusiveLock(object):
+    """Re-entrant readers-writer lock.
+
+    Any number of threads may hold this lock in the shared mode at once.
+    The exclusive mode waits for all other threads to leave.
+    The thread owning the lock exclusively can re-acquire it in any mode.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._owner = None
+        self._ownerDepth = 0
+        self._exclusiveWaiting = 0
+        self._shared = {}  # thread id -> recursion depth
+
+    @contextlib.contextmanager
+    def shared(self):
+        me = thread.get_ident()
+        with self._cond:
+            # Pending exclusive requests take priority over new shared holders (but not
+            #   over threads that already hold the lock, as that would deadlock).
+            while self._owner not in (None, me) or (
+                    self._exclusiveWaiting and me not in self._shared and self._owner != me):
+                self._cond.wait()
+            self._shared[me] = self._shared.get(me, 0) + 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                depth = self._shared[me] - 1
+                if depth:
+                    self._shared[me] = depth
+                else:
+                    del self._shared[me]
+                self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        me = thread.get_ident()
+        with self._cond:
+            self._exclusiveWaiting += 1
+            try:
+                while self._owner not in (None, me) or any(
+                        ident != me for ident in self._shared):
+                    self._cond.wait()
+            finally:
+                self._exclusiveWaiting -= 1
+            self._owner = me
+            self._ownerDepth += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._ownerDepth -= 1
+                if self._ownerDepth == 0:
+                    self._owner = None
+                self._cond.notify_all()
+
+
+class AdaptivePacing(object):
+    """Learns the shortest safe gap between two consecutive commands sent to a device.
+
+    The gap shrinks on every successful command and backs off when the device reports
+    that it is in the wrong state (is not ready to accept the next command yet).
+    """
+
+    MIN_GAP = 0.02  # seconds
+    MAX_GAP = 3.0  # seconds
+    INITIAL_GAP = 0.5  # seconds
+    SHRINK_FACTOR = 0.8
+    BACKOFF_FACTOR = 2.0
+    # Gaps this close to the one that had failed are not attempted again...
+    UNSAFE_MARGIN = 1.25
+    # ... until the memory of the failure fades away.
+    UNSAFE_DECAY = 0.95
+
+    __slots__ = ("gap", "_unsafeGap", "_mutex")
+
+    def __init__(self):
+        self.gap = self.INITIAL_GAP
+        self._unsafeGap = 0
+        self._mutex = threading.Lock()
+
+    def onSuccess(self):
+        with self._mutex:
+            self._unsafeGap *= self.UNSAFE_DECAY
+            self.gap = max(
+                self.MIN_GAP,
+                self._unsafeGap * self.UNSAFE_MARGIN,
+                self.gap * self.SHRINK_FACTOR,
+            )
+
+    def onWrongState(self):
+        with self._mutex:
+            self._unsafeGap = max(self._unsafeGap, self.gap)
+            self.gap = min(self.MAX_GAP, self.gap * self.BACKOFF_FACTOR)
 
 
 class LibLock(object):
+    """Lock state shared by the root BLE object and all of its connections."""
 
-    __slots__ = ("lock", "nextMinTime")
+    __slots__ = ("radio", "command", "pacing", "retryBudgets", "_mutex")
 
     def __init__(self):
+        self.radio = SharedExclusiveLock()
+        # Serialises command writes to the BLE dongle.
+        self.command = threading.Lock()
+        self.pacing = {}  # device key -> <AdaptivePacing>
+        self.retryBudgets = {}  # device key -> <retry.TokenBucket>
+        self._mutex = threading.Lock()
+
+    def getPacing(self, key):
+        """Returns <AdaptivePacing> for the device `key`.
+
+        The pacing outlives connections, so the gap learned for a device is reused on reconnect.
+        """
+        with self._mutex:
+            try:
+                return self.pacing[key]
+            except KeyError:
+                self.pacing[key] = rv = AdaptivePacing()
+                return rv
+
+    def getRetryBudget(self, key):
+        """Returns retry budget shared by all connections to the device `key`."""
+        with self._mutex:
+            try:
+                return self.retryBudgets[key]
+            except KeyError:
+                self.retryBudgets[key] = rv = RETRY_POLICY.newBudget()
+                return rv
+
+    def guardCommands(self, ble):
+        """Make sure that only one thread at a time sends commands to the dongle."""
+        api = getattr(ble, "_api", None)
+        if api is None:
+            return
+
+        realSend = api.send_command
+
+        def _send_(*args, **kwargs):
+            with self.command:
+                return realSend(*args, **kwargs)
+
+        api.send_command = _send_
+
+
+class ConnectionLock(object):
+    """Lock of a single BLE connection."""
+
+    __slots__ = ("lock", "nextMinTime", "pacing", "retryBudgets")
+
+    def __init__(self, pacing, deviceRetryBudget=None):
         self.lock = threading.RLock()
         self.nextMinTime = 0
+        self.pacing = pacing
+        self.retryBudgets = (RETRY_POLICY.newBudget(), )
+        if deviceRetryBudget is not None:
+            self.retryBudgets += (deviceRetryBudget, )
 
     def setNextCallIn(self, dt):
         assert dt >= 0
@@ -25,21 +191,38 @@ class LibLock(object):
 
 
 class LockableBle(object):
-    """This object wraps all calls to the BLE API into threading mutex."""
+    """This object wraps all calls to the BLE API into threading mutex.
 
-    def __init__(self, ble, lock):
+    The root object (the one wrapping BLE client) locks the radio exclusively for
+    the `EXCLUSIVE_CALLS`, child objects (wrapping connections) lock their connection only.
+    """
+
+    EXCLUSIVE_CALLS = frozenset([
+        "connect", "connect_by_adv_data", "reset_ble_state",
+        "scan_all", "scan_general", "scan_limited",
+    ])
+
+    def __init__(self, ble, lock, connLock=None):
         self._ble = ble
         self._lock = lock
+        self._connLock = connLock
 
     def __getattr__(self, name):
-        with self._lock.lock:
-            _realAttr = getattr(self._ble, name)
+        _realAttr = getattr(self._ble, name)
 
         if callable(_realAttr):
+            if self._connLock is not None:
+                ctx = self.transaction
+            elif name in self.EXCLUSIVE_CALLS:
+                ctx = self._lock.radio.exclusive
+            else:
+                ctx = self._lock.radio.shared
+
             @functools.wraps(_realAttr)
             def _wrapper_(*args, **kwargs):
-                with self._lock.lock:
-                    self._lock.waitUntilCanCall()
+                with ctx():
+                    if self._connLock is not None:
+                        self._connLock.waitUntilCanCall()
                     return _realAttr(*args, **kwargs)
             setattr(self, name, _wrapper_)
             rv = _wrapper_
@@ -49,20 +232,71 @@ class LockableBle(object):
 
     @contextlib.contextmanager
     def transaction(self):
-        """Entering this context will lock BLE library exclusively for the current thread."""
-        with self._lock.lock:
-            yield
+        """Entering this context locks the object exclusively for the current thread.
+
+        Locks the whole radio for the root object, the connection only for the child objects.
+        """
+        if self._connLock is None:
+            with self._lock.radio.exclusive():
+                yield
+        else:
+            with self._lock.radio.shared():
+                with self._connLock.lock:
+                    yield
 
     @contextlib.contextmanager
-    def delayedUnlock(self, timeout):
-        """Same as transaction, but the `ble` is locked for the `timeout` seconds."""
+    def delayedUnlock(self, timeout=None):
+        """Same as transaction, but the `ble` is locked for the `timeout` seconds.
+
+        The adaptive pacing gap of the connection is used if `timeout` is `None`.
+        """
         with self.transaction():
-            yield
-            self._lock.setNextCallIn(timeout)
+            try:
+                yield
+            finally:
+                if self._connLock is not None:
+                    if timeout is None:
+                        timeout = self._connLock.pacing.gap
+                    self._connLock.setNextCallIn(timeout)
+
+    def getWrapped(self):
+        """Returns the wrapped BLE object.
+
+        Attribute assignments are not forwarded by this wrapper, so state set by the bgapi
+        event handlers has to be accessed on the wrapped object.
+        """
+        return self._ble
+
+    def getPacing(self):
+        """Returns <AdaptivePacing> of this connection (`None` for the root object)."""
+        if self._connLock is None:
+            return None
+        return self._connLock.pacing
+
+    def getRetryBudgets(self):
+        """Returns retry budgets of this connection (per-connection and per-device ones)."""
+        if self._connLock is None:
+            return ()
+        return self._connLock.retryBudgets
 
     @classmethod
     def RootLock(cls, obj):
-        return cls(obj, LibLock())
+        lock = LibLock()
+        lock.guardCommands(obj)
+        return cls(obj, lock)
+
+    def getChildLock(self, obj, pacingKey=None):
+        """Returns lockable wrapper for the connection `obj`.
+
+        Connections sharing `pacingKey` share their <AdaptivePacing> and retry budget.
+        """
+        if pacingKey is None:
+            connLock = ConnectionLock(AdaptivePacing())
+        else:
+            connLock = ConnectionLock(
+                self._lock.getPacing(pacingKey), self._lock.getRetryBudget(pacingKey))
+        return self.__class__(obj, self._lock, connLock)
 
-    def getChildLock(self, obj):
-        return self.__class__(obj, self._lock)
+    def getPacingGaps(self):
+        """Returns dict of device key -> current command gap (in seconds)."""
+        return dict((key, pacing.gap) for (key, pacing) in self._lock.pacing.items())
@@ -6,8 +6,9 @@ This module MUST be thread-safe.
 import threading
 import time
 import datetime
+import collections
 
-from .. import iApi
+from .. import iApi, linkQuality
 
 from . import byteOrder
 
@@ -19,6 +20,7 @@ class BgMicrobot(iApi.iMicrobotPush):
         self._name = name
         self._addr = binAddr
         self._lastSeen = lastSeen
+        self._link = linkQuality.LinkQuality()
 
     def getName(self):
         return self._name
@@ -26,6 +28,15 @@ class BgMicrobot(iApi.iMicrobotPush):
     def getLastSeen(self):
         return datetime.datetime.fromtimestamp(self._lastSeen)
 
+    def getRssi(self):
+        return self._link.rssi
+
+    def getAdvertRate(self):
+        return self._link.advertRate
+
+    def getLinkScore(self):
+        return self._link.getScore()
+
     def getBinaryUUID(self):
         return self._addr
 
@@ -42,6 +53,7 @@ class BgMicrobot(iApi.iMicrobotPush):
     def _update(self, other):
         """Update data stored in this object with the data for the same microbot but stored in another object."""
         assert self == other, (self, other)
+        self._link.observe(other._link.rssi, other._lastSeen, other._link.advertRate)
         self._lastSeen = max(self._lastSeen, other._lastSeen)
         self._name = other._name
 
@@ -60,14 +72,21 @@ class MicrobotRegistry(object):
     def __init__(self, maxAge=0):
         """Any microbot that had not been showing signs of life for over `maxAge` (if > 0) will be erased from the registry."""
         self._lock = threading.RLock()
-        self._bots = {}
+        # address -> BgMicrobot, ordered from the least to the most recently seen
+        self._bots = collections.OrderedDict()
         self._maxAge = maxAge
         self._scanCallbacks = []
+        self._lostCallbacks = []
 
     def onScanCallback(self, callback):
         assert callable(callback), callback
         self._scanCallbacks.append(callback)
 
+    def onLostCallback(self, callback):
+        """`callback` is called with the BgMicrobot that is erased from the registry."""
+        assert callable(callback), callback
+        self._lostCallbacks.append(callback)
+
     def createMicrobotFromUUID(self, uuid):
         name = "Hidden microbot ({:02X}:{:02X})".format(*byteOrder.nStrToHBytes(uuid[:2]))
         rv = BgMicrobot(uuid, name, 0)
@@ -77,25 +96,29 @@ class MicrobotRegistry(object):
         """This method is called when microbot is discovered via BLE scan."""
         addr = evt.get_sender_address()
         newBot = self._botFromEvt(evt)
-        try:
-            bot = self._bots[addr]
-        except KeyError:
-            with self._lock:
-                self._bots[addr] = newBot
-        else:
-            bot._update(newBot)
-
-        evtBot = self._bots[addr]
+        with self._lock:
+            evtBot = self._bots.pop(addr, None)
+            if evtBot is None:
+                evtBot = newBot
+            else:
+                evtBot._update(newBot)
+            # (Re-)inserting moves the bot to the most recently seen end
+            self._bots[addr] = evtBot
+            lost = self._gcOldMicrobots()
 
         # trigger onScan callbacks
         for cb in self._scanCallbacks:
             cb(evtBot)
 
-        self._gcOldMicrobots()
+        for bot in lost:
+            for cb in self._lostCallbacks:
+                cb(bot)
 
     def _botFromEvt(self, evt):
         """Creates new BgMicrobot instance from the bluetooth scan event."""
-        evt.parse_advertisement_data()
+        if not evt.adv_payload:
+            # Scanner passes events with the payload already parsed
+            evt.parse_advertisement_data()
         addr = evt.get_sender_address()
         name = "Unknown Microbot ({:02X}:{:02X})".format(
             *byteOrder.nStrToHBytes(addr[:2]))
@@ -109,19 +132,25 @@ class MicrobotRegistry(object):
 
         rv = BgMicrobot(addr, name, time.time())
         rv._setLastSeen(evt.created)
+        # (`advert_rate` is set by the scanner)
+        rv._link.observe(evt.rssi, evt.created, getattr(evt, "advert_rate", None))
         return rv
 
     def _gcOldMicrobots(self):
-        """Forget all microbots that are older than max age."""
+        """Forget all microbots that are older than max age. Returns list of the forgotten bots.
+
+        Only the expired bots (at the least recently seen end of `_bots`) are looked at.
+        Must be called with the lock held.
+        """
         if self._maxAge <= 0:
-            return
+            return ()
 
         cutoffTime = time.time() - self._maxAge
-        toRemove = []
-        for (key, mb) in tuple(self._bots.items()):
-            if mb._lastSeen < cutoffTime:
-                toRemove.append(key)
-
-        with self._lock:
-            for key in toRemove:
-                self._bots.pop(key)
+        removed = []
+        while self._bots:
+            (key, mb) = next(self._bots.iteritems())
+            if mb._lastSeen >= cutoffTime:
+                break
+            self._bots.pop(key)
+            removed.append(mb)
+        return removed
@@ -3,47 +3,137 @@ import threading
 import datetime
 import time
 import logging
+import collections
+
+from .. import scanScheduler
 
 class _ScanThread_(threading.Thread):
 
     log = logging.getLogger(__name__)
 
-    def __init__(self, ble, maxAge, callback):
+    # `gap_set_filtering` scan policy that reports the whitelisted advertisers only.
+    WHITELIST_SCAN_POLICY = 1
+
+    def __init__(self, ble, maxAge, callback, scheduler=None, whitelist=None):
         super(_ScanThread_, self).__init__()
         self.ble = ble
         self.maxAge = maxAge
         self.daemon = True
         self._cb = callback
+        if scheduler is None:
+            scheduler = scanScheduler.ScanScheduler(window=0.5)
+        self.scheduler = scheduler
+        if whitelist is None:
+            whitelist = scanScheduler.ScanWhitelist()
+        self.whitelist = whitelist
+        self._dongleFiltering = False
 
     def run(self):
         while True:
+            self.scheduler.waitForSlot()
             try:
-                self.step()
+                with self.scheduler.scanning():
+                    self.step()
             except Exception:
                 self.log.exception("Scan thread exception.")
-            time.sleep(0.5)
+                time.sleep(0.5)
 
     def step(self):
-        results = self.ble.scan_all(timeout=0.5)
+        self._configureFilter()
+        results = self.ble.scan_all(timeout=self.scheduler.window)
 
         # deduplicate & remove old scan responses
         if results:
-            results.sort(key=lambda el: el.created, reverse=True)
-            seen = set()
             minTime = time.time() - self.maxAge
+            newest = {}  # address -> the most recent scan response
+            counts = collections.Counter()  # address -> adverts heard during this scan window
             for el in results:
+                if el.created < minTime:
+                    continue
                 addr = el.get_sender_address()
-                if addr not in seen or el.created >= minTime:
-                    self._cb(el)
-                seen.add(addr)
+                counts[addr] += 1
+                prev = newest.get(addr)
+                if prev is None or el.created > prev.created:
+                    newest[addr] = el
+            for (addr, el) in newest.iteritems():
+                # Only the newest advert is reported, it carries the advert rate of the device
+                el.advert_rate = counts[addr] / float(self.scheduler.window)
+                self._cb(el)
+
+    def _configureFilter(self):
+        """Loads the whitelist into the dongle & toggles the dongle-side filtering for the next scan."""
+        filtered = not self.whitelist.startScan()
+        (changed, addresses) = self.whitelist.takeUpdate()
+        if not changed and filtered == self._dongleFiltering:
+            return
+
+        api = self.ble._api
+        with self.ble.transaction():
+            if changed:
+                api.ble_cmd_system_whitelist_clear()
+                for addr in addresses or ():
+                    api.ble_cmd_system_whitelist_append(addr, 1)
+            if filtered != self._dongleFiltering:
+                api.ble_cmd_gap_set_filtering(
+                    self.WHITELIST_SCAN_POLICY if filtered else 0, 0, 0)
+                self._dongleFiltering = filtered
+
+
+_CacheEntry = collections.namedtuple("_CacheEntry", ["data", "payload", "isMicrobot", "expires"])
+
+class AdvertisementCache(object):
+    """Address-keyed cache of parsed advertisement payloads and "is a microbot" verdicts.
+
+    A verdict is reused while the device keeps advertising the same payload (till it expires),
+    so each distinct payload of a device is parsed once. A changed payload is always re-checked
+    (e.g. an unpaired microbot starting to advertise its name).
+
+    Not thread-safe (used by the scan thread only).
+    """
+
+    def __init__(self, isMicrobot, ttl=60, maxSize=4096):
+        self._isMicrobot = isMicrobot
+        self.ttl = ttl
+        self.maxSize = maxSize
+        self._entries = collections.OrderedDict()  # address -> <_CacheEntry>
+        self.counters = collections.Counter()
+
+    def classify(self, evt):
+        """Returns `True` if the `evt` was sent by a microbot.
+
+        `evt.adv_payload` is populated for microbot events.
+        """
+        addr = evt.get_sender_address()
+        now = evt.created
+        entry = self._entries.get(addr)
+        if entry is not None and entry.expires > now and entry.data == evt.data:
+            if not entry.isMicrobot:
+                self.counters["rejected"] += 1
+                return False
+            self.counters["hit"] += 1
+            evt.adv_payload = list(entry.payload)
+            return True
+
+        self.counters["parsed"] += 1
+        del evt.adv_payload[:]
+        evt.parse_advertisement_data()
+        verdict = self._isMicrobot(evt)
+
+        self._entries.pop(addr, None)
+        self._entries[addr] = _CacheEntry(evt.data, tuple(evt.adv_payload), verdict, now + self.ttl)
+        while len(self._entries) > self.maxSize:
+            self._entries.popitem(last=False)
+        return verdict
 
 class Scanner(object):
 
-    def __init__(self, ble, onScanCb):
+    def __init__(self, ble, onScanCb, scheduler=None):
         assert callable(onScanCb), onScanCb
         self._myUUID = ble.get_ble_address()
         self._cb = onScanCb
-        self._scan = _ScanThread_(ble, 3600, self._onNewScanResult)
+        self._advCache = AdvertisementCache(self._isMicrobot)
+        self.whitelist = scanScheduler.ScanWhitelist()
+        self._scan = _ScanThread_(ble, 3600, self._onNewScanResult, scheduler, self.whitelist)
         self._scan.start()
 
     def _onNewScanResult(self, evt):
@@ -51,11 +141,14 @@ class Scanner(object):
 
         * THIS METHOD IS EXECUTED IN A CHILD THREAD *
         """
-        if self._isMicrobot(evt):
+        if not self.whitelist.accepts(evt.get_sender_address()):
+            # (Only reaches here if the dongle does not filter the scan results itself)
+            return
+        if self._advCache.classify(evt):
             self._cb(evt)
 
     def _isMicrobot(self, evt):
-        evt.parse_advertisement_data()
+        """Checks the parsed advertisement payload of the `evt`."""
         for el in evt.adv_payload:
             if el.type_name == "BLE_GAP_AD_TYPE_COMPLETE_LOCAL_NAME" and el.data in ("mibp", "mib-push"):
                 return True
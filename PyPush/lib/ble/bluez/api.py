@@ -2,6 +2,8 @@
 import threading
 import subprocess
 
+from PyPush.lib import stats
+
 from .. import iApi
 
 from . import (
@@ -19,6 +21,7 @@ class API(iApi.iApi):
         self.devName = config["device"]
         self._mutex = threading.RLock()
         self._scanner = scanner.Scanner(self.devName, self._mutex)
+        self._connectStats = stats.LatencyStats()
 
     def start(self):
         """Start any involved threads."""
@@ -26,6 +29,24 @@ class API(iApi.iApi):
 
     def onScan(self, callback):
         return self._scanner.onScan.subscribe(callback)
+
+    def onLost(self, callback):
+        return self._scanner.onLost.subscribe(callback)
+
+    def scanPaused(self):
+        return self._scanner.scheduler.paused()
+
+    def setScanDemand(self, demand):
+        self._scanner.scheduler.setDemand(demand)
+
+    def getScanStats(self):
+        return self._scanner.scheduler.getStats()
+
+    def setScanWhitelist(self, uids):
+        # BlueZ reports addresses in the same "AA:BB:.." notation as the UIDs
+        if uids is not None:
+            uids = [uid.upper() for uid in uids]
+        self._scanner.whitelist.set(uids)
     
     def createMicrobotFromUUID(self, uuid):
         assert self._running
@@ -34,10 +55,14 @@ class API(iApi.iApi):
         return self._microbotDb.createMicrobotFromUUID(nUuid)
 	
     def connect(self, microbot):
-        conn = connection.Connection(self.devName, microbot, self._mutex)
+        conn = connection.Connection(self.devName, microbot, self._mutex, self._connectStats)
         conn._open()
         return conn
 
+    def getConnectStats(self):
+        """Returns latency summary of the established connections (from the connect request till the link is up)."""
+        return self._connectStats.getSummary()
+
     _myUUID = None
     def getUID(self):
         if self._myUUID is None:
@@ -9,6 +9,7 @@ import functools
 import bluetooth.ble
 
 from PyPush.lib import async as async
+from PyPush.lib import stats
 
 from .. import (
     iApi,
@@ -18,7 +19,36 @@ from .. import (
 class PushGattRequester(bluetooth.ble.GATTRequester):
     """PyPush gatt requester."""
 
+    # Connection state is re-checked this often in case gattlib does not call the connect callbacks
+    connect_poll = 0.1 # seconds
+
     _notifyCb = None
+
+    def __init__(self, *args, **kwargs):
+        super(PushGattRequester, self).__init__(*args, **kwargs)
+        self._connCond = threading.Condition(threading.Lock())
+        self._connectFailed = False
+
+    def on_connect(self, *args):
+        with self._connCond:
+            self._connCond.notify_all()
+
+    def on_connect_failed(self, *args):
+        with self._connCond:
+            self._connectFailed = True
+            self._connCond.notify_all()
+
+    def waitConnected(self, timeout):
+        """Blocks until the connection is established. Returns `False` on failure or timeout."""
+        deadline = time.time() + timeout
+        with self._connCond:
+            while not self.is_connected():
+                timeLeft = deadline - time.time()
+                if self._connectFailed or timeLeft <= 0:
+                    return False
+                self._connCond.wait(min(timeLeft, self.connect_poll))
+        return True
+
     def setNotificationCallback(self, cb):
         assert callable(cb)
         assert self._notifyCb is None
@@ -73,30 +103,43 @@ class Connection(iApi.iConnection):
     
     log = logging.getLogger(__name__)
 
+    connect_timeout = 10 # seconds
+
     mb = hciDev = gattReq = token = None
+    _profile = "idle"
     _serviceCache = _charCache = _subscriptions = _lastActiveTime = None
 
-    def __init__(self, hciDev, discoveredMb, token):
+    def __init__(self, hciDev, discoveredMb, token, connectStats=None):
         self.mb = discoveredMb
         self.hciDev = hciDev
         self.token = token
+        self._connectStats = connectStats or stats.LatencyStats()
         self._subscriptions = set() # set of (servName, charName)
         self.notifyEvtDict = async.SubscribeHubDict()
+        self._handleIndex = {} # value handle -> characteristic name
+        # characteristic name -> <async.DispatchSource> delivering its notifications
+        self._notifyDispatch = {}
+        self._dispatchMutex = threading.Lock()
 
     def _open(self):
         assert not self.isActive()
         with self.transaction():
-            conn = PushGattRequester(
+            req = PushGattRequester(
                 self.mb.getUID(),
                 False, # do_connect
                 self.hciDev,
             )
-            conn = PushBluezRequesterProxy(conn, self)
-            self.gattReq = conn
-            conn.setNotificationCallback(self._on_notification)
+            req.setNotificationCallback(self._on_notification)
+            conn = PushBluezRequesterProxy(req, self)
+            start = time.time()
             conn.connect(False, "random")
-            while not conn.is_connected():
-                time.sleep(0.5)
+            if not req.waitConnected(self.connect_timeout):
+                if req.is_connected():
+                    req.disconnect()
+                raise exceptions.Timeout("Failed to connect to {!r} in {} seconds.".format(
+                    self.mb, self.connect_timeout))
+            self._connectStats.add(time.time() - start)
+            self.gattReq = conn
             self._populateCaches()
 
             # Activate any pending subscriptions
@@ -136,6 +179,21 @@ class Connection(iApi.iConnection):
         self._bumpActiveTime()
         return "".join(rv)
 
+    def readMany(self, keys, timeout=5):
+        handles = [self._findCharacteristic(srv, char)["value_handle"] for (srv, char) in keys]
+        with self.token:
+            rv = ["".join(self.gattReq.read_by_handle(handle)) for handle in handles]
+        self._bumpActiveTime()
+        return rv
+
+    def setProfile(self, name):
+        # gattlib does not expose the connection parameter update procedure.
+        self.log.debug("Connection profile {!r} ignored.".format(name))
+        self._profile = name
+
+    def getProfile(self):
+        return self._profile
+
     def isActive(self):
         return bool(self.gattReq and self.gattReq.is_connected())
 
@@ -144,6 +202,10 @@ class Connection(iApi.iConnection):
             with self.token:
                 self.gattReq.disconnect()
                 self.gattReq = None
+        with self._dispatchMutex:
+            for source in self._notifyDispatch.itervalues():
+                source.cancel()
+            self._notifyDispatch.clear()
 
     def transaction(self):
         return self.token
@@ -196,14 +258,30 @@ class Connection(iApi.iConnection):
                 _cache[name] = service.copy()
 
             self._charCache = _cache = {}
+            self._handleIndex = _index = {}
             for char in conn.discover_characteristics():
                 name = self._uuidToHumanName(char["uuid"])
                 _cache[name] = char
+                _index[char["value_handle"]] = name
 
     def _on_notification(self, chHandle, data):
-        """This callback is called when the device notifies us of characteristic change."""
+        """This callback is called when the device notifies us of characteristic change.
+
+        * THIS METHOD IS EXECUTED IN THE GATTLIB THREAD * (subscribers are called by the dispatcher)
+        """
         self._bumpActiveTime()
-        ch = [el for el in self._charCache.itervalues() if el["value_handle"] == chHandle]
-        assert len(ch) == 1, ch
-        chName = self._uuidToHumanName(ch[0]["uuid"])
-        self.notifyEvtDict[chName].fireSubscribers(data[3:]) # data is prefixed with three bytes purpose of whom I have no idea of.
\ No newline at end of file
+        try:
+            chName = self._handleIndex[chHandle]
+        except KeyError:
+            self.log.warning("Notification for an unknown handle {!r}".format(chHandle))
+            return
+        self._getNotifyDispatch(chName).put(data[3:]) # data is prefixed with three bytes purpose of whom I have no idea of.
+
+    def _getNotifyDispatch(self, chName):
+        with self._dispatchMutex:
+            try:
+                return self._notifyDispatch[chName]
+            except KeyError:
+                self._notifyDispatch[chName] = rv = async.getDispatcher().register(
+                    self.notifyEvtDict[chName].fireSubscribers)
+                return rv
\ No newline at end of file
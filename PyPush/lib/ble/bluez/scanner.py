@@ -4,43 +4,144 @@ import logging
 import time
 import datetime
 import collections
+import Queue
 
-from bluetooth.ble import DiscoveryService, GATTRequester
+from bluetooth.ble import DiscoveryService
 
-from PyPush.lib import async
+from PyPush.lib import async, const
 
-from .. import iApi
+from .. import iApi, scanScheduler, linkQuality
+from . import connection
 
 class _ScanThread_(threading.Thread):
     log = logging.getLogger(__name__)
 
-    def __init__(self, discoveryService, token, callback):
+    def __init__(self, discoveryService, token, callback, scheduler, whitelist, probes):
         super(_ScanThread_, self).__init__()
         self.discoveryService = discoveryService
         self.token = token
         self.daemon = True
         self._cb = callback
+        self.scheduler = scheduler
+        self.whitelist = whitelist
+        self.probes = probes
 
     def run(self):
         while True:
+            self.scheduler.waitForSlot()
             try:
                 with self.token:
-                    self.step(self.discoveryService)
+                    with self.scheduler.scanning():
+                        self.step(self.discoveryService)
             except Exception:
                 self.log.exception("Scan thread exception.")
-            time.sleep(3)
+                time.sleep(3)
 
     def step(self, discService):
-        devices = discService.discover_advanced(1)
+        self.whitelist.startScan()
+        self.probes.startScan()
+        devices = discService.discover_advanced(int(self.scheduler.window))
         for (address, seg_data) in devices.items():
             self._cb(address, seg_data)
 
+class _ExpiringSet(object):
+    """Set of keys that are forgotten `ttl` seconds after being added."""
+
+    def __init__(self, ttl, maxSize):
+        self.ttl = ttl
+        self.maxSize = maxSize
+        self._expires = collections.OrderedDict() # key -> expiry time, ordered by the expiry time
+        self._mutex = threading.Lock()
+
+    def add(self, key):
+        with self._mutex:
+            self._expires.pop(key, None)
+            self._expires[key] = time.time() + self.ttl
+            while len(self._expires) > self.maxSize:
+                self._expires.popitem(last=False)
+
+    def __contains__(self, key):
+        now = time.time()
+        with self._mutex:
+            while self._expires:
+                (oldest, expiry) = next(self._expires.iteritems())
+                if expiry > now:
+                    break
+                del self._expires[oldest]
+            return key in self._expires
+
+    def __len__(self):
+        return len(self._expires)
+
+
+class _ProbePool(object):
+    """Bounded pool of threads that check if anonymous devices are microbots.
+
+    At most `budget` probes are accepted per scan, further devices are left for the next scans.
+    `probe(uuid)` is called on a worker thread, `callback(uuid, seg_data, isMicrobot)` is called
+    with its result.
+    """
+
+    log = logging.getLogger(__name__)
+
+    def __init__(self, probe, callback, workers=2, budget=4):
+        self._probe = probe
+        self._cb = callback
+        self.budget = budget
+        self._remaining = budget
+        self._pending = set()
+        self._queue = Queue.Queue()
+        self._mutex = threading.Lock()
+        self._threads = []
+        for idx in xrange(workers):
+            thread = threading.Thread(name="{}.probe{}".format(__name__, idx), target=self._workerTarget)
+            thread.daemon = True
+            self._threads.append(thread)
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def startScan(self):
+        """Resets the per-scan probe budget."""
+        with self._mutex:
+            self._remaining = self.budget
+
+    def submit(self, uuid, seg_data):
+        """Schedules probe of the `uuid`. Returns `False` if the probe was not accepted."""
+        with self._mutex:
+            if uuid in self._pending:
+                return True
+            if self._remaining <= 0:
+                return False
+            self._remaining -= 1
+            self._pending.add(uuid)
+        self._queue.put((uuid, seg_data))
+        return True
+
+    def _workerTarget(self):
+        while True:
+            (uuid, seg_data) = self._queue.get()
+            try:
+                rv = self._probe(uuid)
+            except Exception:
+                self.log.exception("Failed to probe {!r}".format(uuid))
+                rv = False
+            with self._mutex:
+                self._pending.discard(uuid)
+            try:
+                self._cb(uuid, seg_data, rv)
+            except Exception:
+                self.log.exception("Probe callback exception.")
+
+
 class DiscoveredMicrobot(iApi.iMicrobotPush):
 
     def __init__(self, address, adv_data):
         self.address = address
         self.adv_data = adv_data.copy()
-        self._pingTime()
+        self._link = linkQuality.LinkQuality()
+        self._pingTime(adv_data)
 
     def getName(self):
         """Returns name of this microbot."""
@@ -54,8 +155,18 @@ class DiscoveredMicrobot(iApi.iMicrobotPush):
         """Returns an unique string identifying this particular microbot device."""
         return self.address
 
-    def _pingTime(self):
+    def getRssi(self):
+        return self._link.rssi
+
+    def getAdvertRate(self):
+        return self._link.advertRate
+
+    def getLinkScore(self):
+        return self._link.getScore()
+
+    def _pingTime(self, adv_data):
         self._lastSeen = datetime.datetime.utcnow()
+        self._link.observe(adv_data.get("rssi"), time.time())
 
     def __repr__(self):
         return "<{} {!r} ({!r})>".format(
@@ -65,65 +176,91 @@ class Scanner(object):
     """Top-level scanner object."""
 
     max_seen_mbs = 1024
+    not_mb_ttl = 600 # seconds
+    probe_timeout = 5 # seconds
     _seenMbs = _notMbs = None
 
     def __init__(self, devName, bleAccessToken):
         self.onScan = async.SubscribeHub()
+        self.onLost = async.SubscribeHub()
         self.devName = devName
         self._token = bleAccessToken
+        self.scheduler = scanScheduler.ScanScheduler(window=1, pauses={
+            const.ScanDemand.low: 30.0,
+            const.ScanDemand.normal: 3.0,
+            const.ScanDemand.high: 0.5,
+        })
+        self.whitelist = scanScheduler.ScanWhitelist()
+        self._probes = _ProbePool(self._tryQueryMbService, self._onProbed)
         self._thread = _ScanThread_(
-            DiscoveryService(devName), self._token, self._onDeviceDiscovered)
+            DiscoveryService(devName), self._token, self._onDeviceDiscovered, self.scheduler,
+            self.whitelist, self._probes)
         self._seenMbs = collections.OrderedDict()
-        self._notMbs = collections.deque(maxlen=self.max_seen_mbs)
+        self._notMbs = _ExpiringSet(self.not_mb_ttl, self.max_seen_mbs)
 
     def start(self):
+        self._probes.start()
         self._thread.start()
 
     def _onDeviceDiscovered(self, uuid, seg_data):
-        if uuid in self._seenMbs:
-            self._seenMbs[uuid]._pingTime()
+        if not self.whitelist.accepts(uuid.upper()):
+            # Ignore the event
+            pass
+        elif uuid in self._seenMbs:
+            # Re-insert to keep `_seenMbs` ordered from the least to the most recently seen
+            dev = self._seenMbs.pop(uuid)
+            dev._pingTime(seg_data)
+            self._seenMbs[uuid] = dev
         elif uuid in self._notMbs:
             # Ignore the event
             pass
-        elif self._isMicrobot(uuid, seg_data):
+        elif seg_data["bdaddr_type"] != 1:
+            self._notMbs.add(uuid)
+        elif seg_data.get("name"):
+            self._onProbed(uuid, seg_data, self._isMicrobotName(seg_data["name"]))
+        else:
+            # Maybe this is a paired microbot (these do not advertise their names).
+            self._probes.submit(uuid, seg_data)
+
+    def _onProbed(self, uuid, seg_data, isMicrobot):
+        if isMicrobot:
             with self._token:
+                if uuid in self._seenMbs:
+                    return
                 dev = DiscoveredMicrobot(uuid, seg_data)
                 self._seenMbs[uuid] = dev
                 self.onScan.fireSubscribers(dev)
                 self._gcMicrobots()
         else:
-            self._notMbs.append(uuid)
+            self._notMbs.add(uuid)
 
     def _gcMicrobots(self):
         """Remove any microbots that should have been long forgotten."""
         with self._token:
             while len(self._seenMbs) > self.max_seen_mbs:
-                self._seenMbs.popitem()
-
-    def _isMicrobot(self, uuid, seg_data):
-        if seg_data["bdaddr_type"] != 1:
-            return False
-        name = seg_data.get("name")
-        if name:
-            rv = name in ("mibp", "mib-push")
-        else:
-            # Maybe this is a paired microbot.
-            rv = self._tryQueryMbService(uuid)
-        return rv
+                (_, dev) = self._seenMbs.popitem(last=False)
+                self.onLost.fireSubscribers(dev)
+
+    def _isMicrobotName(self, name):
+        return name in ("mibp", "mib-push")
 
     def _tryQueryMbService(self, uuid):
-        conn = GATTRequester(uuid, False, self.devName)
+        """Connects to the device and checks its name.
+
+        * THIS METHOD IS EXECUTED IN THE PROBE POOL THREAD *
+        The BLE token is held only while talking to the device, not while waiting for it.
+        """
+        conn = connection.PushGattRequester(uuid, False, self.devName)
         try:
-            conn.connect(False, "random")
-            max_time = time.time() + 5
-            while not conn.is_connected():
-                if time.time() > max_time:
-                    return False
-                time.sleep(0.5)
+            with self._token:
+                conn.connect(False, "random")
+            if not conn.waitConnected(self.probe_timeout):
+                return False
 
             DEV_NAME_SERVICE_UUID = "00002a00-0000-1000-8000-00805f9b34fb" # 2A00, device name
             try:
-                value = "".join(conn.read_by_uuid(DEV_NAME_SERVICE_UUID))
+                with self._token:
+                    value = "".join(conn.read_by_uuid(DEV_NAME_SERVICE_UUID))
             except RuntimeError as err:
                 msg = err.message.lower()
                 if "no attribute found":
@@ -134,6 +271,5 @@ class Scanner(object):
             return ("mibp" in value or "mib-push" in value)
         finally:
             if conn.is_connected():
-                conn.disconnect()
-                while conn.is_connected():
-                    time.sleep(0.5)
\ No newline at end of file
+                with self._token:
+                    conn.disconnect()
\ No newline at end of file
@@ -18,6 +18,29 @@ class iApi(object):
 
         """
 
+    @abstractmethod
+    def onLost(self, callback):
+        """This method calls `callback` with the <iMicrobotPush> that had not been seen for too long and was forgotten."""
+
+    @abstractmethod
+    def scanPaused(self):
+        """Returns a context that suspends BLE scanning (e.g. while a user-initiated action is in flight)."""
+
+    @abstractmethod
+    def setScanDemand(self, demand):
+        """Sets <const.ScanDemand> that determines the scan duty cycle."""
+
+    @abstractmethod
+    def getScanStats(self):
+        """Returns dict of the scan scheduler state (incl. fraction of the radio time spent scanning)."""
+
+    @abstractmethod
+    def setScanWhitelist(self, uids):
+        """Only the adverts of the microbots with the `uids` are inspected (plus a periodic discovery scan).
+
+        `None` disables the filtering.
+        """
+
     @abstractmethod
     def connect(self, mbPush):
         """This method initiates BLE connection to the <iMicrobotPush> provided as an argument.
@@ -51,6 +74,18 @@ class iMicrobotPush(object):
     def getUID(self):
         """Returns an unique string identifying this particular microbot device."""
 
+    @abstractmethod
+    def getRssi(self):
+        """Returns smoothed RSSI (dBm) of the adverts of this microbot (`None` if unknown)."""
+
+    @abstractmethod
+    def getAdvertRate(self):
+        """Returns smoothed number of the adverts received per second (`None` if unknown)."""
+
+    @abstractmethod
+    def getLinkScore(self):
+        """Returns sortable link quality estimate (greater is better)."""
+
 
 class iConnection(object):
     __metaclass__ = ABCMeta
@@ -83,6 +118,24 @@ class iConnection(object):
     def read(self, serviceId, characteristicId, timeout=5):
         """Reads data for the characteristic::service."""
 
+    @abstractmethod
+    def readMany(self, keys, timeout=5):
+        """Reads data for all (serviceId, characteristicId) `keys` in as few radio exchanges as possible.
+
+        Returns list of values (in the order of `keys`).
+        """
+
+    @abstractmethod
+    def setProfile(self, name):
+        """Switches the connection to the named set of connection parameters ("interactive" or "idle").
+
+        The "interactive" profile falls back to "idle" when the connection is not used for a while.
+        """
+
+    @abstractmethod
+    def getProfile(self):
+        """Returns name of the current connection profile."""
+
     @abstractmethod
     def isActive(self):
         """Returns `True` if this connection is still active."""
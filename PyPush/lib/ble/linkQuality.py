@@ -0,0 +1,47 @@
+"""Link quality estimation from the scan events."""
+
+
+class LinkQuality(object):
+    """Exponentially smoothed RSSI & advert rate of a BLE device."""
+
+    RSSI_ALPHA = 0.25
+    RATE_ALPHA = 0.25
+
+    __slots__ = ("rssi", "advertRate", "_lastTs")
+
+    def __init__(self):
+        self.rssi = None # dBm
+        self.advertRate = None # adverts per second
+        self._lastTs = None
+
+    def observe(self, rssi, ts, advertRate=None):
+        """Record an advert received with `rssi` at `ts` (time.time()).
+
+        `advertRate` is the advert rate measured by the caller (adverts heard per second of scanning).
+        If it is not known, the rate is estimated from the interval since the previous observation
+        (this is only valid if every advert of the device is observed).
+        """
+        if rssi is not None:
+            if self.rssi is None:
+                self.rssi = float(rssi)
+            else:
+                self.rssi += self.RSSI_ALPHA * (rssi - self.rssi)
+
+        rate = advertRate
+        if rate is None and self._lastTs is not None and ts > self._lastTs:
+            rate = 1.0 / (ts - self._lastTs)
+        if rate is not None:
+            if self.advertRate is None:
+                self.advertRate = rate
+            else:
+                self.advertRate += self.RATE_ALPHA * (rate - self.advertRate)
+        if self._lastTs is None or ts > self._lastTs:
+            self._lastTs = ts
+
+    def getScore(self):
+        """Returns sort key of the link (greater is better)."""
+        return (
+            self.rssi is not None,
+            self.rssi,
+            self.advertRate or 0,
+        )
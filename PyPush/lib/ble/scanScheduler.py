@@ -0,0 +1,161 @@
+"""Scan duty-cycle scheduler shared by the BLE scanners."""
+
+import collections
+import contextlib
+import logging
+import threading
+import time
+
+from .. import const
+
+
+class ScanScheduler(object):
+    """Decides when the scan thread may take the radio.
+
+    Scans last `window` seconds each. The pause between two scans depends on the scan demand,
+    and no scan is started while a user-initiated action is in flight.
+    """
+
+    log = logging.getLogger(__name__)
+
+    # Seconds between two scans
+    DEFAULT_PAUSES = {
+        const.ScanDemand.low: 10.0,
+        const.ScanDemand.normal: 0.5,
+        const.ScanDemand.high: 0.25, # leaves gaps for the GATT procedures waiting for the radio
+    }
+
+    def __init__(self, window, pauses=None, statsPeriod=60):
+        self.window = window
+        self.pauses = dict(pauses or self.DEFAULT_PAUSES)
+        self.statsPeriod = statsPeriod
+        self._demand = const.ScanDemand.normal
+        self._pausedCount = 0
+        self._lastScanEnd = 0
+        self._scans = collections.deque()  # (start, end) of recent scans
+        self._startTime = time.time()
+        self._cond = threading.Condition(threading.Lock())
+
+    def setDemand(self, demand):
+        demand = const.ScanDemand(demand)
+        with self._cond:
+            if demand != self._demand:
+                self.log.info("Scan demand changed to {!r} ({:.0%} of the radio time spent scanning)".format(
+                    demand.value, self._getScanFraction()))
+                self._demand = demand
+                self._cond.notify_all()
+
+    def getDemand(self):
+        return self._demand
+
+    @contextlib.contextmanager
+    def paused(self):
+        """No new scans are started while in this context."""
+        with self._cond:
+            self._pausedCount += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._pausedCount -= 1
+                self._cond.notify_all()
+
+    def waitForSlot(self):
+        """Blocks until the next scan may start."""
+        with self._cond:
+            while True:
+                if self._pausedCount:
+                    self._cond.wait()
+                    continue
+                dt = self._lastScanEnd + self.pauses[self._demand] - time.time()
+                if dt <= 0:
+                    return
+                self._cond.wait(dt)
+
+    @contextlib.contextmanager
+    def scanning(self):
+        """The scan thread uses the radio while in this context."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            end = time.time()
+            with self._cond:
+                self._lastScanEnd = end
+                self._scans.append((start, end))
+                while self._scans and self._scans[0][1] < end - self.statsPeriod:
+                    self._scans.popleft()
+
+    def getScanFraction(self):
+        """Returns fraction of the radio time spent scanning during the last `statsPeriod` seconds."""
+        with self._cond:
+            return self._getScanFraction()
+
+    def getStats(self):
+        with self._cond:
+            return {
+                "demand": self._demand.value,
+                "paused": bool(self._pausedCount),
+                "scan_fraction": self._getScanFraction(),
+            }
+
+    def _getScanFraction(self):
+        now = time.time()
+        periodStart = max(now - self.statsPeriod, self._startTime)
+        if now <= periodStart:
+            return 0.0
+        scanTime = sum(
+            max(0, min(end, now) - max(start, periodStart))
+            for (start, end) in self._scans
+        )
+        return scanTime / (now - periodStart)
+
+
+class ScanWhitelist(object):
+    """Address filter for the scan results.
+
+    When a whitelist is set, only the adverts of the whitelisted addresses are inspected,
+    except for a single unfiltered "discovery" scan every `discoveryPeriod` seconds
+    (that finds new microbots).
+    """
+
+    def __init__(self, discoveryPeriod=60):
+        self.discoveryPeriod = discoveryPeriod
+        self._addresses = None
+        self._changed = False
+        self._discovering = True
+        self._nextDiscovery = 0
+        self._mutex = threading.Lock()
+
+    def set(self, addresses):
+        """Sets the whitelisted addresses (`None` disables the filtering)."""
+        if addresses is not None:
+            addresses = frozenset(addresses)
+        with self._mutex:
+            if addresses != self._addresses:
+                self._addresses = addresses
+                self._changed = True
+
+    def get(self):
+        return self._addresses
+
+    def takeUpdate(self):
+        """Returns `(changed, addresses)`. Resets the `changed` flag."""
+        with self._mutex:
+            rv = (self._changed, self._addresses)
+            self._changed = False
+            return rv
+
+    def startScan(self):
+        """Called before every scan. Returns `True` if the scan has to be unfiltered."""
+        now = time.time()
+        with self._mutex:
+            self._discovering = (self._addresses is None) or (now >= self._nextDiscovery)
+            if self._discovering and self._addresses is not None:
+                self._nextDiscovery = now + self.discoveryPeriod
+            return self._discovering
+
+    def accepts(self, address):
+        """Returns `True` if the advert from the `address` has to be inspected during the current scan."""
+        addresses = self._addresses
+        return self._discovering or addresses is None or address in addresses
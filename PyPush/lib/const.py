@@ -15,4 +15,12 @@ class ButtonMode(enum.IntEnum):
     """
 
     default = 0x00 # retracted by default, extends when user touches the button
-    inverted = 0x01 # extended by default, retracts when user toucher the button
\ No newline at end of file
+    inverted = 0x01 # extended by default, retracts when user toucher the button
+
+@enum.unique
+class ScanDemand(enum.Enum):
+    """How eagerly the BLE scanner should look for microbots."""
+
+    low = "low" # all paired microbots are connected, only new ones can appear
+    normal = "normal"
+    high = "high" # some paired microbots are missing and being reconnected
@@ -11,6 +11,9 @@ class Timeout(PyPushException):
 class StateChangeError(Timeout):
     """This exception is raised when microbot's state is not as expected."""
 
+class Cancelled(PyPushException):
+    """The asynchronous call was cancelled before it started."""
+
 class ConnectionError(PyPushException):
     """Generic connection error."""
 
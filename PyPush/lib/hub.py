@@ -1,5 +1,6 @@
 import threading
 import datetime
+import time
 import Queue
 
 from . import (
@@ -8,22 +9,42 @@ from . import (
     microbot,
     exceptions,
     async,
+    retry,
+    stats,
 )
 
 
+def _readMicrobotState(mb):
+    """Returns dict of the status values of the microbot."""
+    mb.prefetchState()
+    return {
+        "retracted": mb.isRetracted(),
+        "battery": mb.getBatteryLevel(),
+        "calibration": mb.getCalibration(),
+        "button_mode": mb.getButtonMode(),
+    }
+
+
 class PushHub(iLib.iHub):
 
+    # Max number of microbots the group operations talk to at the same time
+    DEFAULT_FLEET_CONCURRENCY = 4
+
     def __init__(self, bleConfig, keyDb, maxMicrobotAge=24 * 60 * 60):
         self._maxAge = maxMicrobotAge
         self._keyDb = keyDb
         self._mutex = threading.RLock()
         self._microbots = {}  # uid -> microbot object
+        self._fleetSlots = threading.BoundedSemaphore(
+            bleConfig.get("max_connections", self.DEFAULT_FLEET_CONCURRENCY))
 
         self._newMbCbs = async.SubscribeHub()
         self._lostMbCbs = async.SubscribeHub()
 
+        self._whitelistScan = bleConfig.get("scan_whitelist", False)
         self._ble = ble.getLib(bleConfig)
         self._ble.onScan(self._onBleScan)
+        self._ble.onLost(self._onBleLost)
         self._gcMicrobots()
         self._started = False
 
@@ -31,6 +52,7 @@ class PushHub(iLib.iHub):
         """Start daemon threads."""
         self._ble.start()
         self._started = True
+        self.refreshScanWhitelist()
 
     def onMicrobot(self, onDiscovered, onLost):
         handles = []
@@ -90,6 +112,80 @@ class PushHub(iLib.iHub):
     def getAllMicrobots(self):
         return self._microbots.values()
 
+    def scanPaused(self):
+        return self._ble.scanPaused()
+
+    def setScanDemand(self, demand):
+        self._ble.setScanDemand(demand)
+
+    def getScanStats(self):
+        return self._ble.getScanStats()
+
+    def refreshScanWhitelist(self):
+        if self._whitelistScan and self._started:
+            uids = self._keyDb.getAllUids()
+            # `None` if the key storage can not list its microbots: the whitelist is disabled
+            self._ble.setScanWhitelist(None if uids is None else tuple(uids))
+
+    def broadcast(self, uids, action, args=(), kwargs=None, timeout=None):
+        kwargs = kwargs or {}
+        return self._fanOut(uids, lambda mb: getattr(mb, action)(*args, **kwargs), timeout)
+
+    def collectState(self, uids=None, timeout=None):
+        return self._fanOut(uids, _readMicrobotState, timeout)
+
+    def pressAll(self, uids=None, holdSeconds=1.5, timeout=None):
+        return self.broadcast(uids, "press", (holdSeconds, ), timeout=timeout)
+
+    def _fanOut(self, uids, fn, timeout):
+        """Calls `fn(microbot)` for every microbot in `uids` (all connected microbots if `uids` is `None`).
+
+        The calls are executed on the microbots' executors, `_fleetSlots` of them at a time.
+        """
+        start = time.time()
+        with self._mutex:
+            if uids is None:
+                targets = [(uid, mb) for (uid, mb) in self._microbots.iteritems() if mb.isConnected()]
+            else:
+                targets = [(uid, self._microbots.get(uid)) for uid in uids]
+
+        results = {}
+        futures = []
+        with retry.withDeadline(None if timeout is None else start + timeout):
+            for (uid, mb) in targets:
+                if mb is None:
+                    results[uid] = {"result": None, "error": KeyError(uid), "latency": None}
+                else:
+                    futures.append((uid, mb.callAsync(self._callLimited, fn, mb)))
+
+        latency = stats.LatencyStats(window=max(len(targets), 1))
+        for (uid, future) in futures:
+            try:
+                timeLeft = None if timeout is None else max(start + timeout - time.time(), 0)
+                (rv, duration) = future.result(timeLeft)
+            except Exception as err:
+                future.cancel()
+                results[uid] = {"result": None, "error": err, "latency": None}
+            else:
+                latency.add(duration)
+                results[uid] = {"result": rv, "error": None, "latency": duration}
+
+        failed = sum(1 for el in results.itervalues() if el["error"] is not None)
+        return {
+            "results": results,
+            "succeeded": len(results) - failed,
+            "failed": failed,
+            "latency": latency.getSummary(),
+            "elapsed": time.time() - start,
+        }
+
+    def _callLimited(self, fn, mb):
+        """Returns (`fn(mb)`, call duration). Waits for a free fleet slot first."""
+        with self._fleetSlots:
+            callStart = time.time()
+            rv = fn(mb)
+            return (rv, time.time() - callStart)
+
     def _onBleScan(self, bleMicrobot):
         uid = bleMicrobot.getUID()
         isNew = False
@@ -106,6 +202,17 @@ class PushHub(iLib.iHub):
             # Execute callbacks for the 'new microbot' event
             self._newMbCbs.fireSubscribers(mb)
 
+    def _onBleLost(self, bleMicrobot):
+        """Forget the microbot that is no longer seen by the BLE scanner (unless connected)."""
+        uid = bleMicrobot.getUID()
+        with self._mutex:
+            mb = self._microbots.get(uid)
+            if mb is None or mb.isConnected():
+                return
+            self._microbots.pop(uid)
+
+        self._lostMbCbs.fireSubscribers(mb)
+
     _gcTimer = None
 
     def _gcMicrobots(self):
@@ -120,8 +227,10 @@ class PushHub(iLib.iHub):
             for (key, mb) in self._microbots.iteritems():
                 if mb.getLastSeen() < cutoff:
                     toDelete.append(key)
-            for key in toDelete:
-                self._microbots.pop(key)
+            lost = [self._microbots.pop(key) for key in toDelete]
+
+        for mb in lost:
+            self._lostMbCbs.fireSubscribers(mb)
 
         # Schedule next execution
         self._gcTimer = threading.Timer(self._maxAge / 4, self._gcMicrobots)
@@ -32,6 +32,23 @@ class iPairingKeyStorage(object):
     def delete(self, uid):
         """Deletes pairing key for `uid` if existed. Silently returns if there was no such key."""
 
+    def getAllUids(self):
+        """Returns UIDs of all microbots that have a pairing key.
+
+        Listing the UIDs is optional, `None` disables the scan whitelist.
+        """
+        return None
+
+    def getFirmwareVersion(self, uid):
+        """Returns firmware version tuple stored for the `uid` (`None` if unknown).
+
+        Storing the firmware version is optional.
+        """
+        return None
+
+    def setFirmwareVersion(self, uid, version):
+        """Stores firmware version tuple of the `uid` (`None` forgets the version)."""
+
 
 class iHub(object):
     """Microbot management hub. Top-level interface for this library."""
@@ -64,6 +81,48 @@ class iHub(object):
     def getAllMicrobots(self):
         """Returns an interable of all microbots currently known to the system."""
 
+    @abstractmethod
+    def scanPaused(self):
+        """Returns a context that suspends BLE scanning (e.g. while a user-initiated action is in flight)."""
+
+    @abstractmethod
+    def setScanDemand(self, demand):
+        """Sets <const.ScanDemand> that determines how much of the radio time is spent scanning."""
+
+    @abstractmethod
+    def getScanStats(self):
+        """Returns dict of the scan scheduler state (incl. fraction of the radio time spent scanning)."""
+
+    @abstractmethod
+    def refreshScanWhitelist(self):
+        """Reloads paired microbots from the pairing key storage into the scan whitelist.
+
+        Does nothing unless the whitelist scan mode is enabled.
+        """
+
+    @abstractmethod
+    def broadcast(self, uids, action, args=(), kwargs=None, timeout=None):
+        """Calls microbot method named `action` on every microbot in `uids` concurrently.
+
+        `uids` of `None` stands for all connected microbots. Returns dict of
+            "results" - uid -> {"result", "error" (exception or `None`), "latency" (seconds)},
+            "succeeded" & "failed" - counts of the calls,
+            "latency" - latency summary of the successful calls,
+            "elapsed" - duration of the whole group operation.
+        Calls that do not complete within `timeout` seconds fail with <exceptions.Timeout>.
+        """
+
+    @abstractmethod
+    def collectState(self, uids=None, timeout=None):
+        """Reads status (retracted, battery, calibration, button mode) of the microbots.
+
+        Returns the same structure as `broadcast` does.
+        """
+
+    @abstractmethod
+    def pressAll(self, uids=None, holdSeconds=1.5, timeout=None):
+        """Presses with all of the microbots. Returns the same structure as `broadcast` does."""
+
 class iMicrobot(object):
     """High-level microbot interface."""
 
@@ -73,6 +132,18 @@ class iMicrobot(object):
     def getLastSeen(self):
         """Returns datetime when this microbot had shown signs of life for the last time."""
 
+    @abstractmethod
+    def getRssi(self):
+        """Returns smoothed RSSI (dBm) of the microbot's adverts (`None` if unknown)."""
+
+    @abstractmethod
+    def getAdvertRate(self):
+        """Returns smoothed number of the microbot's adverts received per second (`None` if unknown)."""
+
+    @abstractmethod
+    def getLinkScore(self):
+        """Returns sortable link quality estimate (greater is better)."""
+
     @abstractmethod
     def getName(self):
         """Returns name of this microbot."""
@@ -113,6 +184,48 @@ class iMicrobot(object):
     def retract(self):
         """Retract microbot's pusher."""
 
+    @abstractmethod
+    def callAsync(self, fn, *args, **kwargs):
+        """Executes `fn(*args, **kwargs)` in order with the other *Async calls of this microbot.
+
+        Returns <async.Future> of the call.
+        """
+
+    @abstractmethod
+    def extendAsync(self):
+        """Asynchronous `extend`.
+
+        The *Async methods return <async.Future> of the call. The calls are executed in order,
+        one at a time per microbot (calls to different microbots run in parallel).
+        """
+
+    @abstractmethod
+    def retractAsync(self):
+        """Asynchronous `retract`."""
+
+    @abstractmethod
+    def pressAsync(self, holdSeconds):
+        """Asynchronous `press`."""
+
+    @abstractmethod
+    def ledAsync(self, r, g, b, duration):
+        """Asynchronous `led`."""
+
+    @abstractmethod
+    def getBatteryLevelAsync(self):
+        """Asynchronous `getBatteryLevel`."""
+
+    @abstractmethod
+    def pairAsync(self):
+        """Asynchronous `pair` (the future completes when the pairing is over)."""
+
+    @abstractmethod
+    def press(self, holdSeconds):
+        """Extend the pusher, hold it for `holdSeconds` and retract it (without releasing the connection).
+
+        Returns dict of the "extend", "hold", "retract" and "total" durations (in seconds).
+        """
+
     @abstractmethod
     def isRetracted(self):
         """Return `True` if the arm is retracted."""
@@ -145,10 +258,26 @@ class iMicrobot(object):
         Colours returned coincide wit the colours microbot's LED is showing at the moment.
         """
 
+    @abstractmethod
+    def startPairing(self, timeout=None):
+        """Starts pairing with this microbot without blocking the caller.
+
+        The session fails if the user does not touch the microbot within `timeout` seconds (if set).
+
+        Returns a pairing session object (`done()`, `wait(timeout)`, `getColour()`, `cancel()`).
+        The session's `result()` completes the pairing (raising `NotPaired` if it has failed).
+
+        Several sessions may run concurrently.
+        """
+
     @abstractmethod
     def onStateChange(self, cb):
         """Registers a new callback that will be fired whenever this microbot object experiences a change of state."""
 
+    @abstractmethod
+    def refreshFirmwareVersion(self):
+        """Re-reads the firmware version from the device, bypassing the firmware version cache."""
+
     @abstractmethod
     def getFirmwareVersion(self):
         """Returns microbot's firmware version (3-element tuple)."""
@@ -160,3 +289,33 @@ class iMicrobot(object):
     @abstractmethod
     def setButtonMode(self, state):
         """Accepts <const.ButtonMode> element as an argument, sets the button mode."""
+
+    @abstractmethod
+    def setConnectionProfile(self, name):
+        """Switches the BLE link to the "interactive" (low-latency) or "idle" (low-power) parameters.
+
+        The "interactive" profile falls back to "idle" when the microbot is not used for a while.
+        """
+
+    @abstractmethod
+    def getConnectionProfile(self):
+        """Returns name of the current BLE connection profile."""
+
+    @abstractmethod
+    def prefetchState(self):
+        """Reads all status values of the microbot in one batch.
+
+        Successive status getters are served from the cache.
+        """
+
+    @abstractmethod
+    def getReadCacheStats(self):
+        """Returns dict of the hit/miss/stale counters of the cached status values."""
+
+    @abstractmethod
+    def getConnectStats(self):
+        """Returns "connect", "reconnect" & "time_to_ready" latency summaries (incl. "histogram") of this microbot."""
+
+    @abstractmethod
+    def getLinkState(self):
+        """Returns "disconnected", "ready", "reconnecting" or "closed"."""
@@ -15,6 +15,16 @@ def populate_arg_parser(parser):
         default="/dev/tty.usbmodem*",
         help="BLE device"
     )
+    parser.add_argument(
+        "--ble_gatt_cache",
+        default=None,
+        help="File to persist discovered GATT attribute tables in (bluegiga driver only)."
+    )
+    parser.add_argument(
+        "--ble_scan_whitelist",
+        action="store_true",
+        help="Inspect adverts of the paired microbots only (plus a periodic discovery scan for new ones)."
+    )
     return parser
 
 def create(debug, pairDb, args):
@@ -38,5 +48,7 @@ def create(debug, pairDb, args):
     config = {
         "driver": driver,
         "device": dev,
+        "gatt_cache": args.ble_gatt_cache,
+        "scan_whitelist": args.ble_scan_whitelist,
     }
     return PyPush.lib.PushHub(config, pairDb)
\ No newline at end of file
@@ -1 +1 @@
-from .microbot import MicrobotPush
\ No newline at end of file
+from .microbot import MicrobotPush, rankByLinkQuality
\ No newline at end of file
@@ -28,50 +28,94 @@ class iFwApi(object):
 class FirmwareBase(iFwApi):
     """Base class for firmware overlays."""
 
+    # (service, characteristic) pairs that hold pusher state on this firmware.
+    STATE_CHARACTERISTICS = ()
+
     def __init__(self, microbot):
         self.mb = microbot
         self.reader = self.mb.reader
 
 class FirmwareV010(FirmwareBase):
-    """v 1.0"""
+    """v 1.0
+
+    This firmware does not report the pusher state. The overlay forces the pusher to retract
+    on init and tracks notifications of the extend (2A11) & retract (2A12) commands afterwards.
+
+    State machine: "unknown" -> "initialising" (retract forced) -> "ready"
+    (on the first command notification or after `INIT_TIMEOUT` seconds).
+    """
 
-    _retractedState = None
-    _isRetracted = None
+    INIT_TIMEOUT = 2 # seconds to wait for the forced retract
+    MOVE_TIME = 1 # seconds the pusher takes to move after the command notification
+
+    UNKNOWN = "unknown"
+    INITIALISING = "initialising"
+    READY = "ready"
 
     log = logging.getLogger(__name__)
 
     def __init__(self, *args, **kwargs):
         super(FirmwareV010, self).__init__(*args, **kwargs)
         self.retractedStateChange = async.SubscribeHub()
+        self._state = self.UNKNOWN
+        self._isRetracted = True # The pusher is retracted on init
+        self._settleTime = 0
+        self._ready = threading.Event()
+        self._stateMutex = threading.Lock()
 
-    def isRetracted(self):
+        srv = const.PushServiceId
+        self.reader.callbacks[(srv, "2A11")].subscribe(lambda *a, **kw: self._setRetracted(False))
+        self.reader.callbacks[(srv, "2A12")].subscribe(lambda *a, **kw: self._setRetracted(True))
+
+    def getState(self):
+        return self._state
+
+    def isRetracted(self, timeout=None):
         """Old firmware: use status register(s)"""
-        with self.mb._mutex:
-            if self._retractedState is None:
-                self._retractedState = {
-                    "is_retracted": True,
-                }
-
-                def _setRetracted(val):
-                    oldVal = self._retractedState["is_retracted"]
-                    self.log.debug("Retracted := {} (old = {})".format(val, oldVal))
-                    self._retractedState["is_retracted"] = val
-                    if val != oldVal:
-                        time.sleep(1)
-                        self.retractedStateChange.fireSubscribers(oldVal, val)
-                        self.mb._fireChangeState()
-
-                srv = const.PushServiceId
-                self.reader.callbacks[(srv, "2A11")].subscribe(lambda *a, **kw: _setRetracted(False))
-                self.reader.callbacks[(srv, "2A12")].subscribe(lambda *a, **kw: _setRetracted(True))
-
-                self.reader.read(srv, "2A11") # Calling 'read' also subscribes for the event notifications
-                self.reader.read(srv, "2A12") # Calling 'read' also subscribes for the event notifications
-                
-                self.mb._conn().write(srv, "2A12", '\x01') # Force microbot to retract on init.
-                time.sleep(2) # give it time to react
-
-        return self._retractedState["is_retracted"]
+        if not self.waitReady(self.INIT_TIMEOUT if timeout is None else timeout):
+            with self._stateMutex:
+                if self._state == self.INITIALISING:
+                    # No notification arrived, the pusher must have been retracted already.
+                    self._state = self.READY
+                    self._ready.set()
+        return self._isRetracted
+
+    def waitReady(self, timeout):
+        """Initialises the overlay. Returns `True` if the pusher state is known within `timeout` seconds."""
+        self._initialise()
+        return self._ready.wait(timeout)
+
+    def _initialise(self):
+        with self._stateMutex:
+            if self._state != self.UNKNOWN:
+                return
+            self._state = self.INITIALISING
+
+        srv = const.PushServiceId
+        try:
+            self.reader.read(srv, "2A11") # Calling 'read' also subscribes for the event notifications
+            self.reader.read(srv, "2A12") # Calling 'read' also subscribes for the event notifications
+            self.mb._conn().write(srv, "2A12", '\x01') # Force microbot to retract on init.
+        except Exception:
+            with self._stateMutex:
+                if self._state == self.INITIALISING:
+                    self._state = self.UNKNOWN
+            raise
+
+    def _setRetracted(self, val):
+        """Command notification callback (executed on the notification thread)."""
+        with self._stateMutex:
+            oldVal = self._isRetracted
+            self.log.debug("Retracted := {} (old = {})".format(val, oldVal))
+            self._isRetracted = val
+            self._settleTime = time.time() + self.MOVE_TIME
+            if self._state == self.INITIALISING:
+                self._state = self.READY
+        self._ready.set()
+
+        if val != oldVal:
+            self.retractedStateChange.fireSubscribers(oldVal, val)
+            self.mb._fireChangeState()
 
     @contextlib.contextmanager
     def waitForPusherStateChange(self, timeout=20):
@@ -92,9 +136,18 @@ class FirmwareV010(FirmwareBase):
         if not evtSet:
             raise exceptions.StateChangeError("Pusher change did not happen.")
 
+        # Let the pusher complete its movement
+        delay = self._settleTime - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
 class FirmwareV015(FirmwareBase):
     """v 1.5"""
 
+    STATE_CHARACTERISTICS = (
+        (const.PushServiceId, const.DeviceStatus),
+    )
+
     def isRetracted(self):
         """ New firmware api: use DeviceStatus register """
         status = self.reader.read(const.PushServiceId, const.DeviceStatus)
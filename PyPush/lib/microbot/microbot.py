@@ -17,14 +17,15 @@ from .. import (
     exceptions,
     const,
     async,
+    stats,
 )
 
 from ..ble import exceptions as bleExceptions
 
-from .subscribingReader import SubscribingReader
+from .subscribingReader import SubscribingReader, FreshnessPolicy
 from .stableConnection import StableAuthorisedConnection
 
-from . import fwMicrobot
+from . import fwMicrobot, pairing
 
 LedStatus = collections.namedtuple("LedStatus", ["r", "g", "b"])
 
@@ -58,6 +59,51 @@ def NotConnectedApi(fn):
 
     return _wrapper_
 
+# (service, characteristic) pairs read on every status refresh.
+STATUS_CHARACTERISTICS = (
+    (const.MicrobotServiceId, "2A19"), # battery
+    (const.MicrobotServiceId, "2A21"), # firmware version
+    (const.PushServiceId, const.DeviceCalibration),
+    (const.PushServiceId, "2A53"), # button mode
+)
+
+# Freshness of the cached values (characteristics not listed here are kept up to date by notifications).
+READ_POLICIES = {
+    (const.MicrobotServiceId, "2A19"): FreshnessPolicy(maxAge=15 * 60, notify=True), # battery
+    (const.MicrobotServiceId, "2A21"): FreshnessPolicy(maxAge=None, notify=False), # firmware version never changes
+}
+
+def rankByLinkQuality(microbots):
+    """Returns list of the `microbots` ordered from the best to the worst link quality."""
+    return sorted(microbots, key=lambda mb: mb.getLinkScore(), reverse=True)
+
+class FirmwareCache(object):
+    """Thread-safe in-memory cache of the firmware versions (microbot UID -> version tuple)."""
+
+    def __init__(self):
+        self._versions = {}
+        self._mutex = threading.Lock()
+
+    def get(self, uid):
+        with self._mutex:
+            return self._versions.get(uid)
+
+    def set(self, uid, version):
+        with self._mutex:
+            self._versions[uid] = version
+
+    def invalidate(self, uid):
+        with self._mutex:
+            self._versions.pop(uid, None)
+
+# Firmware is almost never changed, so its version is read once per device
+#   (and persisted with the pairing key storage).
+FIRMWARE_CACHE = FirmwareCache()
+
+def _isFirmwareVersion(value):
+    return isinstance(value, (tuple, list)) and len(value) == 3 and \
+        all(isinstance(el, (int, long)) for el in value)
+
 def get_firmware_version(connection):
     """Acquire firmware version tuple from the connection."""
     data = connection.read(const.MicrobotServiceId, "2A21")
@@ -81,62 +127,142 @@ class MicrobotPush(iLib.iMicrobot):
         self._bleMb = bleMicrobot
         self._keyDb = keyDb
         self._mutex = threading.RLock()
+        # Serialises the pusher movements (the state readers are not blocked by a press)
+        self._pusherLock = threading.RLock()
         self._onChangeCbs = async.SubscribeHub()
-        self.reader = SubscribingReader(self)
+        self.reader = SubscribingReader(self, READ_POLICIES)
         self._fwOverlay = None
+        self._pairKey = None # pairing key of the current session
+        self._connectStats = {
+            "connect": stats.LatencyStats(),
+            "reconnect": stats.LatencyStats(),
+            "time_to_ready": stats.LatencyStats(), # from the link drop till the restored connection
+        }
+        # Executes the *Async calls (commands to the microbot are executed in order)
+        self._executor = async.SerialExecutor(self.getUID())
 
     @NotConnectedApi
     def connect(self):
         with self._mutex:
             if self.isPaired():
                 self._stableConn = StableAuthorisedConnection(
-                    self, self._sneakyConnect())
+                    self, self._sneakyConnect(), readyStats=self._connectStats["time_to_ready"])
             else:
                 raise exceptions.NotPaired(0xFE, "This connection is not paired.")
         self._fireChangeState()
 
-    def _sneakyConnect(self):
+    def _sneakyConnect(self, reconnect=False, owner=None):
         """Private connect procedure that does not validate preexisting connection state.
 
         Used in the `connect()` API endpoint and in the implementation
         of stable connection object.
 
+        The `reconnect` path reuses pairing key and firmware overlay of the previous session.
+        It is executed by the reconnect supervisor thread, so the microbot's mutex is not taken here
+        (callers holding it may be waiting for the link). The session state (pairing key & firmware overlay)
+        is published through the `owner` <StableAuthorisedConnection> instead, so a concurrent `disconnect()`
+        is not undone. The connection is returned closed if the `owner` has been closed meanwhile.
+
         Returns naked BLE connection.
         """
-        self.log.info("Connecting.")
+        self.log.info("Reconnecting." if reconnect else "Connecting.")
         uid = self.getUID()
+        start = time.time()
 
-        with self._mutex:
+        if reconnect and self._pairKey and self._fwOverlay:
+            key = self._pairKey
+            fwVersion = None
+            conn = self._bleApi.connect(self._bleMb)
+        else:
+            reconnect = False
             if not self._keyDb.hasKey(uid):
                 raise exceptions.NotPaired(None, "Pairing DB has no key for this device (uid {!r}).".format(
                     uid))
 
             key = self._keyDb.get(uid)
+            # Storage is accessed outside of the BLE transaction
+            fwVersion = self._getCachedFirmwareVersion()
             conn = self._bleApi.connect(self._bleMb)
-            self._updateFwOverlay(conn)
 
+        try:
+            published = self._authoriseConnection(conn, uid, key, fwVersion, reconnect, owner)
+        except Exception:
+            # (Nothing references the connection yet)
+            conn.close()
+            raise
+
+        if not published:
+            self.log.info("Connection closed while connecting.")
+            conn.close()
+            return conn
+        self._connectStats["reconnect" if reconnect else "connect"].add(time.time() - start)
+        return conn
+
+    def _authoriseConnection(self, conn, uid, key, fwVersion, reconnect, owner):
+        """Validates the pairing `key` over `conn` & publishes the session.
+
+        Returns `False` if the `owner` has been closed meanwhile.
+        """
+        if reconnect or fwVersion is not None:
             status = self._checkStatus(conn, key)
+        else:
+            # The firmware version is read while the device is validating the key.
+            fwRead = []
+            status = self._checkStatus(conn, key, lambda: fwRead.append(get_firmware_version(conn)))
+            if fwRead:
+                fwVersion = fwRead[0]
+                self._storeFirmwareVersion(fwVersion)
 
-            if status == 0x01:
-                # Connection sucessful
-                msg = None
-            elif status == 0x02:
-                msg = "Unitialised microbot."
-            elif status == 0x03:
-                msg = "Pairing key mismatch."
-            else:
-                msg = "Unexpected status 0x{:02X}".format(status)
+        if status == 0x01:
+            # Connection sucessful
+            msg = None
+        elif status == 0x02:
+            msg = "Unitialised microbot."
+        elif status == 0x03:
+            msg = "Pairing key mismatch."
+        else:
+            msg = "Unexpected status 0x{:02X}".format(status)
 
-            if msg is not None:
-                # Connection not sucessful
-                conn.close()
-                if self.isPaired():
-                    self._keyDb.delete(uid)
-                    # This changes 'isPaired' status
-                    self._fireChangeState() 
-                raise exceptions.NotPaired(status, msg)
+        if msg is not None:
+            # Connection not sucessful
+            conn.close()
+            self._pairKey = None
+            if status not in (0x02, 0x03):
+                # The cached firmware version might be the cause of the error
+                self._forgetFirmwareVersion()
+            if self.isPaired():
+                self._keyDb.delete(uid)
+                # This changes 'isPaired' status
+                self._fireChangeState() 
+            raise exceptions.NotPaired(status, msg)
+
+        return self._publishSession(owner, key, None if reconnect else fwVersion)
+
+    def _publishSession(self, owner, key, fwVersion):
+        """Stores the pairing key & firmware overlay of the session. Returns `False` if the `owner` is closed."""
+        def _publish():
+            self._pairKey = key
+            if fwVersion is not None:
+                self._setFwOverlay(fwVersion)
+
+        if owner is None:
+            _publish()
+            return True
+        return owner.publish(_publish)
+
+    def getConnectStats(self):
+        rv = {}
+        for (name, stat) in self._connectStats.iteritems():
+            rv[name] = stat.getSummary()
+            rv[name]["histogram"] = stat.getHistogram()
+        return rv
 
-            return conn
+    def getLinkState(self):
+        with self._mutex:
+            stableConn = self._stableConn
+        if stableConn is None:
+            return "disconnected"
+        return stableConn.getState()
 
     def disconnect(self):
         with self._mutex:
@@ -144,9 +270,34 @@ class MicrobotPush(iLib.iMicrobot):
                 self.reader.clear()
                 self._stableConn.close()
                 self._stableConn = None
+            # (After closing the connection, so a reconnect in progress can not publish the key again)
+            self._pairKey = None
 
     @NotConnectedApi
     def pair(self):
+        """Pairs with the microbot, yielding the LED colour the microbot shows while waiting for the user's touch."""
+        session = self.startPairing()
+        lastColour = None
+        try:
+            while not session.done():
+                colour = session.getColour()
+                if colour is not None and colour is not lastColour:
+                    # (Once per LED colour change)
+                    lastColour = colour
+                    yield colour
+                session.wait(session.LED_PERIOD / 10.0)
+        except GeneratorExit:
+            session.cancel()
+            raise
+        session.result()
+
+    @NotConnectedApi
+    def startPairing(self, timeout=None):
+        """Starts a pairing session. Returns <pairing.PairingSession>.
+
+        The session does not block the BLE connection while waiting for the user's touch.
+        It fails if the user does not touch the microbot within `timeout` seconds (if set).
+        """
         self.log.info("Pairing with {!r}".format(self._bleMb))
 
         conn = self._bleApi.connect(self._bleMb)
@@ -155,61 +306,23 @@ class MicrobotPush(iLib.iMicrobot):
             # Uninitialised microbot
             pass
         else:
+            conn.close()
             raise exceptions.NotPaired(
                 status, "Microbot is not pairable (status 0x{:02X})".format(status))
 
-        SERVICE_ID = const.MicrobotServiceId
-        PAIR_CH = "2A90"
-        HOST_UID = self._getHostUUID()
-        _DATA_QUEUE_ = Queue.Queue()
-
-        with conn.transaction():
-            handle = conn.onNotify(SERVICE_ID, PAIR_CH, _DATA_QUEUE_.put)
-            # send host's handshake
-            send_data = chr(len(HOST_UID)) + HOST_UID
-            data_part1 = send_data[:20]
-            data_part2 = "\x00" + send_data[20:]
-            conn.write(SERVICE_ID, PAIR_CH, data_part1)
-            conn.write(SERVICE_ID, PAIR_CH, data_part2)
-            self.log.info(
-                "Pairing data sent. Waiting for user to touch the button.")
-            ITER_PERIOD = 5
-            for colour in itertools.cycle(self._getPairColourSequence()):
-                iterStart = time.time()
-                self._sneakyLed(
-                    colour.r,
-                    colour.g,
-                    colour.b,
-                    ITER_PERIOD,
-                    conn)
-                yield colour
-                timeRemains = max(ITER_PERIOD - (time.time() - iterStart), 0.1)
-                try:
-                    pairData = _DATA_QUEUE_.get(timeout=timeRemains)
-                except Queue.Empty:
-                    pass
-                else:
-                    # pair data acquired
-                    break
-
-        status = ord(pairData[0])
-        key = pairData[1:]
-        assert len(key) >= 16, repr(key)
+        session = pairing.PairingSession(self, conn, timeout)
+        session.start()
+        return session
 
-        if status == 0x01:
-            # Pairing sucessfull.
-            self._keyDb.set(self.getUID(), key[:16])
+    def _completePairing(self, conn, key):
+        """Called by the pairing session when the microbot accepts the pairing."""
+        with self._mutex:
+            self._keyDb.set(self.getUID(), key)
+            self._pairKey = key
             self._updateFwOverlay(conn)
-            self._stableConn = StableAuthorisedConnection(self, conn)
-            self._fireChangeState()
-        else:
-            conn.close()
-            if status == 0x04:
-                raise exceptions.NotPaired(
-                    status, "User did not touch the microbot")
-            else:
-                raise exceptions.NotPaired(
-                    status, "Unexpected status 0x{:02X}".format(status))
+            self._stableConn = StableAuthorisedConnection(
+                self, conn, readyStats=self._connectStats["time_to_ready"])
+        self._fireChangeState()
 
     @ConnectedApi
     def led(self, r, g, b, duration):
@@ -241,7 +354,7 @@ class MicrobotPush(iLib.iMicrobot):
             self.log.info("The pusher is already extended.")
             return
 
-        with self._mutex:
+        with self._pusherLock:
             self.log.info("Extending the pusher.")
             try:
                 with self._waitForPusherStateChange():
@@ -263,7 +376,7 @@ class MicrobotPush(iLib.iMicrobot):
             self.log.info("The pusher is already retracted")
             return
 
-        with self._mutex:
+        with self._pusherLock:
             self.log.info("Retracting the pusher.")
             try:
                 with self._waitForPusherStateChange():
@@ -277,6 +390,69 @@ class MicrobotPush(iLib.iMicrobot):
             if not self.isRetracted():
                 raise exceptions.IOError("Device is not retracted although the retract command had been sent.")
 
+    @ConnectedApi
+    def press(self, holdSeconds=1.5):
+        """Press the button: extend, hold & retract the pusher.
+
+        The sequence is serialised with the other pusher movements by the pusher lock only,
+        so the state of this object can be read during the press. The connection transaction is not held:
+        it would lock the radio for the whole hold time and deadlock with the supervisor
+        restoring a link that drops mid-press.
+        """
+        with self._pusherLock:
+            self.log.info("Pressing for {} seconds.".format(holdSeconds))
+            start = time.time()
+            self.extend()
+            extended = time.time()
+            time.sleep(holdSeconds)
+            held = time.time()
+            self.retract()
+            end = time.time()
+
+        return {
+            "extend": extended - start,
+            "hold": held - extended,
+            "retract": end - held,
+            "total": end - start,
+        }
+
+    def callAsync(self, fn, *args, **kwargs):
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def extendAsync(self):
+        return self._executor.submit(self.extend)
+
+    def retractAsync(self):
+        return self._executor.submit(self.retract)
+
+    def pressAsync(self, holdSeconds=1.5):
+        return self._executor.submit(self.press, holdSeconds)
+
+    def ledAsync(self, r, g, b, duration):
+        return self._executor.submit(self.led, r, g, b, duration)
+
+    def getBatteryLevelAsync(self):
+        return self._executor.submit(self.getBatteryLevel)
+
+    def pairAsync(self):
+        """The executor is not occupied while the microbot is waiting for the user's touch.
+
+        Cancelling the future cancels the pairing session.
+        """
+        rv = async.Future()
+
+        def _onStarted(startFuture):
+            if startFuture.cancelled() or startFuture.exception() is not None:
+                rv.chain(startFuture)
+                return
+            session = startFuture.result()
+            rv.addDoneCallback(lambda future: future.cancelled() and session.cancel())
+            # The pairing is completed by the executor (not on the notification thread)
+            session.addDoneCallback(lambda session: rv.chain(self._executor.submit(session.result)))
+
+        self._executor.submit(self.startPairing).addDoneCallback(_onStarted)
+        return rv
+
     def _waitForPusherStateChange(self):
         """This context blocks until pusher's state changes."""
         return self._fwOverlay.waitForPusherStateChange()
@@ -334,7 +510,17 @@ class MicrobotPush(iLib.iMicrobot):
 
     @ConnectedApi
     def getFirmwareVersion(self):
-        return get_firmware_version(self.reader)
+        rv = self._getCachedFirmwareVersion()
+        if rv is None:
+            rv = self.refreshFirmwareVersion()
+        return rv
+
+    @ConnectedApi
+    def refreshFirmwareVersion(self):
+        """Re-reads the firmware version from the device (and updates the cache)."""
+        self._forgetFirmwareVersion()
+        self._updateFwOverlay(self._conn())
+        return self._getCachedFirmwareVersion()
 
     @ConnectedApi
     def getButtonMode(self):
@@ -359,6 +545,22 @@ class MicrobotPush(iLib.iMicrobot):
         self._conn().write(const.PushServiceId, "2A53", data)
         self._fireChangeState()
 
+    @ConnectedApi
+    def setConnectionProfile(self, name):
+        self._conn().setProfile(name)
+
+    @ConnectedApi
+    def getConnectionProfile(self):
+        return self._conn().getProfile()
+
+    @ConnectedApi
+    def prefetchState(self):
+        """Reads all status characteristics of the device in one batch."""
+        self.reader.readMany(self._getStatusKeys())
+
+    def getReadCacheStats(self):
+        return self.reader.getStats()
+
     @ConnectedApi
     def DEBUG_getFullState(self):
         """THIS IS DEBUG METHOD FOR ACQUIRING COMPLETE STATE OF ALL READABLE CHARACTERISTICS OF THE MICROBOT."""
@@ -379,6 +581,15 @@ class MicrobotPush(iLib.iMicrobot):
             rv = max(rv, self._conn().getLastActiveTime())
         return rv
 
+    def getRssi(self):
+        return self._bleMb.getRssi()
+
+    def getAdvertRate(self):
+        return self._bleMb.getAdvertRate()
+
+    def getLinkScore(self):
+        return self._bleMb.getLinkScore()
+
     def isConnected(self):
         with self._mutex:
             return bool(self._stableConn and self._stableConn.isActive())
@@ -414,9 +625,16 @@ class MicrobotPush(iLib.iMicrobot):
 
     def _onReconnect(self):
         """Callback executed on reconnection to the microbot."""
-        self.reader.reSubscribe()
+        self.reader.reSubscribe(self._getStatusKeys())
 
-    def _checkStatus(self, bleConnection, pairKey):
+    def _getStatusKeys(self):
+        return STATUS_CHARACTERISTICS + self._fwOverlay.STATE_CHARACTERISTICS
+
+    def _checkStatus(self, bleConnection, pairKey, whileWaiting=None):
+        """Sends the status (authorisation) request and returns the status code.
+
+        `whileWaiting` is called after the request is sent, before waiting for the reply.
+        """
         if not pairKey:
             pairKey = "\x00" * 16
 
@@ -432,15 +650,18 @@ class MicrobotPush(iLib.iMicrobot):
             handle = bleConnection.onNotify(
                 SERVICE_ID, STATUS_CHAR, notifyQ.put)
             bleConnection.write(SERVICE_ID, STATUS_CHAR, data)
-            try:
-                reply = notifyQ.get(timeout=20)
-            except Queue.Empty:
-                self.log.info(
-                    "Failed to check status of {!r}".format(
-                        self._bleMb))
-                return 0xFF
-            finally:
-                handle.cancel()
+        # The connection is not locked while waiting for the reply
+        try:
+            if whileWaiting:
+                whileWaiting()
+            reply = notifyQ.get(timeout=20)
+        except Queue.Empty:
+            self.log.info(
+                "Failed to check status of {!r}".format(
+                    self._bleMb))
+            return 0xFF
+        finally:
+            handle.cancel()
 
         return ord(reply[0])
 
@@ -463,9 +684,40 @@ class MicrobotPush(iLib.iMicrobot):
         )
 
     def _updateFwOverlay(self, connection):
-        """Updates fw overlay in accordance to the firmware version."""
-        fwOverlayCls = self._getFwOverlay(get_firmware_version(connection))
-        self._fwOverlay = fwOverlayCls(self)
+        """Updates fw overlay in accordance to the firmware version.
+
+        The firmware version is read from the device only if it is not cached.
+        """
+        version = self._getCachedFirmwareVersion()
+        if version is None:
+            version = get_firmware_version(connection)
+            self._storeFirmwareVersion(version)
+        self._setFwOverlay(version)
+
+    def _setFwOverlay(self, version):
+        fwOverlayCls = self._getFwOverlay(version)
+        if type(self._fwOverlay) is not fwOverlayCls:
+            self._fwOverlay = fwOverlayCls(self)
+
+    def _storeFirmwareVersion(self, version):
+        FIRMWARE_CACHE.set(self.getUID(), version)
+        self._keyDb.setFirmwareVersion(self.getUID(), version)
+
+    def _getCachedFirmwareVersion(self):
+        uid = self.getUID()
+        rv = FIRMWARE_CACHE.get(uid)
+        if rv is None:
+            rv = self._keyDb.getFirmwareVersion(uid)
+            if _isFirmwareVersion(rv):
+                rv = tuple(rv)
+                FIRMWARE_CACHE.set(uid, rv)
+            else:
+                rv = None
+        return rv
+
+    def _forgetFirmwareVersion(self):
+        FIRMWARE_CACHE.invalidate(self.getUID())
+        self._keyDb.setFirmwareVersion(self.getUID(), None)
 
     def _getFwOverlay(self, fwVersion):
         """This method returns firmware overlay class appropriate for the firmware verison provided."""
@@ -0,0 +1,202 @@
+"""Non-blocking pairing session with a microbot."""
+
+import itertools
+import logging
+import math
+import threading
+
+from .. import const, exceptions
+
+
+class PairingSession(object):
+    """Pairing session driven by the microbot's notifications.
+
+    The BLE connection is only locked while the handshake is sent & while the LED colour is refreshed,
+    so several sessions can run alongside the normal traffic.
+
+    The pairing completes (the key is stored & the microbot becomes connected) when `result()` is called.
+    The session fails if the microbot does not reply within `timeout` seconds (if set).
+    """
+
+    LED_PERIOD = 5 # seconds between the LED colour changes
+
+    WAITING = "waiting"
+    REPLIED = "replied"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    SERVICE_ID = const.MicrobotServiceId
+    PAIR_CH = "2A90"
+
+    log = logging.getLogger(__name__)
+
+    def __init__(self, microbot, bleConnection, timeout=None):
+        self.mb = microbot
+        self._conn = bleConnection
+        self.timeout = timeout
+        self._colours = itertools.cycle(microbot._getPairColourSequence())
+        self._colour = None
+        self._state = self.WAITING
+        self._reply = None
+        self._error = None
+        self._outcome = None # (result, exception) once the session is finalised
+        self._handle = None
+        self._timer = None
+        self._deadlineTimer = None
+        self._callbacks = []
+        self._done = threading.Event()
+        self._mutex = threading.RLock()
+
+    def start(self):
+        """Sends the host's handshake & starts cycling the LED colours."""
+        hostUid = self.mb._getHostUUID()
+        sendData = chr(len(hostUid)) + hostUid
+        with self._conn.transaction():
+            # Both parts of the handshake are sent back-to-back
+            self._handle = self._conn.onNotify(self.SERVICE_ID, self.PAIR_CH, self._onReply)
+            self._conn.write(self.SERVICE_ID, self.PAIR_CH, sendData[:20])
+            self._conn.write(self.SERVICE_ID, self.PAIR_CH, "\x00" + sendData[20:])
+        self.log.info("Pairing data sent. Waiting for user to touch the button.")
+        if self.timeout is not None:
+            with self._mutex:
+                if self._state == self.WAITING:
+                    self._deadlineTimer = threading.Timer(self.timeout, self._onTimeout)
+                    self._deadlineTimer.daemon = True
+                    self._deadlineTimer.start()
+        self._refreshLed()
+
+    def getState(self):
+        return self._state
+
+    def getColour(self):
+        """Returns <LedStatus> the microbot's LED is showing (`None` if no colour was set yet)."""
+        return self._colour
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Returns `True` if the session is over within `timeout` seconds."""
+        return self._done.wait(timeout)
+
+    def addDoneCallback(self, callback):
+        """Calls `callback(session)` when the session is over (immediately if it is over already).
+
+        The callback may be executed on the notification thread.
+        """
+        with self._mutex:
+            if not self.done():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def cancel(self):
+        """Aborts the session (the microbot stays unpaired)."""
+        if self._finish(self.CANCELLED):
+            self._conn.close()
+
+    def result(self, timeout=None):
+        """Waits for the session to end & completes the pairing.
+
+        Raises <exceptions.NotPaired> if the pairing has failed and <exceptions.Timeout>
+        if the session is not over in `timeout` seconds.
+        """
+        if not self.wait(timeout):
+            raise exceptions.Timeout("Pairing is not complete yet.")
+
+        with self._mutex:
+            if self._outcome is None:
+                try:
+                    self._outcome = (self._complete(), None)
+                except exceptions.PyPushException as err:
+                    self._outcome = (None, err)
+
+        (rv, err) = self._outcome
+        if err is not None:
+            raise err
+        return rv
+
+    def _complete(self):
+        if self._state == self.CANCELLED:
+            raise exceptions.NotPaired(0xFF, "Pairing was cancelled.")
+        elif self._state == self.FAILED:
+            self._conn.close()
+            raise exceptions.NotPaired(0xFF, "Pairing failed: {}".format(self._error))
+
+        status = ord(self._reply[0])
+        key = self._reply[1:]
+        assert len(key) >= 16, repr(key)
+
+        if status == 0x01:
+            # Pairing sucessfull.
+            self.mb._completePairing(self._conn, key[:16])
+        else:
+            self._conn.close()
+            if status == 0x04:
+                raise exceptions.NotPaired(
+                    status, "User did not touch the microbot")
+            else:
+                raise exceptions.NotPaired(
+                    status, "Unexpected status 0x{:02X}".format(status))
+
+    def _onReply(self, data):
+        """Pairing reply notification (executed on the notification thread)."""
+        with self._mutex:
+            if self._state == self.WAITING:
+                self._reply = data
+        self._finish(self.REPLIED)
+
+    def _onTimeout(self):
+        with self._mutex:
+            self._error = exceptions.Timeout("No reply in {} seconds.".format(self.timeout))
+        if self._finish(self.FAILED):
+            self._conn.close()
+
+    def _refreshLed(self):
+        with self._mutex:
+            if self._state != self.WAITING:
+                return
+            colour = self._colour = next(self._colours)
+
+        try:
+            # (The LED stays lit till the next refresh; its duration is in whole seconds)
+            duration = int(math.ceil(self.LED_PERIOD))
+            self.mb._sneakyLed(colour.r, colour.g, colour.b, duration, self._conn)
+        except Exception as err:
+            self.log.exception("Failed to set the LED colour.")
+            with self._mutex:
+                self._error = err
+            if self._finish(self.FAILED):
+                self._conn.close()
+            return
+
+        with self._mutex:
+            if self._state == self.WAITING:
+                self._timer = threading.Timer(self.LED_PERIOD, self._refreshLed)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _finish(self, state):
+        """Ends the session. Returns `False` if it had already ended."""
+        with self._mutex:
+            if self._state != self.WAITING:
+                return False
+            self._state = state
+            for timer in (self._timer, self._deadlineTimer):
+                if timer:
+                    timer.cancel()
+            handle = self._handle
+            callbacks = self._callbacks
+            self._callbacks = []
+            self._done.set()
+        if handle:
+            handle.cancel()
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                self.log.exception("Pairing session callback exception.")
+        return True
+
+    def __repr__(self):
+        return "<{} {!r} {}>".format(self.__class__.__name__, self.mb, self._state)
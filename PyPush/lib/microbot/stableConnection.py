@@ -4,7 +4,55 @@ import logging
 import threading
 import time
 
-from .. import exceptions
+from .. import exceptions, retry, stats
+from ..ble import exceptions as bleExceptions
+
+# Reconnect attempts of all microbots (the budget is shared by all connections to a microbot).
+RECONNECT_POLICY = retry.RetryPolicy(baseDelay=1, maxDelay=30, budgetCapacity=10, budgetRate=0.05)
+
+class _Supervisor(object):
+    """Watches the links of all open <StableAuthorisedConnection> objects from a single thread.
+
+    The thread runs only while there are connections to watch. Restoring a dropped link is done
+    by a worker thread of that connection, so a slow reconnect does not delay the other links.
+    """
+
+    log = logging.getLogger(__name__)
+
+    def __init__(self):
+        self._connections = set()
+        self._cond = threading.Condition(threading.Lock())
+        self._running = False
+
+    def add(self, connection):
+        with self._cond:
+            self._connections.add(connection)
+            if not self._running:
+                self._running = True
+                thread = threading.Thread(name="{}.supervisor".format(__name__), target=self._target)
+                thread.daemon = True
+                thread.start()
+
+    def remove(self, connection):
+        with self._cond:
+            self._connections.discard(connection)
+            self._cond.notify_all()
+
+    def _target(self):
+        while True:
+            with self._cond:
+                if not self._connections:
+                    self._running = False
+                    return
+                self._cond.wait(StableAuthorisedConnection.CHECK_PERIOD)
+                connections = tuple(self._connections)
+            for connection in connections:
+                try:
+                    connection._checkLink()
+                except Exception:
+                    self.log.exception("Error checking link of {!r}".format(connection))
+
+SUPERVISOR = _Supervisor()
 
 class StableAuthorisedConnection(object):
     """Auto-reconnecting BLE connection.
@@ -12,55 +60,153 @@ class StableAuthorisedConnection(object):
     This is a wrapper for the BLE connection that auto-reconnects to
     the device & re-authorises connection with the microbot.
 
-    This wrapper performs `retries` connection-reattempts at most.
+    Links of all connections are checked by the shared `SUPERVISOR`. A dropped link is restored
+    in the background with `retries` connection-reattempts at most (fewer if the reconnect budget
+    of the microbot runs out). The connection is closed if the link can not be restored.
     """
 
-    _active = True
+    # Connection states
+    READY = "ready"
+    RECONNECTING = "reconnecting"
+    CLOSED = "closed"
+
+    CHECK_PERIOD = 1 # seconds between the link checks
+
     log = logging.getLogger(__name__)
 
-    def __init__(self, microbot, bleConnection, retries=5):
+    def __init__(self, microbot, bleConnection, retries=5, readyStats=None):
         self._mb = microbot
         self._conn = bleConnection
         self._maxRetries = retries
-        self._mutex = threading.RLock()
-
-    def get(self):
-        """Returns an established BLE connection."""
-        retry = 0
-        if not self._active:
-            raise exceptions.ConnectionError("Connection closed.")
-
-        with self._mutex:
-            try:
-                while not self._conn.isActive() and retry < self._maxRetries:
-                    self._restoreConnection()
-                    # Sleep for a bit to give the device time to recover
-                    time.sleep(retry)
-                    retry += 1
-            except Exception:
-                self.log.exception("Error restoring BLE connection")
-                self.close()
+        self._readyStats = readyStats or stats.LatencyStats()
+        self._state = self.READY
+        self._reconnectCount = 0
+        self._cond = threading.Condition(threading.RLock())
+        SUPERVISOR.add(self)
 
-            if not self._conn.isActive():
-                # Exceeded retry count
-                self.close()
-                raise exceptions.ConnectionError("Connection failed")
-        return self._conn
+    def get(self, timeout=None):
+        """Returns an established BLE connection.
+
+        Waits for a dropped link to be restored for `timeout` seconds at most
+        (till the `retry.deadline` of the current thread if `timeout` is `None`).
+        """
+        conn = self._conn
+        if self._state != self.CLOSED and conn.isActive():
+            return conn
+
+        if timeout is None:
+            timeout = retry.timeLeft()
+        endTime = None if timeout is None else time.time() + timeout
+
+        self._checkLink()
+        with self._cond:
+            while True:
+                if self._state == self.CLOSED:
+                    raise exceptions.ConnectionError("Connection failed")
+                if self._conn.isActive():
+                    return self._conn
+                if endTime is None:
+                    self._cond.wait(self.CHECK_PERIOD)
+                else:
+                    waitTime = endTime - time.time()
+                    if waitTime <= 0:
+                        raise exceptions.Timeout("BLE link of {!r} is not restored yet.".format(self._mb))
+                    self._cond.wait(min(waitTime, self.CHECK_PERIOD))
+
+    def getState(self):
+        return self._state
+
+    def getStats(self):
+        """Returns dict of the connection state, reconnect count & time-to-ready summary."""
+        return {
+            "state": self._state,
+            "reconnects": self._reconnectCount,
+            "time_to_ready": self._readyStats.getSummary(),
+        }
 
     def isActive(self):
-        return self._active
+        return self._state != self.CLOSED
+
+    def publish(self, fn):
+        """Calls `fn` unless this connection is closed. Returns `True` if `fn` was called.
+
+        The call is atomic with respect to `close()`.
+        """
+        with self._cond:
+            if self._state == self.CLOSED:
+                return False
+            fn()
+            return True
 
     def close(self):
         """Close the connection."""
-        with self._mutex:
+        SUPERVISOR.remove(self)
+        with self._cond:
+            self._state = self.CLOSED
+            self._cond.notify_all()
             self._conn.close()
-            self._active = False
+
+    def _checkLink(self):
+        """Starts restoring the link if it has dropped."""
+        with self._cond:
+            if self._state != self.READY or self._conn.isActive():
+                return
+            self._setState(self.RECONNECTING)
+        thread = threading.Thread(
+            name="{}.restore({})".format(__name__, self._mb.getUID()),
+            target=self._restoreTarget,
+        )
+        thread.daemon = True
+        thread.start()
+
+    def _restoreTarget(self):
+        start = time.time()
+        try:
+            RECONNECT_POLICY.call(
+                self._restoreOrFail,
+                lambda err: isinstance(err, (_NotRestored, bleExceptions.BleException)) and self.isActive(),
+                self._maxRetries,
+                (RECONNECT_POLICY.getBudget(self._mb.getUID()), ),
+            )
+        except _NotRestored:
+            pass
+        except Exception:
+            self.log.exception("Error restoring BLE connection")
+
+        with self._cond:
+            if self._state == self.CLOSED:
+                self._conn.close()
+            elif self._conn.isActive():
+                self._reconnectCount += 1
+                self._readyStats.add(time.time() - start)
+                self._setState(self.READY)
+            else:
+                # Exceeded retry count
+                self.log.error("Failed to restore BLE connection to {!r}".format(self._mb))
+                self.close()
+
+    def _setState(self, state):
+        with self._cond:
+            if state != self._state:
+                self.log.info("{!r} link state: {} -> {}".format(self._mb, self._state, state))
+                self._state = state
+                self._cond.notify_all()
 
     def _restoreConnection(self):
-        with self._mutex:
-            assert self._active
-            assert not self._conn.isActive(), self._conn
+        assert not self._conn.isActive(), self._conn
+        if not self.isActive():
+            return
 
-            self._conn = self._mb._sneakyConnect()
+        self._conn.close() # release resources held by the dropped connection
+        self._conn = self._mb._sneakyConnect(reconnect=True, owner=self)
+        if self._conn.isActive():
             self._mb._onReconnect()
 
+    def _restoreOrFail(self):
+        self._restoreConnection()
+        if not self._conn.isActive():
+            raise _NotRestored()
+
+
+class _NotRestored(Exception):
+    """The connection is still not active after the reconnect attempt."""
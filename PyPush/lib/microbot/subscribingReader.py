@@ -2,13 +2,23 @@
     and automatically subsribes to value updates.
 
 """
+import collections
 import logging
+import threading
 import time
 
 
 from .. import async
 from ..ble import exceptions as bleExceptions
 
+# How long a cached characteristic value stays valid.
+#   `notify` - the value is kept up to date by the notifications (it is valid while subscribed);
+#              polled values are re-read from the device once they are older than `maxAge`.
+#   `maxAge` - max age of the cached value in seconds (`None` - no limit).
+FreshnessPolicy = collections.namedtuple("FreshnessPolicy", ["maxAge", "notify"])
+
+NOTIFY_POLICY = FreshnessPolicy(maxAge=None, notify=True)
+
 class SubscribingReader(object):
     """A handler object that auto-subscribes to notifications on the characteristics being read.
 
@@ -19,14 +29,16 @@ class SubscribingReader(object):
     log = logging.getLogger(__name__)
     UNSUPPORTED_REFRESH_FREQ = 5 * 60  # seconds
 
-    def __init__(self, mb):
+    def __init__(self, mb, policies=None):
         self.mb = mb
+        self.policies = dict(policies or {})  # key -> <FreshnessPolicy>
         self._handles = {}  # List of all notify handles
-        self._values = {}  # Cache of all values
-        self._unsupportedValues = {}  # key -> (value, expire_time)
+        self._values = {}  # Cache of all values, key -> (value, update_time)
         # List of all read() addresses that do not support notify.
         self._unsupported = set()
         self.callbacks = async.SubscribeHubDict()
+        self.counters = collections.Counter()
+        self._countersMutex = threading.Lock()
 
     def clear(self):
         """Forgets all notify subscriptions.
@@ -39,73 +51,129 @@ class SubscribingReader(object):
         self._handles.clear()
         self._values.clear()
 
+    def getPolicy(self, key):
+        return self.policies.get(key, NOTIFY_POLICY)
+
+    def getStats(self):
+        """Returns dict of cache hit/miss/stale counters."""
+        with self._countersMutex:
+            return dict((name, self.counters[name]) for name in ("hit", "miss", "stale"))
+
     def read(self, service, char):
         """Performs BLE read if not subscribed to the notification.
 
         Returns cached value if subscribed to the notification.
         """
-        key = (service, char)
-        conn = self.mb._conn()
+        return self.readMany([(service, char)])[0]
 
-        try:
-            if key in self._unsupported:
-                rv = self._readUnsupported(conn, service, char)
+    def readMany(self, keys):
+        """Bulk version of `read`.
+
+        Returns list of values for the (service, characteristic) `keys`.
+        All values that can not be served from the cache are read in one batch.
+        """
+        conn = self.mb._conn()
+        now = time.time()
+        values = {}
+        toRead = []
+
+        for key in keys:
+            (status, value) = self._lookup(key, now)
+            self._count(status)
+            if status == "hit":
+                values[key] = value
             else:
-                try:
-                    rv = self._values[key]
-                except KeyError:
-                    try:
-                        self._handles.pop(key).cancel()
-                    except KeyError:
-                        pass
-                    # Not cached yet
-                    rv = conn.read(service, char, timeout=15)
-                    try:
-                        self._subscribe(conn, service, char)
-                    except bleExceptions.NotSupported:
-                        self._unsupported.add(key)
-                    else:
-                        self._values[key] = rv
-        except bleExceptions.Timeout:
-            self.log.exception("BLE timeout")
-            raise bleExceptions.Timeout("Read timeout")
-        return rv
-
-    def _readUnsupported(self, conn, service, char):
-        key = (service, char)
+                toRead.append(key)
+
+        if toRead:
+            try:
+                readValues = conn.readMany(toRead, timeout=15)
+            except bleExceptions.Timeout:
+                self.log.exception("BLE timeout")
+                raise bleExceptions.Timeout("Read timeout")
+
+            for (key, value) in zip(toRead, readValues):
+                values[key] = value
+                self._storeReadValue(conn, key, value, now)
+
+        return [values[key] for key in keys]
+
+    def _lookup(self, key, now):
+        """Returns (status, cached value) where status is one of "hit", "miss" or "stale"."""
         try:
-            (oldVal, expireTime) = self._unsupportedValues[key]
+            (value, updateTime) = self._values[key]
         except KeyError:
-            oldVal = None
-            expireTime = 0
+            return ("miss", None)
 
-        now = time.time()
-        if now > expireTime:
-            # Re-read the data
-            rv = conn.read(service, char)
-            self._unsupportedValues[key] = (
-                rv, now + self.UNSUPPORTED_REFRESH_FREQ)
+        policy = self.getPolicy(key)
+        if policy.notify and key not in self._unsupported:
+            maxAge = policy.maxAge
+            fresh = key in self._handles
         else:
-            rv = oldVal
-        return rv
+            maxAge = policy.maxAge if not policy.notify else self.UNSUPPORTED_REFRESH_FREQ
+            fresh = True
+
+        if fresh and (maxAge is None or now - updateTime <= maxAge):
+            return ("hit", value)
+        return ("stale", value)
+
+    def _count(self, status):
+        with self._countersMutex:
+            self.counters[status] += 1
+
+    def _storeReadValue(self, conn, key, value, now):
+        """Caches the `value` freshly read from the radio & subscribes for its updates."""
+        if self.getPolicy(key).notify and key not in self._unsupported:
+            try:
+                self._handles.pop(key).cancel()
+            except KeyError:
+                pass
+
+            try:
+                self._subscribe(conn, *key)
+            except bleExceptions.NotSupported:
+                self._unsupported.add(key)
+        self._values[key] = (value, now)
 
     def _setCache(self, service, characteristics, value):
         key = (service, characteristics)
-        self._unsupportedValues[key] = (
-            value, time.time() + self.UNSUPPORTED_REFRESH_FREQ)
-        self._values[key] = value
+        self._values[key] = (value, time.time())
 
-    def reSubscribe(self):
+    def reSubscribe(self, prefetch=()):
         """Resubscribe for to all notifications this object had been subscribed for.
 
+        Values of these characteristics and of the `prefetch` ones are re-read in one batch.
         Normally executed on the reconnect.
         """
-        _oldSubscriptions = self._handles.keys()
+        keys = list(prefetch)
+        keys.extend(key for key in self._handles.iterkeys() if key not in keys)
         self.clear()
 
         conn = self.mb._conn()
-        for (service, char) in _oldSubscriptions:
-            self._subscribe(conn, service, char)
+        try:
+            values = conn.readMany(keys, timeout=15)
+        except bleExceptions.NotSupported:
+            # Some of the characteristics are not readable, fetch them one-by-one.
+            values = []
+            for key in keys:
+                try:
+                    values.append(conn.read(key[0], key[1], timeout=15))
+                except bleExceptions.NotSupported:
+                    values.append(None)
+        except bleExceptions.BleException:
+            self.log.exception("Failed to prefetch values on reconnect.")
+            values = [None] * len(keys)
+
+        now = time.time()
+        for (key, value) in zip(keys, values):
+            if value is None:
+                if self.getPolicy(key).notify and key not in self._unsupported:
+                    try:
+                        self._subscribe(conn, *key)
+                    except bleExceptions.NotSupported:
+                        self._unsupported.add(key)
+            else:
+                self._storeReadValue(conn, key, value, now)
 
     def _subscribe(self, conn, service, char):
         key = (service, char)
@@ -114,12 +182,11 @@ class SubscribingReader(object):
                 service, char, lambda data: self._onNotify(key, data))
 
     def _onNotify(self, key, data):
-        oldValue = self._values.get(key)
-        self._values[key] = data
+        (oldValue, _) = self._values.get(key, (None, None))
+        self._values[key] = (data, time.time())
         self._fireChangeEvents(key, oldValue, data)
 
     def _fireChangeEvents(self, key, oldValue, newValue):
         self.callbacks[key].fireSubscribers(key, oldValue, newValue)
         if oldValue != newValue:
             self.mb._fireChangeState()
-
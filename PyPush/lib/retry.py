@@ -0,0 +1,151 @@
+"""Retry policy shared by the BLE operations.
+
+Retries are spaced by exponential backoff with jitter (so that devices failing at the same
+time do not retry in lockstep) and limited by token-bucket retry budgets (so one dead
+device can not monopolise the radio).
+
+A caller can also limit the total time spent on an operation (including all nested retries)
+with the `deadline` context. The first attempt is always made, the retries that would end
+past the deadline are not.
+"""
+
+import contextlib
+import logging
+import random
+import threading
+import time
+
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def deadline(seconds):
+    """All retries performed by the current thread inside of this context end in `seconds`.
+
+    Nested contexts can only shorten the deadline.
+    """
+    oldValue = getattr(_local, "deadline", None)
+    newValue = time.time() + seconds
+    if oldValue is not None:
+        newValue = min(oldValue, newValue)
+    _local.deadline = newValue
+    try:
+        yield
+    finally:
+        _local.deadline = oldValue
+
+
+def getDeadline():
+    """Returns time.time() of the current thread's deadline (`None` if there is none)."""
+    return getattr(_local, "deadline", None)
+
+
+@contextlib.contextmanager
+def withDeadline(value):
+    """Activates deadline previously returned by `getDeadline()` in the current thread."""
+    if value is None:
+        yield
+    else:
+        with deadline(value - time.time()):
+            yield
+
+
+def timeLeft():
+    """Returns seconds remaining till the deadline (`None` if there is no deadline)."""
+    value = getDeadline()
+    if value is None:
+        return None
+    return max(value - time.time(), 0)
+
+
+class TokenBucket(object):
+    """Retry budget that holds at most `capacity` retries and regains `rate` retries per second."""
+
+    def __init__(self, capacity, rate):
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self._tokens = self.capacity
+        self._lastRefill = time.time()
+        self._mutex = threading.Lock()
+
+    def take(self):
+        """Takes one token out of the bucket. Returns `False` if the bucket is empty."""
+        with self._mutex:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def getTokens(self):
+        with self._mutex:
+            self._refill()
+            return self._tokens
+
+    def _refill(self):
+        now = time.time()
+        self._tokens = min(self.capacity, self._tokens + (now - self._lastRefill) * self.rate)
+        self._lastRefill = now
+
+
+class RetryPolicy(object):
+    """Exponential backoff with jitter & per-key retry budgets."""
+
+    log = logging.getLogger(__name__)
+
+    def __init__(self, baseDelay=0.5, maxDelay=10, budgetCapacity=10, budgetRate=0.1):
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.budgetCapacity = budgetCapacity
+        self.budgetRate = budgetRate
+        self._budgets = {}
+        self._mutex = threading.Lock()
+
+    def newBudget(self):
+        """Returns new retry budget (e.g. for a single connection)."""
+        return TokenBucket(self.budgetCapacity, self.budgetRate)
+
+    def getBudget(self, key):
+        """Returns retry budget shared by all users of the `key` (e.g. device UID)."""
+        with self._mutex:
+            try:
+                return self._budgets[key]
+            except KeyError:
+                self._budgets[key] = rv = self.newBudget()
+                return rv
+
+    def getDelay(self, retry):
+        """Returns delay before the `retry`-th (zero-based) retry."""
+        delay = min(self.maxDelay, self.baseDelay * (2 ** retry))
+        # "Equal jitter": keeps at least half of the backoff to give the device time to recover.
+        return delay / 2.0 + random.uniform(0, delay / 2.0)
+
+    def call(self, func, shouldRetry, attempts, budgets=()):
+        """Calls `func()` up to `attempts` times while it raises exceptions accepted by `shouldRetry`.
+
+        Each retry takes a token out of every budget in `budgets`. The last exception is re-raised
+        when attempts, budgets or time till the current deadline run out.
+        """
+        retry = 0
+        while True:
+            try:
+                return func()
+            except Exception as err:
+                if not shouldRetry(err) or retry + 1 >= attempts:
+                    raise
+
+                delay = self.getDelay(retry)
+                left = timeLeft()
+                if left is not None and delay >= left:
+                    self.log.info("Not retrying {!r}: deadline is too close.".format(err))
+                    raise
+
+                # Take the tokens from all budgets (only if all of them have some)
+                if not all(budget.getTokens() >= 1 for budget in budgets):
+                    self.log.info("Not retrying {!r}: retry budget exhausted.".format(err))
+                    raise
+                for budget in budgets:
+                    budget.take()
+
+            time.sleep(delay)
+            retry += 1
@@ -0,0 +1,72 @@
+"""Lightweight runtime statistics."""
+
+import bisect
+import collections
+import contextlib
+import threading
+import time
+
+
+class LatencyStats(object):
+    """Thread-safe latency statistics.
+
+    The percentiles and the histogram are computed over the last `window` samples only.
+    """
+
+    # Upper bounds (in seconds) of the histogram buckets
+    HISTOGRAM_BOUNDS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self, window=256):
+        self._samples = collections.deque(maxlen=window)
+        self._count = 0
+        self._total = 0.0
+        self._mutex = threading.Lock()
+
+    def add(self, seconds):
+        with self._mutex:
+            self._samples.append(seconds)
+            self._count += 1
+            self._total += seconds
+
+    @contextlib.contextmanager
+    def measure(self):
+        """Records duration of the context (if it exits without an exception)."""
+        start = time.time()
+        yield
+        self.add(time.time() - start)
+
+    def getHistogram(self, bounds=None):
+        """Returns list of (upper bound, sample count) pairs.
+
+        The last pair (with `None` bound) counts samples exceeding all of the `bounds`.
+        """
+        if bounds is None:
+            bounds = self.HISTOGRAM_BOUNDS
+        with self._mutex:
+            samples = list(self._samples)
+
+        counts = [0] * (len(bounds) + 1)
+        for sample in samples:
+            counts[bisect.bisect_left(bounds, sample)] += 1
+        return zip(tuple(bounds) + (None, ), counts)
+
+    def getSummary(self):
+        """Returns dict of count, mean, p50, p95 and max latency (in seconds)."""
+        with self._mutex:
+            samples = sorted(self._samples)
+            count = self._count
+            total = self._total
+
+        if not samples:
+            return {"count": 0, "mean": None, "p50": None, "p95": None, "max": None}
+
+        def _percentile(pct):
+            return samples[min(len(samples) - 1, int(len(samples) * pct / 100.0))]
+
+        return {
+            "count": count,
+            "mean": total / count,
+            "p50": _percentile(50),
+            "p95": _percentile(95),
+            "max": samples[-1],
+        }
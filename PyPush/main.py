@@ -9,6 +9,7 @@ import logging.handlers
 def get_arg_parser():
     """Argument parser for the command-line entry."""
     import PyPush
+    import PyPush.core.const as const
 
     parser = argparse.ArgumentParser(
         description="Microbot Push management daemon.")
@@ -21,6 +22,8 @@ def get_arg_parser():
     # Populate submodule args
     PyPush.lib.main.populate_arg_parser(parser)
     PyPush.core.main.populate_arg_parser(parser)
+    parser.set_defaults(
+        ble_gatt_cache=os.path.join(const.TMP_DIR, "ble_gatt_cache.json"))
 
     subp = parser.add_subparsers(help="UI modes")
     web_ui = subp.add_parser("web_ui", help="Web forntend")
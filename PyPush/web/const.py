@@ -11,6 +11,9 @@ from PyPush.core.const import (
 
 PUSH_WEB_DIR = os.path.abspath(os.path.dirname(__file__))
 
+# Range (seconds) the press hold time requested by a client is clamped to.
+PRESS_HOLD_RANGE = (0, 10)
+
 
 @enum.unique
 class ComplexMbActions(enum.Enum):
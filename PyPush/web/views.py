@@ -1,15 +1,17 @@
 import time
 import json
+import math
 
 import enum
 
 from flask import render_template, Response
-from flask_restful import Resource, Api, reqparse
+from flask_restful import Resource, Api, reqparse, abort
 
 from PyPush.core import db
 from .const import (
     ComplexMbActions,
     MbActions,
+    PRESS_HOLD_RANGE,
 )
 
 class ActionChainConstructor(object):
@@ -102,6 +104,8 @@ class MicrobotList(Resource):
             if rec.button_mode is not None:
                 bMode = rec.button_mode.name
 
+            link = self.flaskUI.core.ble.getLinkQuality(rec.uuid)
+
             out.append({
                 "id": rec.uuid,
                 "name": rec.name,
@@ -113,6 +117,8 @@ class MicrobotList(Resource):
                 "firmware_version": sFirmwareVersion,
                 "button_mode": bMode,
                 "last_seen": rec.last_seen.isoformat(),
+                "rssi": link["rssi"],
+                "advert_rate": link["advert_rate"],
                 "error": rec.last_error,
                 "actions": [el.value for el in actions],
             })
@@ -194,15 +200,11 @@ class MicrobotAction(Resource):
         else:
             # not none
             if metaAction == ComplexMbActions.press:
-                actions = [MbActions.extend, MbActions.retract]
+                # The microbot performs the whole press within a single action
+                chain.append(MbActions.press, getPressArgs(args, kwargs))
             else:
                 raise NotImplementedError(metaAction)
 
-            for action in actions:
-                chAction = chain.append(action, args, kwargs)
-                # Add delay between action chain elements
-                chAction.prev_action_delay = 1.5
-
         ids = chain.commit()
 
         return {
@@ -210,6 +212,29 @@ class MicrobotAction(Resource):
             "action_ids": ids
         }
 
+def getPressArgs(args, kwargs):
+    """Validates client's arguments of the press. Returns `args` of the <MbActions.press> action.
+
+    The hold time is clamped to `PRESS_HOLD_RANGE`. Responds with 400 to an invalid request.
+    """
+    values = list(args)
+    if "holdSeconds" in kwargs:
+        values.append(kwargs["holdSeconds"])
+    if len(values) > 1 or set(kwargs) - set(["holdSeconds"]):
+        abort(400, message="Press accepts a single 'holdSeconds' argument.")
+    if not values:
+        return ()
+
+    try:
+        holdSeconds = float(values[0])
+    except (TypeError, ValueError):
+        holdSeconds = None
+    if holdSeconds is None or math.isnan(holdSeconds):
+        abort(400, message="Invalid hold time {!r}.".format(values[0]))
+
+    (low, high) = PRESS_HOLD_RANGE
+    return (min(max(holdSeconds, low), high), )
+
 
 class FlaskRoutes(object):
 
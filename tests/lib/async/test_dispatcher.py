@@ -0,0 +1,38 @@
+import threading
+
+import PyPush.lib.async.dispatcher as Mod
+
+
+def test_coalesce_and_order():
+    dispatcher = Mod.Dispatcher(workers=2, maxPending=3)
+    gate = threading.Event()
+    received = []
+    done = threading.Event()
+
+    def _cb(value):
+        gate.wait(10)
+        received.append(value)
+        if value == 9:
+            done.set()
+
+    source = dispatcher.register(_cb)
+    for idx in xrange(10):
+        source.put(idx)
+    gate.set()
+    assert done.wait(10)
+
+    # The first value might have been picked up by a worker before the gate was opened,
+    #   anything else except the last `maxPending` values is superseded.
+    assert received[-3:] == [7, 8, 9]
+    assert received == sorted(received)
+    assert len(received) <= 4
+
+
+def test_cancel():
+    dispatcher = Mod.Dispatcher(workers=1)
+    received = []
+    source = dispatcher.register(received.append)
+    source.cancel()
+    source.put(1)
+    assert dispatcher.getThreadCount() == 1
+    assert not source.pending
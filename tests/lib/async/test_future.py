@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+
+import PyPush.lib.async as Mod
+import PyPush.lib.exceptions as excpt
+import PyPush.lib.retry as retry
+
+
+def test_serial_order():
+    executor = Mod.SerialExecutor("test")
+    calls = []
+
+    def _call(idx):
+        time.sleep(0.001)
+        calls.append(idx)
+        return idx
+
+    futures = [executor.submit(_call, idx) for idx in xrange(20)]
+    assert [future.result(timeout=5) for future in futures] == range(20)
+    assert calls == range(20)
+
+
+def test_executors_run_in_parallel():
+    release = threading.Event()
+    blocked = Mod.SerialExecutor("blocked").submit(release.wait, 5)
+    other = Mod.SerialExecutor("other").submit(lambda: "done")
+    assert other.result(timeout=5) == "done"
+    assert not blocked.done()
+    release.set()
+    assert blocked.result(timeout=5)
+
+
+def test_exception_and_timeout():
+    executor = Mod.SerialExecutor("test")
+    release = threading.Event()
+    slow = executor.submit(release.wait, 5)
+    with pytest.raises(excpt.Timeout):
+        slow.result(timeout=0.01)
+
+    def _fail():
+        raise excpt.IOError("BLE failure")
+
+    failing = executor.submit(_fail)
+    release.set()
+    with pytest.raises(excpt.IOError):
+        failing.result(timeout=5)
+    assert isinstance(failing.exception(), excpt.IOError)
+
+
+def test_cancel():
+    executor = Mod.SerialExecutor("test")
+    release = threading.Event()
+    running = executor.submit(release.wait, 5)
+    queued = executor.submit(lambda: "never")
+    done = []
+    queued.addDoneCallback(done.append)
+
+    assert queued.cancel()
+    assert done == [queued]
+    with pytest.raises(excpt.Cancelled):
+        queued.result()
+
+    release.set()
+    assert running.result(timeout=5)
+    assert not running.cancel(), "Completed call can not be cancelled"
+
+
+def test_deadline_propagation():
+    executor = Mod.SerialExecutor("test")
+    release = threading.Event()
+    executor.submit(release.wait, 5)
+    with retry.deadline(10):
+        withDeadline = executor.submit(retry.timeLeft)
+    with retry.deadline(0.01):
+        expired = executor.submit(lambda: "late")
+    time.sleep(0.05)
+    release.set()
+
+    assert 0 < withDeadline.result(timeout=5) <= 10
+    with pytest.raises(excpt.Timeout):
+        expired.result(timeout=5)
@@ -11,6 +11,7 @@ from bgapi.module import RemoteError as bgRemoteError
 from PyPush.lib.ble.exceptions import RemoteException
 
 import PyPush.lib.ble.bgapi.connection as ConMod
+import PyPush.lib.ble.bgapi.libLock as LockMod
 
 STR_TO_HEX = "PyPush.lib.ble.bgapi.byteOrder.nStrToHHex"
 
@@ -108,6 +109,8 @@ def get_mocked_connection():
 
     ble.getChildLock.return_value.get_services.return_value = (Service, )
     bleConn.get_characteristics.return_value = (Char, )
+    bleConn.getPacing.return_value = LockMod.AdaptivePacing()
+    bleConn.getRetryBudgets.return_value = ()
 
     bleConn.reset_mock()
 
@@ -177,6 +180,30 @@ def test_fail_read():
         "bleConnection"].read_by_handle.call_count == 5, "Read operation retries 5 times by default"
 
 
+@mock.patch(STR_TO_HEX, noop1)
+@mock.patch("time.sleep", noop1)
+def test_retry_budget():
+    conn = get_mocked_connection()
+    conn["char"].is_writable.return_value = True
+    conn["connection"]._open()
+    deviceBudget = LockMod.RETRY_POLICY.newBudget()
+    deviceBudget.rate = 0
+    conn["bleConnection"].getRetryBudgets.return_value = (deviceBudget, )
+    conn["bleConnection"].write_by_uuid.side_effect = bgRemoteError(0x0181)
+
+    calls = 0
+    while deviceBudget.getTokens() >= 1:
+        with pytest.raises(RemoteException):
+            conn["connection"].write("SERV", "CHAR", 42)
+        calls += conn["bleConnection"].write_by_uuid.call_count
+        conn["bleConnection"].write_by_uuid.reset_mock()
+    assert calls == deviceBudget.capacity + 3, "Each failed write retries while the budget lasts"
+
+    with pytest.raises(RemoteException):
+        conn["connection"].write("SERV", "CHAR", 42)
+    assert conn["bleConnection"].write_by_uuid.call_count == 1, "No retries with exhausted budget"
+
+
 @mock.patch(STR_TO_HEX, noop1)
 @mock.patch("time.sleep", noop1)
 def test_on_notify():
@@ -224,3 +251,214 @@ def test_notify_error():
         conn.onNotify("SERV", "CHAR", callFn)
 
     assert ble.characteristic_subscription.call_count == 5
+
+
+@mock.patch(STR_TO_HEX, noop1)
+@mock.patch("time.sleep", noop1)
+@mock.patch("PyPush.lib.ble.bgapi.gattCache.dumpTable")
+@mock.patch("PyPush.lib.ble.bgapi.gattCache.restoreTable")
+def test_gatt_cache_hit(restoreTable, dumpTable):
+    handle = get_mocked_connection()
+    bleConn = handle["bleConnection"]
+    handle["service"] = handle["service"]._replace(uuid="1831")
+    bleConn.get_services.return_value = (handle["service"], )
+    handle["char"].uuid = "2A21"
+    handle["char"].value = "FW"
+
+    cache = mock.MagicMock()
+    cache.get.return_value = ("FW", "TABLE")
+    conn = ConMod.BgConnection(mock.MagicMock(), handle["connection"]._ble, cache)
+    conn._open()
+
+    restoreTable.assert_called_once_with(bleConn, "TABLE")
+    bleConn.read_by_group_type.assert_not_called()
+    bleConn.find_all_information.assert_not_called()
+    cache.invalidate.assert_not_called()
+
+    # Cached handles are stale
+    bleConn.reset_mock()
+    handle["char"].value = "NEW FW"
+    conn = ConMod.BgConnection(mock.MagicMock(), handle["connection"]._ble, cache)
+    conn._open()
+    cache.invalidate.assert_called_once()
+    bleConn.read_by_group_type.assert_called_once()
+    cache.set.assert_called_once()
+
+
+def test_indexed_lookup():
+    """Characteristic lookups are served from the index built on open."""
+    import PyPush.lib.ble.bgapi.byteOrder as byteOrder
+
+    mb = mock.MagicMock()
+    ble = mock.MagicMock()
+    bleConn = ble.getChildLock.return_value
+
+    services = []
+    chars = []
+    for srvIdx in xrange(20):
+        start = srvIdx * 100
+        services.append(ServiceMock("\x00\x18" + chr(srvIdx), start, start + 99))
+        for charIdx in xrange(10):
+            chars.append(CharacteristicMock("\x00\x2A" + chr(charIdx), start + charIdx * 3 + 1))
+    bleConn.get_services.return_value = tuple(services)
+    bleConn.get_characteristics.return_value = tuple(chars)
+
+    conn = ConMod.BgConnection(mb, ble)
+    conn._open()
+    bleConn.reset_mock()
+
+    (srvId, charId) = (byteOrder.nStrToHHex(services[-1].uuid), byteOrder.nStrToHHex(chars[-1].uuid))
+    expected = [char for char in conn._serviceToCharacteristics[services[-1].uuid] if char.human_uuid == charId]
+    assert len(expected) == 1
+    for _ in xrange(3):
+        assert conn._findCharacteristic(srvId, charId) is expected[0]
+    bleConn.get_services.assert_not_called()
+    bleConn.get_characteristics.assert_not_called()
+
+
+@mock.patch(STR_TO_HEX, noop1)
+@mock.patch("time.sleep", noop1)
+def test_read_many():
+    handle = get_mocked_connection()
+    conn = handle["connection"]
+    bleConn = handle["bleConnection"]
+
+    char2 = mock.Mock()
+    char2.uuid = "CHAR2"
+    char2.handle = 20
+    bleConn.get_characteristics.return_value = (handle["char"], char2)
+    for char in (handle["char"], char2):
+        char.value = None
+    conn._open()
+
+    keys = [("SERV", "CHAR"), ("SERV", "CHAR2")]
+    def _readByHandle(attHandle, timeout):
+        char = {11: handle["char"], 21: char2}[attHandle]
+        char.value = "V{}".format(attHandle)
+    bleConn.read_by_handle.side_effect = _readByHandle
+
+    # Value sizes are not fixed: separate reads (even if the previous values are known)
+    assert conn.readMany(keys) == ["V11", "V21"]
+    assert conn.readMany(keys) == ["V11", "V21"]
+    assert bleConn.read_by_handle.call_count == 4
+    bleConn.getWrapped.return_value._api.ble_cmd_attclient_read_multiple.assert_not_called()
+
+    # Fixed-length values: single ATT Read Multiple exchange
+    bleConn.reset_mock()
+    rawConn = bleConn.getWrapped.return_value
+    def _readMultiple(connHandle, handles):
+        assert handles == "\x0b\x00\x15\x00"
+        rawConn.read_multiple_value = "ABCDEF"
+    rawConn._api.ble_cmd_attclient_read_multiple.side_effect = _readMultiple
+
+    sizes = {("SERV", "CHAR"): 3, ("SERV", "CHAR2"): 3}
+    with mock.patch.dict(ConMod.FIXED_SIZE_VALUES, sizes):
+        assert conn.readMany(keys) == ["ABC", "DEF"]
+    rawConn._api.ble_cmd_attclient_read_multiple.assert_called_once()
+    bleConn.read_by_handle.assert_not_called()
+    assert (handle["char"].value, char2.value) == ("ABC", "DEF")
+
+    # One of the values is not fixed-length: separate reads
+    bleConn.reset_mock()
+    rawConn._api.reset_mock()
+    with mock.patch.dict(ConMod.FIXED_SIZE_VALUES, {("SERV", "CHAR"): 3}):
+        assert conn.readMany(keys) == ["V11", "V21"]
+    rawConn._api.ble_cmd_attclient_read_multiple.assert_not_called()
+
+    # Response does not match the expected sizes: separate reads
+    bleConn.reset_mock()
+    rawConn._api.reset_mock()
+    rawConn._api.ble_cmd_attclient_read_multiple.side_effect = _readMultiple
+    with mock.patch.dict(ConMod.FIXED_SIZE_VALUES, {("SERV", "CHAR"): 1, ("SERV", "CHAR2"): 1}):
+        assert conn.readMany(keys) == ["V11", "V21"]
+    rawConn._api.ble_cmd_attclient_read_multiple.assert_called_once()
+    assert bleConn.read_by_handle.call_count == 2
+
+
+@mock.patch("functools.wraps", lambda fn: (lambda wrapper: wrapper))  # mocks have no __name__
+def test_read_multiple_through_lock():
+    """The Read Multiple response reaches the reader through a real `LockableBle` wrapper."""
+    client = mock.MagicMock()  # Mocked BlueGigaClient
+    rawConn = mock.MagicMock()  # Mocked BLEConnection
+    rawConn.handle = 0
+    rawConn.read_multiple_value = None
+    client.connections = {0: rawConn}
+    rawConn._api.ble_cmd_attclient_read_multiple.side_effect = \
+        lambda connHandle, handles: ConMod.onReadMultipleResponse(client, connHandle, "ABCDEF")
+
+    root = LockMod.LockableBle.RootLock(client)
+    conn = ConMod.BgConnection(mock.MagicMock(), root)
+    conn._bleConn = root.getChildLock(rawConn)
+
+    chars = [mock.Mock(), mock.Mock()]
+    for (idx, char) in enumerate(chars):
+        char.gatt.handle = 10 * (idx + 1)
+    assert conn._readMultiple(chars, [3, 3], timeout=1) == ["ABC", "DEF"]
+    rawConn.read_by_handle.assert_not_called()
+    rawConn.procedure_complete.assert_called_once_with(ConMod.READ_ATTRIBUTE)
+
+
+@mock.patch(STR_TO_HEX, noop1)
+@mock.patch("time.sleep", noop1)
+def test_reconnect_soak():
+    """Reconnects must not leak notification threads."""
+    import threading
+    handle = get_mocked_connection()
+    mb = mock.MagicMock()
+    ble = handle["connection"]._ble
+    bleConn = handle["bleConnection"]
+    bleConn.get_handles_by_uuid.return_value = (42, )
+
+    received = []
+    threadCounts = []
+    for idx in xrange(10000):
+        conn = ConMod.BgConnection(mb, ble)
+        conn._open()
+        conn.onNotify("SERV", "CHAR", received.append)
+        (_, notifyCb) = bleConn.assign_attrclient_value_callback.call_args[0]
+        notifyCb(idx)
+        conn.close()
+        if idx % 1000 == 0:
+            threadCounts.append(threading.active_count())
+            ble.reset_mock()
+            bleConn.reset_mock()
+
+    assert len(set(threadCounts)) == 1, threadCounts
+    assert ConMod.async.getDispatcher().getThreadCount() <= threadCounts[0]
+
+
+@mock.patch(STR_TO_HEX, noop1)
+def test_connection_profiles():
+    profiles = dict(ConMod.PROFILES)
+    profiles["interactive"] = profiles["interactive"]._replace(idleTimeout=0.2)
+    with mock.patch.object(ConMod, "PROFILES", profiles):
+        handle = get_mocked_connection()
+        conn = handle["connection"]
+        bleConn = handle["bleConnection"]
+        handle["char"].is_readable.return_value = True
+        conn._open()
+
+        idle = profiles["idle"]
+        bleConn._api.ble_cmd_connection_update.assert_called_once_with(
+            bleConn.handle, idle.intervalMin, idle.intervalMax, idle.latency, idle.timeout)
+        assert conn.getProfile() == "idle"
+        conn.read("SERV", "CHAR")
+
+        bleConn._api.reset_mock()
+        conn.setProfile("interactive")
+        conn.setProfile("interactive")
+        assert bleConn._api.ble_cmd_connection_update.call_count == 1, "Only changes are sent"
+        assert conn.getProfile() == "interactive"
+        conn.read("SERV", "CHAR")
+
+        stats = conn.getProfileStats()
+        assert stats["idle"]["count"] == 1
+        assert stats["interactive"]["count"] == 1
+
+        time.sleep(0.1)
+        conn.read("SERV", "CHAR")  # activity postpones the idle timeout
+        time.sleep(0.15)
+        assert conn.getProfile() == "interactive"
+        time.sleep(0.3)
+        assert conn.getProfile() == "idle", "Falls back to the idle profile when not used"
+        conn.close()
@@ -0,0 +1,73 @@
+import os
+import json
+import struct
+import mock
+
+from bgapi.module import BLEConnection, GATTCharacteristic
+
+import PyPush.lib.ble.bgapi.gattCache as Mod
+
+
+def _mkConnection():
+    return BLEConnection(
+        api=mock.MagicMock(), handle=0, address="ADDR", address_type=1,
+        interval=6, timeout=100, latency=0, bonding=0xFF)
+
+
+def _discover(conn):
+    """Populate the connection as if the GATT discovery was performed."""
+    conn.update_service(1, 5, "\x31\x18")
+    conn.update_uuid(1, "\x00\x28")
+    conn.update_uuid(2, GATTCharacteristic.CHARACTERISTIC_UUID)
+    conn.update_uuid(3, "\x21\x2A")
+    conn.update_uuid(4, GATTCharacteristic.CLIENT_CHARACTERISTIC_CONFIG)
+    conn.update_handle(2, struct.pack("<BH", 0x12, 3) + "\x21\x2A")
+    conn.update_handle(4, "\x00\x00")
+
+
+def test_table_roundtrip():
+    orig = _mkConnection()
+    _discover(orig)
+
+    table = Mod.dumpTable(orig)
+    restored = _mkConnection()
+    Mod.restoreTable(restored, table)
+
+    assert [(s.start_handle, s.end_handle, s.uuid) for s in restored.get_services()] == \
+        [(1, 5, "\x31\x18")]
+    assert restored.handle_uuid == orig.handle_uuid
+    assert restored.uuid_handle == orig.uuid_handle
+
+    (char, ) = restored.get_characteristics()
+    assert (char.handle, char.value_handle, char.uuid) == (2, 3, "\x21\x2A")
+    assert char.has_notify()
+    descr = char.get_descriptor_by_uuid(GATTCharacteristic.CLIENT_CHARACTERISTIC_CONFIG)
+    assert descr.handle == 4
+
+
+def test_restore_replaces_table():
+    conn = _mkConnection()
+    _discover(conn)
+    table = Mod.dumpTable(conn)
+    Mod.restoreTable(conn, table)
+    assert conn.uuid_handle["\x21\x2A"] == [3], "Handles must not be duplicated"
+
+
+def test_persistence(tmpdir):
+    fname = str(tmpdir.join("cache.json"))
+    conn = _mkConnection()
+    _discover(conn)
+
+    cache = Mod.GattCache(fname)
+    assert cache.get("AA:BB") is None
+    cache.set("AA:BB", "\x00\x01\x05", Mod.dumpTable(conn))
+    assert os.path.exists(fname)
+
+    cache = Mod.GattCache(fname)
+    (version, table) = cache.get("AA:BB")
+    assert version == "\x00\x01\x05"
+    assert table == json.loads(json.dumps(Mod.dumpTable(conn)))
+    assert cache.counters["hit"] == 1
+
+    cache.invalidate("AA:BB")
+    assert Mod.GattCache(fname).get("AA:BB") is None
@@ -0,0 +1,172 @@
+import collections
+import threading
+import time
+
+import mock
+
+import PyPush.lib.ble.bgapi.libLock as Mod
+
+GATT_CALL_TIME = 0.05
+
+
+def fake_wraps(fn):
+    """Fake functools.wraps (mocks have no __name__)."""
+    return lambda wrapper: wrapper
+
+
+class _ActivityTracker(object):
+    """Records how many procedures are in flight (in total and per connection)."""
+
+    def __init__(self, rendezvous=None):
+        self.mutex = threading.Lock()
+        self.active = collections.Counter()
+        self.maxActive = collections.Counter()
+        self.calls = collections.Counter()
+        self.errors = []
+        # GATT calls block until `rendezvous` of them are in flight at once
+        self.rendezvous = rendezvous
+        self.allInFlight = threading.Event()
+
+    def gattCall(self, connHandle):
+        with self.mutex:
+            if self.active["scan"]:
+                self.errors.append("GATT call during scan")
+            self.calls[connHandle] += 1
+            self.active[connHandle] += 1
+            self.active["total"] += 1
+            for key in (connHandle, "total"):
+                self.maxActive[key] = max(self.maxActive[key], self.active[key])
+            if self.rendezvous and self.active["total"] >= self.rendezvous:
+                self.allInFlight.set()
+        if self.rendezvous and not self.allInFlight.wait(5):
+            with self.mutex:
+                self.errors.append("GATT calls did not interleave")
+        time.sleep(GATT_CALL_TIME)
+        with self.mutex:
+            self.active[connHandle] -= 1
+            self.active["total"] -= 1
+
+    def scan(self, timeout):
+        with self.mutex:
+            if self.active["total"]:
+                self.errors.append("Scan during GATT call")
+            self.active["scan"] += 1
+        time.sleep(timeout)
+        with self.mutex:
+            self.active["scan"] -= 1
+
+
+def _mkBle(tracker, connCount):
+    client = mock.MagicMock()  # Mocked BlueGigaClient
+    client.scan_all.side_effect = tracker.scan
+
+    connections = []
+    for idx in xrange(connCount):
+        conn = mock.MagicMock()  # Mocked BLEConnection
+        conn.handle = idx
+        conn.read_by_handle.side_effect = (lambda handle, idx=idx, **kw: tracker.gattCall(idx))
+        connections.append(conn)
+    client.connect.side_effect = connections
+
+    root = Mod.LockableBle.RootLock(client)
+    children = [root.getChildLock(root.connect(None)) for _ in xrange(connCount)]
+    return (root, children)
+
+
+@mock.patch("functools.wraps", fake_wraps)
+def test_multi_connection_throughput():
+    connCount = 8
+    readsPerConnection = 5
+    tracker = _ActivityTracker(rendezvous=connCount)
+    (_, children) = _mkBle(tracker, connCount)
+
+    def _worker(conn):
+        for _ in xrange(readsPerConnection):
+            conn.read_by_handle(42)
+
+    # Two threads per connection ensure that the per-connection exclusivity is tested.
+    threads = [
+        threading.Thread(target=_worker, args=(conn, ))
+        for conn in children for _ in xrange(2)
+    ]
+    for thr in threads:
+        thr.start()
+    for thr in threads:
+        thr.join()
+
+    # The rendezvous is only reachable if every connection has a call in flight at once
+    assert tracker.allInFlight.is_set()
+    assert tracker.maxActive["total"] == connCount, "Connections must interleave"
+    for idx in xrange(connCount):
+        assert tracker.calls[idx] == readsPerConnection * 2
+        assert tracker.maxActive[idx] == 1, "Procedures on one connection must not overlap"
+    assert not tracker.errors
+
+
+@mock.patch("functools.wraps", fake_wraps)
+def test_scan_is_exclusive():
+    tracker = _ActivityTracker()
+    (root, children) = _mkBle(tracker, 4)
+
+    stop = threading.Event()
+
+    def _worker(conn):
+        while not stop.is_set():
+            conn.read_by_handle(42)
+
+    threads = [threading.Thread(target=_worker, args=(conn, )) for conn in children]
+    for thr in threads:
+        thr.start()
+    try:
+        for _ in xrange(3):
+            root.scan_all(timeout=0.1)
+    finally:
+        stop.set()
+        for thr in threads:
+            thr.join()
+
+    assert tracker.maxActive["total"] > 1
+    assert not tracker.errors
+
+
+@mock.patch("functools.wraps", fake_wraps)
+def test_reentrant_transactions():
+    tracker = _ActivityTracker()
+    (root, children) = _mkBle(tracker, 2)
+    with root.transaction():
+        # The radio owner can use any connection
+        children[0].read_by_handle(1)
+        with children[1].transaction():
+            children[1].read_by_handle(1)
+            root.scan_all(timeout=0)
+    assert not tracker.errors
+
+
+def test_adaptive_pacing():
+    pacing = Mod.AdaptivePacing()
+    assert pacing.gap == Mod.AdaptivePacing.INITIAL_GAP
+
+    for _ in xrange(100):
+        pacing.onSuccess()
+    assert pacing.gap == Mod.AdaptivePacing.MIN_GAP, "Responsive device: gap shrinks to the minimum"
+
+    pacing.onWrongState()
+    failedAt = Mod.AdaptivePacing.MIN_GAP
+    assert pacing.gap == failedAt * Mod.AdaptivePacing.BACKOFF_FACTOR
+
+    pacing.onSuccess()
+    assert pacing.gap > failedAt, "Gap that had just failed should not be retried immediately"
+
+    for _ in xrange(100):
+        pacing.onWrongState()
+    assert pacing.gap == Mod.AdaptivePacing.MAX_GAP
+
+
+@mock.patch("functools.wraps", fake_wraps)
+def test_pacing_shared_per_device():
+    (root, _) = _mkBle(_ActivityTracker(), 0)
+    conn1 = root.getChildLock(mock.MagicMock(), pacingKey="MB")
+    conn1.getPacing().onWrongState()
+    conn2 = root.getChildLock(mock.MagicMock(), pacingKey="MB")
+    assert conn2.getPacing() is conn1.getPacing(), "Learned gap survives reconnects"
+    assert root.getPacingGaps() == {"MB": conn1.getPacing().gap}
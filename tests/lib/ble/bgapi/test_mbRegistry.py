@@ -0,0 +1,73 @@
+import time
+
+import mock
+
+from bgapi.module import BLEScanResponse
+
+import PyPush.lib.ble.bgapi.mbRegistry as Mod
+
+
+def _mkEvt(addr, created):
+    evt = BLEScanResponse(-50, 0, addr, 1, 0xFF, "\x05\x09mibp")
+    evt.created = created
+    return evt
+
+
+def test_expiry():
+    registry = Mod.MicrobotRegistry(maxAge=60)
+    lost = []
+    registry.onLostCallback(lost.append)
+    now = time.time()
+
+    registry.onScanEvent(_mkEvt("\x01\x00AAAA", now - 120))
+    registry.onScanEvent(_mkEvt("\x02\x00AAAA", now - 30))
+    assert [bot.getBinaryUUID() for bot in lost] == ["\x01\x00AAAA"], "Only the first bot had expired"
+    # Seeing the bot again refreshes it
+    registry.onScanEvent(_mkEvt("\x02\x00AAAA", now))
+    registry.onScanEvent(_mkEvt("\x03\x00AAAA", now))
+    assert [bot.getBinaryUUID() for bot in lost] == ["\x01\x00AAAA"]
+    assert registry._bots.keys() == ["\x02\x00AAAA", "\x03\x00AAAA"]
+
+
+def test_ingestion_does_not_scan_registry():
+    registry = Mod.MicrobotRegistry(maxAge=60)
+    now = time.time()
+    for idx in xrange(1000):
+        registry.onScanEvent(_mkEvt(chr(idx % 256) + chr(idx // 256) + "AAAA", now))
+
+    with mock.patch.object(Mod.BgMicrobot, "_update", autospec=True) as update:
+        update.side_effect = lambda self, other: setattr(self, "_lastSeen", other._lastSeen)
+        registry.onScanEvent(_mkEvt("\x00\x00AAAA", now))
+    assert update.call_count == 1
+    assert len(registry._bots) == 1000
+
+
+def test_link_quality():
+    registry = Mod.MicrobotRegistry()
+    now = time.time()
+    for (addr, rssi) in (("\x01\x00AAAA", -90), ("\x02\x00AAAA", -50)):
+        for step in xrange(20):
+            evt = _mkEvt(addr, now + step * 0.5)
+            evt.rssi = rssi + (step % 2) * 4
+            registry.onScanEvent(evt)
+
+    (far, near) = (registry._bots["\x01\x00AAAA"], registry._bots["\x02\x00AAAA"])
+    assert -90 <= far.getRssi() <= -86
+    assert -50 <= near.getRssi() <= -46
+    assert abs(near.getAdvertRate() - 2) < 0.01, "One advert every 0.5s"
+    assert sorted([far, near], key=lambda mb: mb.getLinkScore(), reverse=True) == [near, far]
+
+    hidden = registry.createMicrobotFromUUID("\x03\x00AAAA")
+    assert hidden.getRssi() is None
+    assert hidden.getLinkScore() < far.getLinkScore(), "Never seen microbots rank last"
+
+
+def test_measured_advert_rate():
+    registry = Mod.MicrobotRegistry()
+    now = time.time()
+    # Scans of irregular cadence; the device is heard 4 times per second of scanning
+    for offset in (0, 0.7, 5, 5.2, 30):
+        evt = _mkEvt("\x01\x00AAAA", now + offset)
+        evt.advert_rate = 4.0
+        registry.onScanEvent(evt)
+    assert registry._bots["\x01\x00AAAA"].getAdvertRate() == 4.0
@@ -0,0 +1,209 @@
+import os
+import random
+import time
+
+import mock
+import pytest
+
+from bgapi.module import BLEScanResponse
+
+import PyPush.lib.ble.bgapi.scanner as Mod
+import PyPush.lib.ble.bgapi.mbRegistry as RegistryMod
+
+MY_ADDRESS = "\x01\x02\x03\x04\x05\x06"
+
+# Ceiling of the mean ingestion cost of a scan event (seconds), far above the expected cost.
+EVENT_COST_CEILING = 2e-4
+
+
+def _segment(typeCode, data):
+    return chr(len(data) + 1) + chr(typeCode) + data
+
+
+def _mkEvents(count, microbots=5, others=300, batchSize=500, staticOthers=False):
+    """Returns `count` synthetic scan responses split into scan batches.
+
+    Non-microbot devices change their manufacturer data on every advertisement (unless `staticOthers`).
+    """
+    rnd = random.Random(42)
+    now = time.time()
+    batches = []
+    for idx in xrange(count):
+        if idx % batchSize == 0:
+            batches.append([])
+        devIdx = rnd.randrange(microbots + others)
+        addr = chr(devIdx % 256) + chr(devIdx // 256) + "\xAA\xBB\xCC\xDD"
+        if devIdx < microbots:
+            data = _segment(0x09, "mibp") + _segment(0xFF, "\x00\x00Bot {}".format(devIdx))
+        else:
+            data = _segment(0x09, "Phone {}".format(devIdx)) + _segment(0xFF, str(0 if staticOthers else idx))
+        evt = BLEScanResponse(-50, 0, addr, 1, 0xFF, data)
+        evt.created = now + idx * 1e-4
+        batches[-1].append(evt)
+    return batches
+
+
+def _mkScanner(registry):
+    ble = mock.MagicMock()
+    ble.get_ble_address.return_value = MY_ADDRESS
+    with mock.patch.object(Mod._ScanThread_, "start"):
+        return Mod.Scanner(ble, registry.onScanEvent)
+
+
+def _ingest(scanner, batches):
+    """Feeds `batches` to the scanner. Returns the time it took."""
+    scanner._scan.ble.scan_all.side_effect = batches
+    start = time.time()
+    for _ in batches:
+        scanner._scan.step()
+    return time.time() - start
+
+
+def _legacyIngest(scanner, batches):
+    """Scan ingestion as it was before the advertisement cache. Returns the time it took."""
+    start = time.time()
+    for batch in batches:
+        batch.sort(key=lambda el: el.created, reverse=True)
+        for evt in batch:
+            evt.parse_advertisement_data()
+            if scanner._isMicrobot(evt):
+                evt.parse_advertisement_data()
+                scanner._cb(evt)
+    return time.time() - start
+
+
+def _botNames(registry):
+    return sorted(bot.getName() for bot in registry._bots.values())
+
+
+def test_scan_ingestion():
+    registry = RegistryMod.MicrobotRegistry()
+    scanner = _mkScanner(registry)
+    batches = _mkEvents(2000, microbots=5, others=0)
+    _ingest(scanner, batches)
+
+    assert _botNames(registry) == ["Bot {}".format(idx) for idx in xrange(5)]
+    counters = scanner._advCache.counters
+    assert counters["parsed"] == 5, "Each microbot payload is parsed once per TTL"
+    assert counters["hit"] == len(batches) * 5 - 5
+
+
+def test_scan_ingestion_load():
+    """10k scan events of 5 microbots among 300 other devices."""
+    eventCount = 10000
+    for staticOthers in (False, True):
+        registry = RegistryMod.MicrobotRegistry()
+        scanner = _mkScanner(registry)
+        elapsed = _ingest(scanner, _mkEvents(eventCount, staticOthers=staticOthers))
+
+        assert _botNames(registry) == ["Bot {}".format(idx) for idx in xrange(5)]
+        assert elapsed < eventCount * EVENT_COST_CEILING, (staticOthers, elapsed)
+    assert scanner._advCache.counters["parsed"] <= 305, "Each device is parsed once per TTL"
+
+
+@pytest.mark.skipif(not os.environ.get("PYPUSH_BENCHMARK"), reason="Set PYPUSH_BENCHMARK=1 to run.")
+def test_scan_ingestion_benchmark():
+    eventCount = 10000
+    for staticOthers in (False, True):
+        legacyRegistry = RegistryMod.MicrobotRegistry()
+        legacyTime = _legacyIngest(
+            _mkScanner(legacyRegistry), _mkEvents(eventCount, staticOthers=staticOthers))
+
+        registry = RegistryMod.MicrobotRegistry()
+        scanner = _mkScanner(registry)
+        cachedTime = _ingest(scanner, _mkEvents(eventCount, staticOthers=staticOthers))
+
+        print "{} scan events (static payloads: {}): {:.3f}s before, {:.3f}s with the cache ({})".format(
+            eventCount, staticOthers, legacyTime, cachedTime, dict(scanner._advCache.counters))
+        assert _botNames(registry) == _botNames(legacyRegistry)
+        if staticOthers:
+            assert cachedTime < legacyTime
+
+
+def test_newest_per_address():
+    events = _mkEvents(50, microbots=2, others=0, batchSize=50)[0]
+    random.Random(1).shuffle(events)
+    received = []
+    thread = Mod._ScanThread_(mock.MagicMock(), 3600, received.append)
+    thread.ble.scan_all.return_value = events
+    thread.step()
+
+    assert len(received) == 2
+    for evt in received:
+        assert evt.created == max(
+            el.created for el in events if el.sender == evt.sender)
+
+
+def test_advert_rate():
+    now = time.time()
+    events = []
+    for (addr, count) in (("\x01\x00AAAA", 3), ("\x02\x00AAAA", 1)):
+        for idx in xrange(count):
+            evt = BLEScanResponse(-50, 0, addr, 1, 0xFF, _segment(0x09, "mibp"))
+            evt.created = now + idx * 0.1
+            events.append(evt)
+    received = []
+    thread = Mod._ScanThread_(mock.MagicMock(), 3600, received.append)
+    thread.ble.scan_all.return_value = events
+    thread.step()
+
+    rates = dict((evt.sender, evt.advert_rate) for evt in received)
+    assert rates == {"\x01\x00AAAA": 3 / thread.scheduler.window, "\x02\x00AAAA": 1 / thread.scheduler.window}
+
+
+def test_cache_expiry():
+    isMicrobot = mock.MagicMock(return_value=False)
+    cache = Mod.AdvertisementCache(isMicrobot, ttl=10)
+    evt = BLEScanResponse(-50, 0, "ADDR", 1, 0xFF, _segment(0x09, "Phone"))
+    assert not cache.classify(evt)
+    assert not cache.classify(evt)
+    assert isMicrobot.call_count == 1, "Negative verdict is remembered"
+
+    evt.created += 11
+    cache.classify(evt)
+    assert isMicrobot.call_count == 2, "Verdict expires after the TTL"
+    assert len(evt.adv_payload) == 1, "Payload is not parsed twice"
+
+
+def test_cache_payload_change():
+    registry = RegistryMod.MicrobotRegistry()
+    scanner = _mkScanner(registry)
+    cache = scanner._advCache
+    evt = BLEScanResponse(-50, 0, "ADDR", 1, 0xFF, _segment(0xFF, "\x00\x00"))
+    assert not cache.classify(evt)
+
+    # The same device starts advertising the microbot name within the verdict TTL
+    evt = BLEScanResponse(-50, 0, "ADDR", 1, 0xFF, _segment(0x09, "mibp"))
+    assert cache.classify(evt), "Changed payload is re-checked"
+    assert cache.counters["parsed"] == 2
+
+
+def test_whitelist_scan():
+    registry = RegistryMod.MicrobotRegistry()
+    scanner = _mkScanner(registry)
+    thread = scanner._scan
+    api = thread.ble._api
+    batches = _mkEvents(2000, microbots=5, others=50)
+    thread.ble.scan_all.side_effect = batches
+
+    paired = batches[0][0].sender
+    scanner.whitelist.set([paired])
+    # The first scan is the discovery one (unfiltered)
+    thread.step()
+    api.ble_cmd_system_whitelist_append.assert_called_once_with(paired, 1)
+    assert not api.ble_cmd_gap_set_filtering.called
+    discovered = set(registry._bots.keys())
+    assert len(discovered) > 1
+
+    registry._bots.clear()
+    parsed = scanner._advCache.counters["parsed"]
+    thread.step()
+    api.ble_cmd_gap_set_filtering.assert_called_once_with(thread.WHITELIST_SCAN_POLICY, 0, 0)
+    assert set(registry._bots.keys()) <= set([paired]), "Only whitelisted adverts are inspected"
+    assert scanner._advCache.counters["parsed"] - parsed <= 1
+
+    # Periodic discovery slice
+    scanner.whitelist._nextDiscovery = 0
+    thread.step()
+    api.ble_cmd_gap_set_filtering.assert_called_with(0, 0, 0)
+    assert len(registry._bots) > 1
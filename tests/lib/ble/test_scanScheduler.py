@@ -0,0 +1,68 @@
+import threading
+import time
+
+from PyPush.lib.const import ScanDemand
+
+import PyPush.lib.ble.scanScheduler as Mod
+
+
+def _mkScheduler():
+    return Mod.ScanScheduler(window=0.05, pauses={
+        ScanDemand.low: 0.5,
+        ScanDemand.normal: 0.1,
+        ScanDemand.high: 0,
+    })
+
+
+def _scanFor(scheduler, duration):
+    """Runs the scan loop for `duration` seconds, returns number of scans performed."""
+    count = 0
+    end = time.time() + duration
+    while time.time() < end:
+        scheduler.waitForSlot()
+        with scheduler.scanning():
+            time.sleep(scheduler.window)
+        count += 1
+    return count
+
+
+def test_duty_cycle():
+    scheduler = _mkScheduler()
+    scheduler.setDemand(ScanDemand.high)
+    high = _scanFor(scheduler, 0.5)
+    assert scheduler.getScanFraction() > 0.8
+
+    scheduler.setDemand(ScanDemand.low)
+    low = _scanFor(scheduler, 0.5)
+    assert low < high
+    assert scheduler.getStats()["demand"] == "low"
+
+
+def test_paused_during_actions():
+    scheduler = _mkScheduler()
+    scheduler.setDemand(ScanDemand.high)
+    scans = []
+
+    def _scanThread():
+        while not stop.is_set():
+            scheduler.waitForSlot()
+            scans.append(time.time())
+            with scheduler.scanning():
+                time.sleep(scheduler.window)
+
+    stop = threading.Event()
+    thread = threading.Thread(target=_scanThread)
+    thread.daemon = True
+    thread.start()
+
+    time.sleep(0.1)
+    with scheduler.paused():
+        time.sleep(scheduler.window * 1.5) # let the in-progress scan finish
+        pauseStart = time.time()
+        time.sleep(0.3)
+        pauseEnd = time.time()
+    time.sleep(0.1)
+    stop.set()
+
+    assert not [ts for ts in scans if pauseStart <= ts <= pauseEnd], "No scans during the action"
+    assert scans[-1] > pauseEnd, "Scanning resumes after the action"
@@ -0,0 +1,77 @@
+import threading
+import time
+
+import mock
+import pytest
+
+import PyPush.lib.const as const
+import PyPush.lib.exceptions as excpt
+import PyPush.lib.ble.iApi as iBle
+import PyPush.lib.microbot.fwMicrobot as Mod
+from PyPush.lib.microbot.subscribingReader import SubscribingReader
+
+SRV = const.PushServiceId
+
+
+def _mkOverlay():
+    conn = mock.create_autospec(iBle.iConnection)
+    conn.readMany.side_effect = lambda keys, timeout: ["\x00" for _ in keys]
+    mb = mock.MagicMock()
+    mb._conn.return_value = conn
+    mb.reader = SubscribingReader(mb)
+    overlay = Mod.FirmwareV010(mb)
+    mb.isRetracted.side_effect = overlay.isRetracted
+    return (overlay, mb, conn)
+
+
+def _notify(conn, char):
+    for ((srv, ch, cb), _) in conn.onNotify.call_args_list:
+        if (srv, ch) == (SRV, char):
+            cb("\x01")
+
+
+def test_init_without_notification():
+    (overlay, mb, conn) = _mkOverlay()
+    assert overlay.getState() == overlay.UNKNOWN
+    start = time.time()
+    assert overlay.isRetracted(timeout=0.1) is True
+    assert time.time() - start < 1
+    assert overlay.getState() == overlay.READY
+    conn.write.assert_called_once_with(SRV, "2A12", "\x01")
+
+    assert overlay.isRetracted(timeout=0.1) is True
+    assert conn.write.call_count == 1, "The forced retract is sent once"
+
+
+def test_notification_driven():
+    (overlay, mb, conn) = _mkOverlay()
+    changes = []
+    overlay.retractedStateChange.subscribe(lambda old, new: changes.append(new))
+    overlay.waitReady(0)
+    assert overlay.getState() == overlay.INITIALISING
+
+    _notify(conn, "2A12")
+    assert overlay.getState() == overlay.READY
+    assert overlay.waitReady(0)
+    assert changes == [], "State did not change"
+
+    start = time.time()
+    _notify(conn, "2A11")
+    assert time.time() - start < 0.5, "No sleeps on the notification thread"
+    assert overlay.isRetracted() is False
+    assert changes == [False]
+
+
+@mock.patch.object(Mod.FirmwareV010, "MOVE_TIME", 0.01)
+def test_wait_for_state_change():
+    (overlay, mb, conn) = _mkOverlay()
+    overlay.waitReady(0)
+    _notify(conn, "2A12")
+
+    with overlay.waitForPusherStateChange(timeout=5):
+        threading.Timer(0.05, _notify, (conn, "2A11")).start()
+    assert overlay.isRetracted() is False
+
+    with pytest.raises(excpt.StateChangeError):
+        with overlay.waitForPusherStateChange(timeout=0.05):
+            pass
@@ -2,9 +2,12 @@ import mock
 import re
 import pytest
 import itertools
+import threading
+import time
 
 import PyPush.lib.async.subscribe as Subscribe
 import PyPush.lib.microbot as Mod
+import PyPush.lib.microbot.microbot as MbMod
 import PyPush.lib.iLib as iLib
 import PyPush.lib.ble.iApi as iBle
 import PyPush.lib.exceptions as excpt
@@ -25,6 +28,8 @@ def setup():
     bleMb.getUID.return_value = MB_UID
     keyDb.get.return_value = PAIR_KEY
     bleApi.getUID.return_value = HOST_UID
+    keyDb.getFirmwareVersion.return_value = None
+    MbMod.FIRMWARE_CACHE.invalidate(MB_UID)
 
     mb = Mod.MicrobotPush(bleApi, bleMb, keyDb)
 
@@ -83,6 +88,7 @@ def test_nopair_connect():
     mb.connect()
 
     assert mb.isConnected()
+    mb.disconnect()
 
 
 def test_conn_refused():
@@ -136,6 +142,7 @@ def test_led():
             bitTag = b << 2 | g << 1 | r
             expData = "\x01{}\x00\x00\x00{}".format(chr(bitTag), chr(dur))
             assert data == expData, (data, expData)
+    mb.disconnect()
 
 
 def test_pair_success():
@@ -168,6 +175,7 @@ def test_pair_success():
 
     assert mb.isConnected()
     db.set.assert_called_with(MB_UID, PAIR_KEY)
+    mb.disconnect()
 
 
 def test_pair_no_touch():
@@ -200,3 +208,272 @@ def test_pair_no_touch():
             pass
 
     assert not mb.isConnected()
+
+
+@mock.patch.object(Mod.pairing.PairingSession, "LED_PERIOD", 0.05)
+def test_pair_colours():
+    data = setup()
+    mb = data["mb"]
+    conn = data["ble"]["conn"]
+    data["ble"]["data"].update({
+        ("1831", "2A98"): [
+            {"t": "RECV", "d": ".*\x00{16}"},
+            {"t": "SEND", "d": "\x02" * 16},
+        ],
+        ("1831", "2A90"): [{"t": "RECV", "d": ".*"}] * 2,
+        ("1831", "2A14"): [{"t": "RECV", "d": ".*"}] * 100,
+    })
+
+    colours = []
+    for colour in mb.pair():
+        colours.append(colour)
+        if len(colours) == 4:
+            conn.write.side_effect = None
+            for ((srv, ch, cb), _) in conn.onNotify.call_args_list:
+                if (srv, ch) == ("1831", "2A90"):
+                    cb("\x01" + PAIR_KEY)
+    assert colours[:4] == list(mb._getPairColourSequence()) * 2, "Each colour change is yielded once"
+    assert mb.isConnected()
+    mb.disconnect()
+
+
+@mock.patch("time.sleep")
+def test_press(sleep):
+    data = setup()
+    mb = data["mb"]
+    data["db"].hasKey.return_value = True
+    mb.connect()
+
+    readWhileHeld = []
+    def _hold(seconds):
+        # State is readable by the other threads while the button is held
+        reader = threading.Thread(target=lambda: readWhileHeld.append(mb.isConnected()))
+        reader.start()
+        reader.join(1)
+        assert readWhileHeld == [True]
+    sleep.side_effect = _hold
+
+    calls = []
+    with mock.patch.object(mb, "extend", side_effect=lambda: calls.append("extend")), \
+            mock.patch.object(mb, "retract", side_effect=lambda: calls.append("retract")):
+        timings = mb.press(2)
+
+    assert calls == ["extend", "retract"]
+    sleep.assert_called_once_with(2)
+    assert set(timings.keys()) == set(["extend", "hold", "retract", "total"])
+    assert mb.isConnected()
+    mb.disconnect()
+
+
+@mock.patch.object(Mod.fwMicrobot.FirmwareV010, "MOVE_TIME", 0.01)
+def test_press_notifications():
+    data = setup()
+    mb = data["mb"]
+    db = data["db"]
+    conn = data["ble"]["conn"]
+    db.hasKey.return_value = True
+    db.getFirmwareVersion.return_value = (0, 1, 0)
+    conn.read.return_value = "\x00"
+    conn.readMany.side_effect = lambda keys, timeout=5: ["\x00" for _ in keys]
+    mb.connect()
+
+    writes = []
+    def _write(service, char, data):
+        # The microbot notifies of the pusher commands it executes
+        writes.append(char)
+        for ((cbService, cbChar, cb), _) in conn.onNotify.call_args_list:
+            if (cbService, cbChar) == (service, char):
+                cb(data)
+    conn.write.side_effect = _write
+
+    timings = mb.press(0.05)
+    assert writes == ["2A12", "2A11", "2A12"], "Forced retract on init, extend, retract"
+    assert mb.isRetracted()
+    assert timings["hold"] >= 0.05
+    assert timings["extend"] >= 0.01 and timings["retract"] >= 0.01, "Pusher movement is awaited"
+    assert abs(timings["total"] - sum(timings[key] for key in ("extend", "hold", "retract"))) < 1e-6
+    mb.disconnect()
+
+
+def test_fast_reconnect():
+    data = setup()
+    mb = data["mb"]
+    db = data["db"]
+    conn = data["ble"]["conn"]
+    db.hasKey.return_value = True
+
+    mb.connect()
+    assert db.get.call_count == 1
+    fwReads = conn.read.call_count
+
+    data["ble"]["data"][("1831", "2A98")].extend([
+        {"t": "RECV", "d": "^.*{}$".format(PAIR_KEY)},
+        {"t": "SEND", "d": "\x01" + ("\x00" * 15)},
+    ])
+    mb._sneakyConnect(reconnect=True)
+    assert db.get.call_count == 1, "Cached pairing key is reused"
+    assert conn.read.call_count == fwReads, "Firmware version is not re-read"
+
+    stats = mb.getConnectStats()
+    assert stats["connect"]["count"] == 1
+    assert stats["reconnect"]["count"] == 1
+    assert sum(cnt for (_, cnt) in stats["reconnect"]["histogram"]) == 1
+    mb.disconnect()
+
+
+def test_connect_failure_closes_connection():
+    data = setup()
+    mb = data["mb"]
+    db = data["db"]
+    conn = data["ble"]["conn"]
+    db.hasKey.return_value = True
+
+    # Firmware version read fails while the key is being validated
+    conn.read.side_effect = excpt.IOError("Read failed")
+    with pytest.raises(excpt.IOError):
+        mb._sneakyConnect()
+    assert conn.close.called
+    assert mb._pairKey is None
+
+    # Status request fails on the reconnect path
+    conn.read.side_effect = None
+    conn.read.return_value = "\x00\x01\x05"
+    data["ble"]["data"][("1831", "2A98")].extend([
+        {"t": "RECV", "d": "^.*{}$".format(PAIR_KEY)},
+        {"t": "SEND", "d": "\x01" + ("\x00" * 15)},
+    ])
+    mb.connect()
+    conn.reset_mock()
+    conn.write.side_effect = excpt.IOError("Write failed")
+    with pytest.raises(excpt.IOError):
+        mb._sneakyConnect(reconnect=True)
+    assert conn.close.called
+    mb.disconnect()
+
+
+def test_async_api():
+    data = setup()
+    mb = data["mb"]
+    conn = data["ble"]["conn"]
+    data["db"].hasKey.return_value = True
+
+    mb.connect()
+    conn.write.reset_mock()
+    conn.write.side_effect = None
+    futures = [mb.ledAsync(1, 0, 0, dur) for dur in (1, 2, 3)]
+    for future in futures:
+        assert future.result(timeout=5) is None
+    writes = [args[2] for (args, _) in conn.write.call_args_list]
+    assert [ord(data[-1]) for data in writes] == [1, 2, 3], "Calls are executed in order"
+
+    mb.disconnect()
+    with pytest.raises(excpt.WrongConnectionState):
+        mb.ledAsync(1, 1, 1, 1).result(timeout=5)
+
+
+def test_pair_async():
+    data = setup()
+    mb = data["mb"]
+    db = data["db"]
+    conn = data["ble"]["conn"]
+    data["ble"]["data"].update({
+        ("1831", "2A98"): [
+            {"t": "RECV", "d": ".*\x00{16}"},
+            {"t": "SEND", "d": "\x02" * 16},
+        ],
+        ("1831", "2A90"): [
+            # The user does not touch the microbot yet
+            {"t": "RECV", "d": chr(len(HOST_UID)) + HOST_UID + ".*"},
+            {"t": "RECV", "d": "\x00"},
+        ],
+        ("1831", "2A14"): [
+            {"t": "RECV", "d": ".*"},
+        ] * 5,
+    })
+
+    future = mb.pairAsync()
+    # The executor is free while waiting for the user's touch
+    assert mb.getBatteryLevelAsync().exception(timeout=5) is not None, "Not connected yet"
+    assert not future.done()
+
+    for ((srv, ch, cb), _) in conn.onNotify.call_args_list:
+        if (srv, ch) == ("1831", "2A90"):
+            cb("\x01" + PAIR_KEY)
+    assert future.result(timeout=5) is None
+    assert mb.isConnected()
+    db.set.assert_called_with(MB_UID, PAIR_KEY)
+    mb.disconnect()
+
+
+def test_pair_async_cancel():
+    data = setup()
+    mb = data["mb"]
+    conn = data["ble"]["conn"]
+    data["ble"]["data"][("1831", "2A98")] = [
+        {"t": "RECV", "d": ".*\x00{16}"},
+        {"t": "SEND", "d": "\x02" * 16},
+    ]
+    data["ble"]["data"][("1831", "2A90")] = [{"t": "RECV", "d": ".*"}] * 2
+    data["ble"]["data"][("1831", "2A14")] = [{"t": "RECV", "d": ".*"}] * 5
+
+    future = mb.pairAsync()
+    endTime = time.time() + 5
+    while not conn.write.call_args or conn.write.call_args[0][1] != "2A14":
+        # The session is started once the LED colour is set
+        assert time.time() < endTime, "Pairing session did not start"
+        time.sleep(0.01)
+    assert future.cancel()
+    with pytest.raises(excpt.Cancelled):
+        future.result(timeout=5)
+    while not conn.close.called and time.time() < endTime:
+        time.sleep(0.01)
+    assert conn.close.called, "Pairing session is cancelled"
+    assert not mb.isConnected()
+
+
+def test_firmware_cache():
+    data = setup()
+    db = data["db"]
+    conn = data["ble"]["conn"]
+    db.hasKey.return_value = True
+    conn.read.return_value = "\x00\x01\x05"
+
+    data["mb"].connect()
+    conn.read.assert_called_once_with("1831", "2A21")
+    db.setFirmwareVersion.assert_called_once_with(MB_UID, (0, 1, 5))
+    data["mb"].disconnect()
+
+    # Another session with the same device
+    mb = Mod.MicrobotPush(data["ble"]["api"], data["ble"]["mb"], db)
+    data["ble"]["data"][("1831", "2A98")].extend([
+        {"t": "RECV", "d": "^.*{}$".format(PAIR_KEY)},
+        {"t": "SEND", "d": "\x01" + ("\x00" * 15)},
+    ])
+    mb.connect()
+    assert conn.read.call_count == 1, "Firmware version is cached"
+    assert mb.getFirmwareVersion() == (0, 1, 5)
+    assert conn.read.call_count == 1
+
+    # Unknown status invalidates the cache
+    mb.disconnect()
+    data["ble"]["data"][("1831", "2A98")].extend([
+        {"t": "RECV", "d": "^.*{}$".format(PAIR_KEY)},
+        {"t": "SEND", "d": "\x07" + ("\x00" * 15)},
+    ])
+    with pytest.raises(excpt.NotPaired):
+        mb.connect()
+    db.setFirmwareVersion.assert_called_with(MB_UID, None)
+    assert MbMod.FIRMWARE_CACHE.get(MB_UID) is None
+
+
+def test_firmware_from_storage():
+    data = setup()
+    db = data["db"]
+    conn = data["ble"]["conn"]
+    db.hasKey.return_value = True
+    db.getFirmwareVersion.return_value = [0, 1, 0]
+
+    data["mb"].connect()
+    assert not conn.read.called
+    assert isinstance(data["mb"]._fwOverlay, Mod.fwMicrobot.FirmwareV010)
+    data["mb"].disconnect()
@@ -0,0 +1,97 @@
+import contextlib
+import threading
+
+import mock
+import pytest
+
+import PyPush.lib.ble.iApi as iBle
+import PyPush.lib.exceptions as excpt
+import PyPush.lib.microbot.microbot as MbMod
+import PyPush.lib.microbot.pairing as Mod
+
+# Shared by all connections (as the BLE radio is)
+BLE_LOCK = threading.Lock()
+
+
+def _mkSession(uid):
+    conn = mock.create_autospec(iBle.iConnection)
+    conn.transaction.side_effect = lambda: _locked()
+    mb = mock.MagicMock()
+    mb.getUID.return_value = uid
+    mb._getHostUUID.return_value = "AABBCCDDEEFF"
+    mb._getPairColourSequence.return_value = (
+        MbMod.LedStatus(True, False, True),
+        MbMod.LedStatus(True, True, False),
+    )
+    return (Mod.PairingSession(mb, conn), mb, conn)
+
+
+@contextlib.contextmanager
+def _locked():
+    assert BLE_LOCK.acquire(False), "BLE lock is not taken by the waiting sessions"
+    try:
+        yield
+    finally:
+        BLE_LOCK.release()
+
+
+def _reply(conn, data):
+    ((srv, ch, cb), _) = conn.onNotify.call_args
+    assert (srv, ch) == (Mod.PairingSession.SERVICE_ID, Mod.PairingSession.PAIR_CH)
+    cb(data)
+
+
+@mock.patch.object(Mod.PairingSession, "LED_PERIOD", 0.01)
+def test_concurrent_sessions():
+    (okSession, okMb, okConn) = _mkSession("MB_OK")
+    (failSession, failMb, failConn) = _mkSession("MB_FAIL")
+    okSession.start()
+    failSession.start()
+
+    assert not okSession.wait(0.1)
+    assert okMb._sneakyLed.call_count > 1, "LED colour keeps changing"
+    with _locked():
+        pass # other traffic is not blocked
+
+    _reply(failConn, "\x04" * 17)
+    _reply(okConn, "\x01" + "K" * 16)
+    assert okSession.wait(1) and failSession.wait(1)
+
+    okSession.result()
+    okMb._completePairing.assert_called_once_with(okConn, "K" * 16)
+    assert not okConn.close.called
+
+    with pytest.raises(excpt.NotPaired):
+        failSession.result()
+    assert failConn.close.called
+    assert not failMb._completePairing.called
+
+    ledCalls = okMb._sneakyLed.call_count
+    threading.Event().wait(0.05)
+    assert okMb._sneakyLed.call_count == ledCalls, "LED refresh stops with the session"
+
+
+def test_cancel():
+    (session, mb, conn) = _mkSession("MB")
+    session.start()
+    session.cancel()
+    assert session.done()
+    assert session.getState() == session.CANCELLED
+    assert conn.close.called
+
+    _reply(conn, "\x01" + "K" * 16) # late reply is ignored
+    with pytest.raises(excpt.NotPaired):
+        session.result()
+    assert not mb._completePairing.called
+
+
+@mock.patch.object(Mod.PairingSession, "LED_PERIOD", 10)
+def test_timeout():
+    (session, mb, conn) = _mkSession("MB")
+    session.timeout = 0.05
+    session.start()
+    assert session.wait(5)
+    assert session.getState() == session.FAILED
+    assert conn.close.called
+    with pytest.raises(excpt.NotPaired):
+        session.result()
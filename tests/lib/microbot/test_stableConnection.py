@@ -0,0 +1,112 @@
+import threading
+import time
+
+import mock
+import pytest
+
+import PyPush.lib.ble.iApi as iBle
+import PyPush.lib.exceptions as excpt
+import PyPush.lib.microbot.stableConnection as Mod
+
+
+def _mkConn(active=True):
+    conn = mock.create_autospec(iBle.iConnection)
+    conn.isActive.return_value = active
+    return conn
+
+
+def _waitForState(stable, state, timeout=5):
+    endTime = time.time() + timeout
+    while stable.getState() != state and time.time() < endTime:
+        time.sleep(0.01)
+    return stable.getState()
+
+
+def _mkStable(sneakyConnect):
+    mb = mock.MagicMock()
+    mb.getUID.return_value = "MB_UID"
+    mb._sneakyConnect.side_effect = sneakyConnect
+    oldConn = _mkConn()
+    return (Mod.StableAuthorisedConnection(mb, oldConn), mb, oldConn)
+
+
+@mock.patch.object(Mod.StableAuthorisedConnection, "CHECK_PERIOD", 0.01)
+def test_background_reconnect():
+    newConn = _mkConn()
+    (stable, mb, oldConn) = _mkStable(lambda reconnect, owner: newConn)
+    assert stable.get() is oldConn
+
+    oldConn.isActive.return_value = False
+    assert stable.get(timeout=5) is newConn
+    mb._sneakyConnect.assert_called_once_with(reconnect=True, owner=stable)
+    assert oldConn.close.called
+
+    assert _waitForState(stable, stable.READY) == stable.READY
+    assert mb._onReconnect.called
+    stats = stable.getStats()
+    assert stats["reconnects"] == 1
+    assert stats["time_to_ready"]["count"] == 1
+    stable.close()
+
+
+@mock.patch.object(Mod.StableAuthorisedConnection, "CHECK_PERIOD", 0.01)
+def test_get_deadline():
+    release = threading.Event()
+    newConn = _mkConn()
+
+    def _slowConnect(reconnect, owner):
+        release.wait(5)
+        return newConn
+
+    (stable, mb, oldConn) = _mkStable(_slowConnect)
+    oldConn.isActive.return_value = False
+    with pytest.raises(excpt.Timeout):
+        stable.get(timeout=0.1)
+    assert stable.getState() == stable.RECONNECTING
+    assert stable.isActive()
+
+    release.set()
+    assert stable.get(timeout=5) is newConn
+    stable.close()
+
+
+@mock.patch.object(Mod.StableAuthorisedConnection, "CHECK_PERIOD", 0.01)
+def test_reconnect_failure():
+    def _refused(reconnect, owner):
+        raise excpt.NotPaired(0x03, "Pairing key mismatch.")
+
+    (stable, mb, oldConn) = _mkStable(_refused)
+    oldConn.isActive.return_value = False
+    with pytest.raises(excpt.ConnectionError):
+        stable.get(timeout=5)
+    assert not stable.isActive()
+    assert mb._sneakyConnect.call_count == 1, "Not-retryable errors are not retried"
+
+
+@mock.patch.object(Mod.StableAuthorisedConnection, "CHECK_PERIOD", 0.01)
+def test_close_while_reconnecting():
+    published = []
+
+    def _connect(reconnect, owner):
+        owner.close() # disconnect() racing with the reconnect
+        assert not owner.publish(lambda: published.append("key"))
+        newConn.isActive.return_value = False
+        return newConn
+
+    newConn = _mkConn()
+    (stable, mb, oldConn) = _mkStable(_connect)
+    oldConn.isActive.return_value = False
+    with pytest.raises(excpt.ConnectionError):
+        stable.get(timeout=5)
+    assert published == [], "Session state is not published after close()"
+    assert not mb._onReconnect.called
+
+
+def test_supervisor_thread_exits():
+    (stable, mb, oldConn) = _mkStable(lambda reconnect, owner: _mkConn())
+    assert Mod.SUPERVISOR._running
+    stable.close()
+    endTime = time.time() + 5
+    while Mod.SUPERVISOR._running and time.time() < endTime:
+        time.sleep(0.01)
+    assert not Mod.SUPERVISOR._running, "No thread is left polling closed connections"
@@ -0,0 +1,71 @@
+import mock
+
+import PyPush.lib.ble.iApi as iBle
+import PyPush.lib.ble.exceptions as bleExceptions
+import PyPush.lib.microbot.subscribingReader as Mod
+
+BATTERY = ("1821", "2A19")
+VERSION = ("1821", "2A21")
+MODE = ("1831", "2A53")
+
+
+def _mkReader(policies=None):
+    conn = mock.create_autospec(iBle.iConnection)
+    conn.readMany.side_effect = lambda keys, timeout: ["v" + key[1] for key in keys]
+    mb = mock.MagicMock()
+    mb._conn.return_value = conn
+    return (Mod.SubscribingReader(mb, policies), conn)
+
+
+def test_notify_backed():
+    (reader, conn) = _mkReader()
+    assert reader.read(*BATTERY) == "v2A19"
+    assert reader.read(*BATTERY) == "v2A19"
+    assert conn.readMany.call_count == 1
+    assert reader.getStats() == {"hit": 1, "miss": 1, "stale": 0}
+
+    ((_, _, notifyCb), _) = conn.onNotify.call_args
+    notifyCb("new")
+    assert reader.read(*BATTERY) == "new"
+    assert conn.readMany.call_count == 1
+
+
+@mock.patch("time.time")
+def test_max_age(now):
+    now.return_value = 1000
+    (reader, conn) = _mkReader({
+        BATTERY: Mod.FreshnessPolicy(maxAge=60, notify=True),
+        VERSION: Mod.FreshnessPolicy(maxAge=None, notify=False),
+    })
+    reader.readMany([BATTERY, VERSION])
+    assert conn.onNotify.call_count == 1, "Polled values are not subscribed to"
+
+    now.return_value = 1061
+    reader.readMany([BATTERY, VERSION])
+    conn.readMany.assert_called_with([BATTERY], timeout=15)
+    assert reader.getStats() == {"hit": 1, "miss": 2, "stale": 1}
+
+
+def test_resubscribe_prefetch():
+    (reader, conn) = _mkReader()
+    reader.read(*MODE)
+    conn.readMany.reset_mock()
+    conn.onNotify.reset_mock()
+
+    reader.reSubscribe([BATTERY, VERSION])
+    conn.readMany.assert_called_once_with([BATTERY, VERSION, MODE], timeout=15)
+    assert conn.onNotify.call_count == 3
+
+    assert reader.readMany([BATTERY, VERSION, MODE]) == ["v2A19", "v2A21", "v2A53"]
+    assert conn.readMany.call_count == 1, "Served from the prefetched values"
+
+
+def test_resubscribe_unreadable():
+    (reader, conn) = _mkReader()
+    conn.readMany.side_effect = bleExceptions.NotSupported()
+    conn.read.side_effect = lambda srv, char, timeout: "v" + char
+    conn.onNotify.side_effect = bleExceptions.NotSupported()
+
+    reader.reSubscribe([BATTERY, MODE])
+    assert conn.read.call_count == 2
+    assert reader._unsupported == set([BATTERY, MODE])
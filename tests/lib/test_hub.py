@@ -1,6 +1,11 @@
 import datetime
+import threading
+import time
+
 import mock
 
+import PyPush.lib.async as Async
+import PyPush.lib.exceptions as excpt
 import PyPush.lib.hub as Mod
 import PyPush.lib.iLib as Interfaces
 
@@ -17,6 +22,8 @@ def test_microbot_gc(timerMock, bleGetLib):
     db = mock.create_autospec(Interfaces.iPairingKeyStorage)
 
     HUB = Mod.PushHub(config, db)
+    lost = mock.MagicMock()
+    HUB.onMicrobot(None, lost)
 
     assert timerMock.call_count == 1
     now = datetime.datetime.now()
@@ -37,7 +44,8 @@ def test_microbot_gc(timerMock, bleGetLib):
     HUB._onBleScan(_getMb(24 * 60 * 60 - 60))
     assert len(HUB.getAllMicrobots()) == 3
     # 1 second over default gc max age
-    HUB._onBleScan(_getMb(24 * 60 * 60 + 1))
+    oldMb = _getMb(24 * 60 * 60 + 1)
+    HUB._onBleScan(oldMb)
     assert len(HUB.getAllMicrobots()) == 4
 
     HUB._onBleScan(_getMb(60))
@@ -51,3 +59,113 @@ def test_microbot_gc(timerMock, bleGetLib):
 
     assert len(HUB.getAllMicrobots()
                ) == 3, "The daytime + 1 second should be removed"
+    lost.assert_called_once_with(oldMb)
+
+
+@mock.patch("PyPush.lib.ble.getLib")
+@mock.patch("threading.Timer")
+@mock.patch("PyPush.lib.microbot.MicrobotPush", _retBleMb)
+def test_microbot_lost_by_ble(timerMock, bleGetLib):
+    HUB = Mod.PushHub({}, mock.create_autospec(Interfaces.iPairingKeyStorage))
+    (onLost, ), _ = bleGetLib.return_value.onLost.call_args
+    lost = mock.MagicMock()
+    HUB.onMicrobot(None, lost)
+
+    mbs = []
+    for (uid, connected) in (("A", False), ("B", True)):
+        mb = mock.create_autospec(Interfaces.iMicrobot)
+        mb.getUID.return_value = uid
+        mb.isConnected.return_value = connected
+        HUB._onBleScan(mb)
+        mbs.append(mb)
+
+    for mb in mbs:
+        onLost(mb)
+    lost.assert_called_once_with(mbs[0])
+    assert HUB.getAllMicrobots() == [mbs[1]], "Connected microbots are kept"
+
+
+@mock.patch("PyPush.lib.ble.getLib")
+@mock.patch("threading.Timer")
+@mock.patch("PyPush.lib.microbot.MicrobotPush", _retBleMb)
+def test_fleet_ops(timerMock, bleGetLib):
+    HUB = Mod.PushHub({"max_connections": 2}, mock.create_autospec(Interfaces.iPairingKeyStorage))
+    active = []
+    maxActive = []
+    mutex = threading.Lock()
+
+    def _press(holdSeconds):
+        with mutex:
+            active.append(1)
+            maxActive.append(len(active))
+        time.sleep(0.05)
+        with mutex:
+            active.pop()
+        return holdSeconds
+
+    for uid in ("A", "B", "C", "D", "E"):
+        mb = mock.create_autospec(Interfaces.iMicrobot)
+        mb.getUID.return_value = uid
+        mb.isConnected.return_value = (uid != "E")
+        executor = Async.SerialExecutor(uid)
+        mb.callAsync.side_effect = executor.submit
+        mb.press.side_effect = _press
+        HUB._onBleScan(mb)
+    HUB._microbots["D"].press.side_effect = excpt.IOError("Pusher is stuck")
+
+    rv = HUB.pressAll(holdSeconds=2)
+    assert sorted(rv["results"].keys()) == ["A", "B", "C", "D"], "Connected microbots only"
+    assert (rv["succeeded"], rv["failed"]) == (3, 1)
+    assert rv["results"]["A"]["result"] == 2
+    assert rv["results"]["A"]["latency"] >= 0.05
+    assert isinstance(rv["results"]["D"]["error"], excpt.IOError)
+    assert rv["latency"]["count"] == 3
+    assert max(maxActive) == 2, "Microbots are pressed concurrently, limited by the connection count"
+    assert rv["elapsed"] >= 0.05
+
+    rv = HUB.broadcast(["A", "X"], "deviceBlink", (10, ))
+    HUB._microbots["A"].deviceBlink.assert_called_once_with(10)
+    assert isinstance(rv["results"]["X"]["error"], KeyError)
+
+    HUB._microbots["B"].press.side_effect = lambda hold: time.sleep(1)
+    rv = HUB.broadcast(["B"], "press", (1, ), timeout=0.1)
+    assert isinstance(rv["results"]["B"]["error"], excpt.Timeout)
+
+
+class _LegacyKeyDb(Interfaces.iPairingKeyStorage):
+    """Key storage implementing only the mandatory methods."""
+
+    def __init__(self):
+        self._keys = {}
+
+    def hasKey(self, uid):
+        return uid in self._keys
+
+    def get(self, uid):
+        return self._keys[uid]
+
+    def set(self, uid, key):
+        self._keys[uid] = key
+
+    def delete(self, uid):
+        self._keys.pop(uid, None)
+
+
+@mock.patch("PyPush.lib.ble.getLib")
+@mock.patch("threading.Timer")
+def test_scan_whitelist(timerMock, bleGetLib):
+    ble = bleGetLib.return_value
+    db = _LegacyKeyDb()
+    db.set("AA", "KEY")
+    assert db.getAllUids() is None
+
+    HUB = Mod.PushHub({"scan_whitelist": True}, db)
+    HUB.start()
+    ble.setScanWhitelist.assert_called_once_with(None)
+
+    db = mock.create_autospec(Interfaces.iPairingKeyStorage)
+    db.getAllUids.return_value = ["AA", "BB"]
+    HUB = Mod.PushHub({"scan_whitelist": True}, db)
+    ble.reset_mock()
+    HUB.start()
+    ble.setScanWhitelist.assert_called_once_with(("AA", "BB"))
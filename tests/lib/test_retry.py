@@ -0,0 +1,80 @@
+import time
+
+import mock
+import pytest
+
+import PyPush.lib.retry as Mod
+
+
+class _Flaky(Exception):
+    pass
+
+
+def _failing(counter):
+    def _fn():
+        counter.append(1)
+        raise _Flaky()
+    return _fn
+
+
+@mock.patch("time.sleep")
+def test_backoff(sleep):
+    policy = Mod.RetryPolicy(baseDelay=1, maxDelay=5)
+    calls = []
+    with pytest.raises(_Flaky):
+        policy.call(_failing(calls), lambda err: True, attempts=6)
+    assert len(calls) == 6
+
+    delays = [args[0] for (args, _) in sleep.call_args_list]
+    for (delay, limit) in zip(delays, [1, 2, 4, 5, 5]):
+        assert limit / 2.0 <= delay <= limit, "Exponential backoff with jitter capped at maxDelay"
+
+
+@mock.patch("time.sleep")
+def test_no_retry_on_unexpected_error(sleep):
+    calls = []
+    with pytest.raises(_Flaky):
+        Mod.RetryPolicy().call(_failing(calls), lambda err: False, attempts=5)
+    assert len(calls) == 1
+    assert not sleep.called
+
+
+@mock.patch("time.sleep")
+def test_budget(sleep):
+    policy = Mod.RetryPolicy(budgetCapacity=3, budgetRate=0)
+    budget = policy.getBudget("MB")
+    assert policy.getBudget("MB") is budget, "Budget is shared by the key"
+
+    calls = []
+    with pytest.raises(_Flaky):
+        policy.call(_failing(calls), lambda err: True, attempts=10, budgets=(budget, ))
+    assert len(calls) == 4
+    assert budget.getTokens() == 0
+
+    # Exhausted budget of any key stops retries
+    calls = []
+    with pytest.raises(_Flaky):
+        policy.call(_failing(calls), lambda err: True, attempts=10,
+                    budgets=(policy.newBudget(), budget))
+    assert len(calls) == 1
+
+
+def test_token_bucket_refill():
+    bucket = Mod.TokenBucket(capacity=1, rate=100)
+    assert bucket.take()
+    time.sleep(0.05)
+    assert bucket.take(), "Budget regains tokens over time"
+
+
+def test_deadline():
+    policy = Mod.RetryPolicy(baseDelay=0.05, maxDelay=0.05)
+    calls = []
+    start = time.time()
+    with Mod.deadline(0.3):
+        with Mod.deadline(10):
+            assert Mod.timeLeft() <= 0.3, "Nested deadline can not extend the outer one"
+        with pytest.raises(_Flaky):
+            policy.call(_failing(calls), lambda err: True, attempts=1000)
+    assert time.time() - start < 0.35
+    assert 1 < len(calls) < 1000
+    assert Mod.getDeadline() is None
@@ -0,0 +1,20 @@
+import PyPush.lib.stats as Mod
+
+
+def test_summary():
+    stats = Mod.LatencyStats(window=4)
+    assert stats.getSummary()["count"] == 0
+    for value in (1, 2, 3, 4, 5):
+        stats.add(value)
+    summary = stats.getSummary()
+    assert summary["count"] == 5
+    assert summary["mean"] == 3
+    assert summary["max"] == 5
+    assert summary["p50"] == 4, "Percentiles use the last `window` samples"
+
+
+def test_histogram():
+    stats = Mod.LatencyStats()
+    for value in (0.05, 0.1, 0.3, 7, 100):
+        stats.add(value)
+    assert stats.getHistogram((0.1, 1, 10)) == [(0.1, 2), (1, 1), (10, 1), (None, 1)]
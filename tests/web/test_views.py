@@ -0,0 +1,26 @@
+import pytest
+from werkzeug.exceptions import HTTPException
+
+import PyPush.web.views as Mod
+
+
+def test_press_args():
+    (low, high) = Mod.PRESS_HOLD_RANGE
+    assert Mod.getPressArgs((), {}) == ()
+    assert Mod.getPressArgs(("2.5", ), {}) == (2.5, )
+    assert Mod.getPressArgs((), {"holdSeconds": "1"}) == (1.0, )
+    assert Mod.getPressArgs(("1e9", ), {}) == (high, )
+    assert Mod.getPressArgs(("-1", ), {}) == (low, )
+    assert Mod.getPressArgs(("inf", ), {}) == (high, )
+
+    for (args, kwargs) in (
+        (("abc", ), {}),
+        (("nan", ), {}),
+        ((None, ), {}),
+        (("1", "2"), {}),
+        (("1", ), {"holdSeconds": "2"}),
+        ((), {"speed": "2"}),
+    ):
+        with pytest.raises(HTTPException) as err:
+            Mod.getPressArgs(args, kwargs)
+        assert err.value.code == 400, (args, kwargs)